@@ -0,0 +1,108 @@
+"""Acceso de cada paciente al servidor Flet: contraseña y tokens de sesión.
+
+La contraseña se guarda derivada con PBKDF2-SHA256 y una sal propia en
+``pacientes/<carpeta>/acceso.json``, nunca en claro. La primera vez que se
+entra con un nombre, la contraseña que se da queda registrada; después hace
+falta la misma para abrir esos datos.
+
+Al entrar se entrega un token aleatorio que el navegador guarda para retomar
+la sesión sin volver a pedir la contraseña. En el archivo queda solo su
+SHA-256 (los últimos ``MAX_TOKENS``), y cerrar sesión lo revoca.
+"""
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+
+from storage import escribir_json_atomico
+
+ACCESO_FILE = "acceso.json"
+ITERACIONES = 200_000
+MIN_CLAVE = 8
+# Sesiones abiertas a la vez por paciente (navegadores); la más vieja se descarta
+MAX_TOKENS = 10
+
+
+class AccesoDenegado(Exception):
+    """Contraseña o token inválidos"""
+
+
+def derivar(clave, sal, iteraciones):
+    return hashlib.pbkdf2_hmac("sha256", clave.encode("utf-8"), sal, iteraciones)
+
+
+def _resumen(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class Accesos:
+    """Contraseñas y tokens de los pacientes de `directorio`, una carpeta por paciente"""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        # Solo para leer-modificar-escribir el archivo; PBKDF2 corre fuera
+        self._lock = threading.Lock()
+
+    def _ruta(self, carpeta):
+        return os.path.join(self.directorio, carpeta, ACCESO_FILE)
+
+    def _leer(self, carpeta):
+        try:
+            with open(self._ruta(carpeta), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _escribir(self, carpeta, datos):
+        os.makedirs(os.path.join(self.directorio, carpeta), exist_ok=True)
+        escribir_json_atomico(self._ruta(carpeta), datos)
+
+    def entrar(self, carpeta, clave):
+        """Verifica la contraseña (o la registra si el paciente es nuevo); devuelve un token nuevo"""
+        datos = self._leer(carpeta)
+        registro = None
+        if datos is None:
+            if len(clave) < MIN_CLAVE:
+                raise AccesoDenegado(f"La contraseña debe tener al menos {MIN_CLAVE} caracteres")
+            sal = secrets.token_bytes(16)
+            registro = {"sal": sal.hex(), "iteraciones": ITERACIONES,
+                        "clave": derivar(clave, sal, ITERACIONES).hex(), "tokens": []}
+        else:
+            obtenida = derivar(clave, bytes.fromhex(datos["sal"]), datos["iteraciones"])
+            if not hmac.compare_digest(obtenida, bytes.fromhex(datos["clave"])):
+                raise AccesoDenegado("Nombre o contraseña incorrectos")
+
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            actuales = self._leer(carpeta)
+            if registro is not None:
+                if actuales is not None:
+                    # Otra sesión registró el mismo nombre mientras se derivaba la clave
+                    raise AccesoDenegado("Ese nombre ya está registrado")
+                actuales = registro
+            elif actuales is None or actuales["clave"] != datos["clave"]:
+                raise AccesoDenegado("Nombre o contraseña incorrectos")
+            actuales["tokens"] = (actuales["tokens"] + [_resumen(token)])[-MAX_TOKENS:]
+            self._escribir(carpeta, actuales)
+        return token
+
+    def token_valido(self, carpeta, token):
+        if not token:
+            return False
+        datos = self._leer(carpeta)
+        if datos is None:
+            return False
+        resumen = _resumen(token)
+        return any(hmac.compare_digest(resumen, guardado) for guardado in datos["tokens"])
+
+    def revocar(self, carpeta, token):
+        """Invalida el token (cierre de sesión)"""
+        with self._lock:
+            datos = self._leer(carpeta)
+            if datos is None or not token:
+                return
+            resumen = _resumen(token)
+            datos["tokens"] = [guardado for guardado in datos["tokens"] if guardado != resumen]
+            self._escribir(carpeta, datos)
@@ -0,0 +1,156 @@
+"""Avisos registrados en el sistema de alarmas del sistema operativo.
+
+En Android las próximas ``MAX_ALARMAS`` tomas y avisos de stock se registran
+con ``AlarmManager``: cuando vence una, ``ReceptorAvisos`` (Java) arranca el
+servicio ``service_avisos.py``, que muestra la notificación y vuelve a armar
+las siguientes. Entre una toma y otra no corre nada, aunque Android haya
+cerrado la app; al reiniciar el teléfono el mismo receptor las rearma.
+
+En escritorio no hay alarmas del sistema: ``AlarmasLocales`` no hace nada y
+los avisos los da el planificador en proceso mientras la app está abierta.
+"""
+import heapq
+import json
+import os
+from datetime import datetime, timedelta
+
+from horario import PlanTomas
+from storage import escribir_json_atomico
+
+ALARMAS_FILE = "alarmas.json"
+MAX_ALARMAS = 8
+
+ACCION_AVISO = "com.juanita.medicamentos.AVISO"
+CLASE_RECEPTOR = "com.juanita.medicamentos.medicamentostracker.ReceptorAvisos"
+
+
+def calcular_avisos(medicamentos, ahora=None, maximo=MAX_ALARMAS):
+    """Los `maximo` avisos más próximos: tomas y stock bajo de todos los medicamentos
+
+    Cada aviso es un dict con clave, instante (timestamp), título y texto.
+    """
+    ahora = ahora or datetime.now()
+    candidatos = []
+    for med in medicamentos:
+        plan = PlanTomas.desde_medicamento(med)
+        if plan is not None:
+            for toma in plan.tomas(ahora, maximo):
+                candidatos.append({
+                    "clave": f"dosis:{med['id']}:{toma.strftime('%Y%m%d%H%M')}",
+                    "instante": toma.timestamp(),
+                    "titulo": "💊 ¡Hora de tu medicamento!",
+                    "texto": f"{med['nombre']} - Dosis: {med['dosis']}",
+                })
+        if med.get("fecha_fin") and not med.get("notificaciones_activas", False):
+            try:
+                fecha_fin = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
+            except ValueError:
+                continue
+            # Mismo momento que el aviso de stock del planificador: quedan 3 días.
+            # Si ya pasó, lo da la app al abrirse (y marca notificaciones_activas)
+            instante = fecha_fin - timedelta(days=4) + timedelta(seconds=1)
+            if instante < ahora:
+                continue
+            candidatos.append({
+                "clave": f"stock:{med['id']}",
+                "instante": instante.timestamp(),
+                "titulo": "⚠️ Medicamento por agotarse",
+                "texto": f"Tu medicamento '{med['nombre']}' se acabará pronto",
+            })
+    return heapq.nsmallest(maximo, candidatos, key=lambda aviso: aviso["instante"])
+
+
+class AlarmasLocales:
+    """Sin alarmas del sistema (escritorio): los avisos quedan en el planificador"""
+
+    nativo = False
+
+    def sincronizar(self, avisos):
+        pass
+
+
+class AlarmasAndroid:
+    """Registra los avisos con AlarmManager y los guarda para rearmarlos"""
+
+    nativo = True
+
+    def __init__(self, ruta=ALARMAS_FILE):
+        from jnius import autoclass
+
+        self.ruta = ruta
+        self._Intent = autoclass("android.content.Intent")
+        self._PendingIntent = autoclass("android.app.PendingIntent")
+        self._AlarmManager = autoclass("android.app.AlarmManager")
+        self._Build = autoclass("android.os.Build$VERSION")
+        self._Context = autoclass("android.content.Context")
+        self._contexto = self._obtener_contexto(autoclass)
+        self._receptor = autoclass(CLASE_RECEPTOR)
+        self._alarmas = self._contexto.getSystemService(self._Context.ALARM_SERVICE)
+
+    @staticmethod
+    def _obtener_contexto(autoclass):
+        # En la app es la actividad; en el servicio, el propio servicio
+        actividad = autoclass("org.kivy.android.PythonActivity").mActivity
+        if actividad is not None:
+            return actividad
+        return autoclass("org.kivy.android.PythonService").mService
+
+    def _pending_intent(self, codigo, aviso=None):
+        intent = self._Intent(self._contexto, self._receptor)
+        intent.setAction(ACCION_AVISO)
+        if aviso is not None:
+            intent.putExtra("aviso", json.dumps(aviso, ensure_ascii=False))
+        flags = self._PendingIntent.FLAG_UPDATE_CURRENT
+        if self._Build.SDK_INT >= 23:
+            flags |= self._PendingIntent.FLAG_IMMUTABLE
+        return self._PendingIntent.getBroadcast(self._contexto, codigo, intent, flags)
+
+    def _exactas_permitidas(self):
+        return self._Build.SDK_INT < 31 or self._alarmas.canScheduleExactAlarms()
+
+    def sincronizar(self, avisos):
+        """Reemplaza las alarmas registradas por `avisos`"""
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                anteriores = json.load(f).get("cantidad", MAX_ALARMAS)
+        except (OSError, ValueError):
+            anteriores = MAX_ALARMAS
+        for codigo in range(len(avisos), max(anteriores, len(avisos))):
+            self._alarmas.cancel(self._pending_intent(codigo))
+
+        exactas = self._exactas_permitidas()
+        for codigo, aviso in enumerate(avisos):
+            ms = int(aviso["instante"] * 1000)
+            pendiente = self._pending_intent(codigo, aviso)
+            if self._Build.SDK_INT >= 23:
+                # Suena aun con el teléfono en reposo (Doze)
+                if exactas:
+                    self._alarmas.setExactAndAllowWhileIdle(self._AlarmManager.RTC_WAKEUP, ms, pendiente)
+                else:
+                    self._alarmas.setAndAllowWhileIdle(self._AlarmManager.RTC_WAKEUP, ms, pendiente)
+            else:
+                self._alarmas.setExact(self._AlarmManager.RTC_WAKEUP, ms, pendiente)
+
+        escribir_json_atomico(self.ruta, {"cantidad": len(avisos), "avisos": avisos}, indent=2)
+
+
+def pedir_permisos():
+    """Pide en Android 13+ el permiso para mostrar notificaciones"""
+    if "ANDROID_ARGUMENT" not in os.environ:
+        return
+    try:
+        from android.permissions import Permission, request_permissions
+        request_permissions([Permission.POST_NOTIFICATIONS])
+    except Exception as e:
+        print(f"No se pudo pedir el permiso de notificaciones: {e}")
+
+
+def crear_alarmas():
+    """Alarmas del sistema en Android; en otras plataformas, ninguna"""
+    # python-for-android define ANDROID_ARGUMENT tanto en la app como en sus servicios
+    if "ANDROID_ARGUMENT" in os.environ:
+        try:
+            return AlarmasAndroid()
+        except Exception as e:
+            print(f"No se pudieron usar las alarmas de Android: {e}")
+    return AlarmasLocales()
@@ -0,0 +1,27 @@
+package com.juanita.medicamentos.medicamentostracker;
+
+import android.content.BroadcastReceiver;
+import android.content.Context;
+import android.content.Intent;
+
+/**
+ * Arranca el servicio de avisos (service_avisos.py) cuando vence una alarma
+ * registrada por alarmas.py o cuando el teléfono termina de reiniciarse.
+ */
+public class ReceptorAvisos extends BroadcastReceiver {
+
+    static final String ACCION_AVISO = "com.juanita.medicamentos.AVISO";
+
+    @Override
+    public void onReceive(Context context, Intent intent) {
+        String argumento = "rearmar";
+        if (ACCION_AVISO.equals(intent.getAction())) {
+            String aviso = intent.getStringExtra("aviso");
+            if (aviso != null) {
+                argumento = aviso;
+            }
+        }
+        // Clase generada por python-for-android para "services = Avisos:..."
+        ServiceAvisos.start(context, argumento);
+    }
+}
@@ -0,0 +1,209 @@
+"""Archivo completo del historial de notificaciones, comprimido e indexado.
+
+El historial de la pantalla guarda solo las últimas notificaciones; este
+archivo las conserva todas en ``historial_archivo.db`` (SQLite, aparte de los
+datos de la app, así funciona con cualquier backend de ``storage``).
+
+Cada notificación se guarda como JSON comprimido con deflate y un diccionario
+con las claves y frases que se repiten (una entrada típica pasa de ~160 a ~40
+bytes; zlib sin diccionario apenas gana en textos tan cortos). Junto a ella, las
+columnas por las que se filtra: ``medicamento``, ``tipo``, ``fecha`` y su mes
+(``"2026-08"``), con índices sobre cada una. Una búsqueda como "stock_bajo de
+Quetiapina en agosto" recorre solo las entradas del índice que coinciden y
+descomprime una página de resultados. Si SQLite trae FTS5, el texto del
+mensaje también se indexa (sin guardar otra copia) para buscar por palabras.
+"""
+import json
+import sqlite3
+import threading
+import zlib
+
+ARCHIVO_FILE = "historial_archivo.db"
+
+# No cambiarlo: las entradas ya guardadas solo se descomprimen con el mismo
+DICCIONARIO = json.dumps({
+    "fecha": "2026-01-01 00:00:00", "tipo": "stock_bajo", "medicamento": "",
+    "mensaje": "Recordatorio de dosis para Tu medicamento '' se acabará en días se ha agotado "
+               "medicamentos Se acabarán pronto: dosis agotado",
+    "leida": False,
+}, ensure_ascii=False).encode("utf-8")
+
+
+class ArchivoHistorial:
+    """Todas las notificaciones, con búsqueda por medicamento, tipo, mes y texto"""
+
+    def __init__(self, ruta=ARCHIVO_FILE):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._crear_tablas()
+        self.texto_indexado = self._crear_indice_texto()
+
+    def _crear_tablas(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS notificaciones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fecha TEXT NOT NULL,
+                    mes TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    medicamento TEXT COLLATE NOCASE,
+                    datos BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_archivo_medicamento ON notificaciones(medicamento, mes);
+                CREATE INDEX IF NOT EXISTS idx_archivo_tipo ON notificaciones(tipo, mes);
+                CREATE INDEX IF NOT EXISTS idx_archivo_mes ON notificaciones(mes);
+                CREATE TABLE IF NOT EXISTS meta (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+            """)
+
+    def _crear_indice_texto(self):
+        try:
+            with self._lock, self._conn:
+                # Sin contenido propio: solo el índice de palabras, el texto está en `datos`
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS notificaciones_texto "
+                    "USING fts5(mensaje, content='', tokenize='unicode61 remove_diacritics 2')"
+                )
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    # ---------------- escritura ----------------
+    def _insertar(self, notificacion):
+        fecha = notificacion.get("fecha") or ""
+        datos = _comprimir(notificacion)
+        cursor = self._conn.execute(
+            "INSERT INTO notificaciones (fecha, mes, tipo, medicamento, datos) VALUES (?, ?, ?, ?, ?)",
+            (fecha, fecha[:7], notificacion.get("tipo") or "", notificacion.get("medicamento"), datos),
+        )
+        if self.texto_indexado:
+            self._conn.execute(
+                "INSERT INTO notificaciones_texto (rowid, mensaje) VALUES (?, ?)",
+                (cursor.lastrowid, notificacion.get("mensaje") or ""),
+            )
+
+    def agregar(self, notificacion):
+        self.agregar_varias([notificacion])
+
+    def agregar_varias(self, notificaciones):
+        """Guarda varias notificaciones en una sola transacción"""
+        with self._lock, self._conn:
+            for notificacion in notificaciones:
+                self._insertar(notificacion)
+
+    def importar(self, recientes_primero):
+        """Carga una única vez el historial existente (la lista viene con los más recientes primero)"""
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM meta WHERE clave = 'importado'").fetchone():
+                return False
+            for notificacion in reversed(list(recientes_primero)):
+                self._insertar(notificacion)
+            self._conn.execute("INSERT INTO meta (clave, valor) VALUES ('importado', '1')")
+        return True
+
+    # ---------------- consultas ----------------
+    def _filtros(self, medicamento=None, tipo=None, mes=None, desde=None, hasta=None, texto=None):
+        condiciones, parametros = [], []
+        if medicamento:
+            condiciones.append("medicamento = ?")
+            parametros.append(medicamento)
+        if tipo:
+            condiciones.append("tipo = ?")
+            parametros.append(tipo)
+        if mes:
+            condiciones.append("mes = ?")
+            parametros.append(mes)
+        if desde:
+            condiciones.append("fecha >= ?")
+            parametros.append(desde)
+        if hasta:
+            condiciones.append("fecha < ?")
+            parametros.append(hasta)
+        if texto and self.texto_indexado:
+            condiciones.append("id IN (SELECT rowid FROM notificaciones_texto WHERE notificaciones_texto MATCH ?)")
+            parametros.append(_consulta_fts(texto))
+        donde = " WHERE " + " AND ".join(condiciones) if condiciones else ""
+        return donde, parametros
+
+    def buscar(self, pagina=0, tamano=20, **filtros):
+        """Página `pagina` de las notificaciones que cumplen los filtros, más recientes primero
+
+        Filtros: medicamento, tipo, mes ("YYYY-MM"), desde/hasta (fecha "YYYY-MM-DD...")
+        y texto (palabras del mensaje).
+        """
+        texto = filtros.get("texto")
+        if texto and not self.texto_indexado:
+            return self._buscar_sin_fts(pagina, tamano, texto, filtros)
+        donde, parametros = self._filtros(**filtros)
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT datos FROM notificaciones{donde} ORDER BY id DESC LIMIT ? OFFSET ?",
+                parametros + [tamano, pagina * tamano],
+            ).fetchall()
+        return [_descomprimir(datos) for (datos,) in filas]
+
+    def _buscar_sin_fts(self, pagina, tamano, texto, filtros):
+        # Sin FTS5 el texto se filtra descomprimiendo lo que dejan pasar los índices
+        filtros = dict(filtros, texto=None)
+        donde, parametros = self._filtros(**filtros)
+        texto = texto.lower()
+        resultados, saltar = [], pagina * tamano
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT datos FROM notificaciones{donde} ORDER BY id DESC", parametros)
+            for (datos,) in cursor:
+                notificacion = _descomprimir(datos)
+                if texto not in (notificacion.get("mensaje") or "").lower():
+                    continue
+                if saltar:
+                    saltar -= 1
+                    continue
+                resultados.append(notificacion)
+                if len(resultados) == tamano:
+                    break
+        return resultados
+
+    def contar(self, **filtros):
+        """Cantidad de coincidencias (sin FTS5 no cuenta el filtro de texto)"""
+        donde, parametros = self._filtros(**filtros)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM notificaciones{donde}", parametros).fetchone()[0]
+
+    def facetas(self, **filtros):
+        """Cantidad de notificaciones por medicamento, tipo y mes (con los demás filtros aplicados)"""
+        resultado = {}
+        for columna in ("medicamento", "tipo", "mes"):
+            # Cada faceta ignora su propio filtro para mostrar las alternativas
+            otros = {k: v for k, v in filtros.items() if k != columna and k != "texto"}
+            donde, parametros = self._filtros(**otros)
+            with self._lock:
+                filas = self._conn.execute(
+                    f"SELECT {columna}, COUNT(*) FROM notificaciones{donde} GROUP BY {columna} ORDER BY {columna}",
+                    parametros,
+                ).fetchall()
+            resultado[columna] = {valor: cantidad for valor, cantidad in filas if valor}
+        return resultado
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _comprimir(notificacion):
+    compresor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=DICCIONARIO)
+    return compresor.compress(json.dumps(notificacion, ensure_ascii=False).encode("utf-8")) + compresor.flush()
+
+
+def _descomprimir(datos):
+    descompresor = zlib.decompressobj(-15, zdict=DICCIONARIO)
+    return json.loads((descompresor.decompress(datos) + descompresor.flush()).decode("utf-8"))
+
+
+def _consulta_fts(texto):
+    # Cada palabra como prefijo entre comillas: sin sintaxis de FTS5 del usuario
+    palabras = [p.replace('"', '') for p in texto.split()]
+    return " ".join(f'"{p}"*' for p in palabras if p)
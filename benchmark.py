@@ -0,0 +1,291 @@
+"""Mediciones de rendimiento de horario, inventario, persistencia y gráficas.
+
+Genera listas sintéticas de medicamentos (de 10 a 100 000) con frecuencias,
+horas e inicios parecidos a los de la app y mide cada operación sobre
+``nucleo.Tracker``, sin interfaz: no importa Kivy ni Flet y trabaja en un
+directorio temporal, así que no toca los datos de la app. Los resultados se
+escriben en JSON para compararlos entre commits:
+
+    python benchmark.py --salida bench_antes.json
+    python benchmark.py --salida bench_despues.json --comparar bench_antes.json
+
+Con ``--comparar`` informa las operaciones que se volvieron más lentas que el
+umbral y termina con código 1 si hay alguna.
+
+De las gráficas se mide la preparación de datos (``grafica_*``), común a los
+dos backends, y el render de matplotlib si está instalado. El dibujo en el
+canvas de Kivy (``graficas_kivy``: instrucciones y texturas de texto) no se
+mide: necesita una ventana de Kivy.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TAMANOS = (10, 100, 1000, 10000, 100000)
+REPETICIONES = 3
+# Operaciones sueltas (guardar una fila, una toma, una notificación) por medición
+LOTE = 100
+# Más barras no se leen en la gráfica; matplotlib no se mide por encima
+LIMITE_RENDER = 100
+# Diferencias menores a esto son ruido aunque el cociente sea grande
+RUIDO_MS = 1.0
+
+# Distribuciones aproximadas de los datos reales
+FRECUENCIAS = {1: 60, 2: 8, 3: 5, 7: 15, 14: 4, 30: 8}
+HORAS_COMUNES = ["07:00", "08:00", "09:00", "12:00", "14:00", "20:00", "21:00", "22:00"]
+PRESENTACIONES = ["Tabletas", "Cápsulas", "Jarabe", "Gotas", "Ampolletas", "Crema", "Gel", "Spray"]
+
+
+def generar_medicamentos(n, semilla=0, ahora=None):
+    """`n` medicamentos sintéticos, siempre iguales para la misma semilla y fecha"""
+    rng = random.Random(semilla)
+    ahora = (ahora or datetime.now()).replace(second=0, microsecond=0)
+    frecuencias, pesos = zip(*FRECUENCIAS.items())
+    medicamentos = []
+    for i in range(n):
+        cantidad = float(rng.choice((10, 14, 20, 28, 30, 60, 90, 120)))
+        med = {
+            "id": f"bench{i:06d}",
+            "nombre": f"Medicamento {i}",
+            "descripcion": "Sintético",
+            "presentacion": rng.choice(PRESENTACIONES),
+            "cantidad_total": cantidad,
+            "cantidad_actual": max(0.0, cantidad - rng.randrange(0, int(cantidad))),
+            "dosis": rng.choice((0.5, 1.0, 1.0, 1.0, 2.0)),
+            "frecuencia_dias": rng.choices(frecuencias, pesos)[0],
+            "horas": [],
+            "intervalo_horas": None,
+            "inicio": None,
+            "fecha_fin": None,
+            "ultima_alerta": None,
+            "notificaciones_activas": False,
+        }
+        tipo = rng.random()
+        if tipo < 0.8:
+            # La mayoría empezó en el último año, a una hora redonda
+            hora = rng.choice(HORAS_COMUNES)
+            dia = ahora - timedelta(days=rng.randrange(0, 365))
+            med["inicio"] = f"{dia:%Y-%m-%d} {hora}"
+            if tipo < 0.25:
+                med["horas"] = sorted(rng.sample(HORAS_COMUNES, rng.choice((2, 3))))
+            elif tipo < 0.35:
+                med["intervalo_horas"] = rng.choice((6, 8, 12))
+        medicamentos.append(med)
+    return medicamentos
+
+
+def medir(funcion, repeticiones=REPETICIONES):
+    """Segundos de cada repetición de `funcion()`"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+class Benchmark:
+    """Corre todas las operaciones para un tamaño dentro del directorio actual"""
+
+    def __init__(self, n, repeticiones=REPETICIONES, semilla=0):
+        self.n = n
+        self.repeticiones = repeticiones
+        self.semilla = semilla
+        self.ahora = datetime.now()
+        self.medicamentos = generar_medicamentos(n, semilla, self.ahora)
+        self.resultados = []
+
+    def registrar(self, operacion, tiempos, elementos=None):
+        elementos = elementos or self.n
+        mediana = statistics.median(tiempos)
+        self.resultados.append({
+            "operacion": operacion,
+            "n": self.n,
+            "elementos": elementos,
+            "repeticiones": len(tiempos),
+            "mediana_ms": round(mediana * 1000, 4),
+            "minimo_ms": round(min(tiempos) * 1000, 4),
+            "por_elemento_us": round(mediana * 1e6 / elementos, 4),
+        })
+
+    def correr(self, operacion, funcion, elementos=None, repeticiones=None):
+        self.registrar(operacion, medir(funcion, repeticiones or self.repeticiones), elementos)
+
+    def ejecutar(self):
+        from nucleo import Tracker
+        from storage import JSONStorage, SQLiteStorage
+
+        for nombre, crear in (("json", JSONStorage), ("sqlite", SQLiteStorage)):
+            storage = crear()
+            self.correr(f"save_meds[{nombre}]", lambda: storage.save_meds(self.medicamentos))
+            self.correr(f"load_meds[{nombre}]", storage.load_meds)
+            storage.close()
+
+        tracker = Tracker(storage=SQLiteStorage())
+        # La primera carga proyecta el inventario de todos (datos sin cobertura)
+        self.correr("cargar_inicial", tracker.cargar, repeticiones=1)
+        self.correr("cargar", tracker.cargar)
+        self._horario(tracker)
+        self._escrituras(tracker)
+        self._graficas(tracker)
+        tracker.cerrar()
+        return self.resultados
+
+    def _horario(self, tracker):
+        from nucleo import calcular_dias_restantes, es_dia_de_toma
+
+        meds = tracker.medicamentos
+        semana = [self.ahora + timedelta(days=d) for d in range(7)]
+
+        def dias_de_toma():
+            for dia in semana:
+                for med in meds:
+                    es_dia_de_toma(med, dia)
+
+        def debidos():
+            for dia in semana:
+                tracker.horario.debidos(dia)
+
+        self.correr("es_dia_de_toma x7", dias_de_toma, elementos=7 * self.n)
+        self.correr("horario.debidos x7", debidos, elementos=7 * self.n)
+        self.correr("calcular_dias_restantes",
+                    lambda: [calcular_dias_restantes(med, self.ahora) for med in meds])
+        self.correr("columnas.calcular", lambda: tracker.columnas.calcular(self.ahora))
+
+    def _escrituras(self, tracker):
+        from journal import TOMA
+
+        rng = random.Random(self.semilla)
+        indices = [rng.randrange(self.n) for _ in range(LOTE)]
+
+        def guardar_filas():
+            for i in indices:
+                tracker.save_med(i)
+            tracker.flush()
+
+        def tomas():
+            for i in indices:
+                tracker.registrar_evento(i, TOMA, tracker.medicamentos[i]["dosis"])
+            tracker.flush()
+
+        def notificaciones():
+            for i in indices:
+                tracker.agregar_notificacion("dosis", tracker.medicamentos[i]["nombre"], "Recordatorio de dosis")
+            tracker.flush()
+
+        self.correr(f"save_med x{LOTE}", guardar_filas, elementos=LOTE)
+        self.correr(f"registrar_toma x{LOTE}", tomas, elementos=LOTE)
+        self.correr(f"agregar_al_historial x{LOTE}", notificaciones, elementos=LOTE)
+
+    def _graficas(self, tracker):
+        from graficas import grafica_barras, grafica_lineas, grafica_pastel, matplotlib_disponible, render_barras
+
+        meds, columnas = tracker.medicamentos, tracker.columnas
+        self.correr("grafica_barras", lambda: grafica_barras(meds, columnas))
+        self.correr("grafica_pastel", lambda: grafica_pastel(meds, columnas))
+        self.correr("grafica_lineas", lambda: grafica_lineas(meds))
+        if self.n <= LIMITE_RENDER and matplotlib_disponible():
+            _, datos = grafica_barras(meds, columnas)
+            self.correr("render_barras", lambda: render_barras(**datos))
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar(tamanos=TAMANOS, repeticiones=REPETICIONES, semilla=0):
+    """Corre el benchmark para cada tamaño; devuelve el informe (dict serializable)"""
+    from columnas import cargar_numpy
+
+    informe = {
+        "commit": _commit(),
+        "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "numpy": cargar_numpy() is not None,
+        "repeticiones": repeticiones,
+        "resultados": [],
+    }
+    directorio = os.getcwd()
+    for n in tamanos:
+        # Cada tamaño en un directorio vacío: los módulos usan rutas relativas
+        with tempfile.TemporaryDirectory(prefix="tracker_bench_") as temporal:
+            os.chdir(temporal)
+            try:
+                informe["resultados"].extend(Benchmark(n, repeticiones, semilla).ejecutar())
+            finally:
+                os.chdir(directorio)
+    return informe
+
+
+def comparar(actual, anterior, umbral=1.25):
+    """Operaciones que tardan más de `umbral` veces lo que tardaban en `anterior`
+
+    Se comparan los mínimos, que varían menos que la mediana entre corridas.
+    """
+    previos = {(r["operacion"], r["n"]): r for r in anterior["resultados"]}
+    regresiones = []
+    for resultado in actual["resultados"]:
+        previo = previos.get((resultado["operacion"], resultado["n"]))
+        if not previo or previo["minimo_ms"] <= 0:
+            continue
+        cociente = resultado["minimo_ms"] / previo["minimo_ms"]
+        if cociente > umbral and resultado["minimo_ms"] - previo["minimo_ms"] > RUIDO_MS:
+            regresiones.append(dict(resultado, anterior_ms=previo["minimo_ms"], cociente=round(cociente, 2)))
+    return regresiones
+
+
+def imprimir(informe, salida=sys.stdout):
+    for r in informe["resultados"]:
+        print(f"{r['operacion']:<28} n={r['n']:<7} {r['mediana_ms']:>12.3f} ms "
+              f"{r['por_elemento_us']:>10.3f} µs/elem", file=salida)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=list(TAMANOS))
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="archivo JSON para los resultados")
+    parser.add_argument("--comparar", help="resultados anteriores (JSON) contra los que comparar")
+    parser.add_argument("--umbral", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    # Leer antes de correr: la ruta es relativa al directorio de trabajo
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    informe = ejecutar(args.tamanos, args.repeticiones, args.semilla)
+    imprimir(informe)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+
+    if anterior is not None:
+        regresiones = comparar(informe, anterior, args.umbral)
+        for r in regresiones:
+            print(f"REGRESIÓN {r['operacion']} n={r['n']}: {r['anterior_ms']:.3f} -> "
+                  f"{r['minimo_ms']:.3f} ms (x{r['cociente']})")
+        if regresiones:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,7 +20,7 @@ version = 1.0
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy,plyer
+requirements = python3,kivy,plyer,sqlite3
 
 # (str) Supported orientation (landscape, sensorLandscape, portrait, sensorPortrait or all)
 orientation = portrait
@@ -41,7 +41,16 @@ android.ndk = 25b
 android.sdk = 33
 
 # (list) Permissions
-android.permissions = INTERNET,WRITE_EXTERNAL_STORAGE,READ_EXTERNAL_STORAGE,VIBRATE
+android.permissions = INTERNET,WRITE_EXTERNAL_STORAGE,READ_EXTERNAL_STORAGE,VIBRATE,SCHEDULE_EXACT_ALARM,RECEIVE_BOOT_COMPLETED,POST_NOTIFICATIONS
+
+# (list) Services: avisos que vencen con la app cerrada (ver alarmas.py)
+services = Avisos:service_avisos.py
+
+# (list) Java sources: ReceptorAvisos, que arranca el servicio al vencer una alarma
+android.add_src = android/src
+
+# (str) python-for-android hook que declara ReceptorAvisos en el manifiesto
+p4a.hook = p4a_hook.py
 
 # (str) The Android arch to build for, choices: armeabi-v7a, arm64-v8a, x86, x86_64
 android.archs = arm64-v8a, armeabi-v7a
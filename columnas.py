@@ -0,0 +1,205 @@
+"""Vista columnar de la lista de medicamentos.
+
+Guarda en arreglos NumPy el día de inicio, la frecuencia, la dosis, la cantidad
+actual y la fecha de fin de cada medicamento, de modo que los días restantes,
+la urgencia y "toca hoy" se calculan para todas las filas en una sola pasada.
+El texto ("12 días", "¡AGOTADO!") se genera solo al presentar.
+
+Con pocas filas (o si NumPy no está disponible) se usa la misma lógica con
+listas de Python: así importar NumPy no retrasa el arranque de la app.
+"""
+from datetime import datetime
+
+from horario import FORMATO_FECHA, SIEMPRE, compilar, dia_epoch
+
+SEGUNDOS_DIA = 86400
+# A partir de cuántas filas conviene pagar la importación de NumPy
+UMBRAL_NUMPY = 200
+EPOCH = datetime(1970, 1, 1)
+
+# Urgencia de cada medicamento según sus días restantes
+AGOTADO = 0
+URGENTE = 1       # 3 días o menos
+ADVERTENCIA = 2   # 7 días o menos
+NORMAL = 3
+SIN_FECHA = 4
+ERROR = 5
+
+# Estado de la fecha de fin
+_FIN_OK = 0
+_FIN_SIN_FECHA = 1
+_FIN_ERROR = 2
+
+
+_numpy = None
+
+
+def cargar_numpy():
+    """Importa NumPy la primera vez que se necesita; None si no está instalado"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def segundos_epoch(fecha):
+    """Segundos desde 1970-01-01 de un datetime local (sin zona horaria)"""
+    return (fecha - EPOCH).total_seconds()
+
+
+def _compilar_fila(med):
+    inicio, periodo = compilar(med)
+    fin, estado_fin = 0.0, _FIN_OK
+    if not med.get("fecha_fin"):
+        estado_fin = _FIN_SIN_FECHA
+    else:
+        try:
+            fin = segundos_epoch(datetime.strptime(med["fecha_fin"], FORMATO_FECHA))
+        except Exception:
+            estado_fin = _FIN_ERROR
+    try:
+        dosis = float(med.get("dosis", 0))
+        cantidad = float(med.get("cantidad_actual", med.get("cantidad_total", 0)))
+    except Exception:
+        dosis, cantidad = 0.0, 0.0
+    return inicio, periodo, dosis, cantidad, fin, estado_fin
+
+
+def _urgencia(dias, estado_fin):
+    if estado_fin == _FIN_SIN_FECHA:
+        return SIN_FECHA
+    if estado_fin == _FIN_ERROR:
+        return ERROR
+    if dias < 0:
+        return AGOTADO
+    if dias <= 3:
+        return URGENTE
+    if dias <= 7:
+        return ADVERTENCIA
+    return NORMAL
+
+
+def formatear_dias(dias, urgencia, sin_fecha="Sin fecha"):
+    """Texto de días restantes para mostrar en pantalla"""
+    if urgencia == SIN_FECHA:
+        return sin_fecha
+    if urgencia == ERROR:
+        return "Error"
+    if urgencia == AGOTADO:
+        return "¡AGOTADO!"
+    return f"{int(dias)} días"
+
+
+class VistaColumnar:
+    """Columnas de inicio, frecuencia, dosis, cantidad y fin de cada medicamento"""
+
+    _CAMPOS = ("inicio", "periodo", "dosis", "cantidad", "fin", "estado_fin")
+
+    def __init__(self, medicamentos=()):
+        self.reconstruir(medicamentos)
+
+    def __len__(self):
+        return len(self.periodo)
+
+    def reconstruir(self, medicamentos):
+        filas = [_compilar_fila(med) for med in medicamentos]
+        self.np = np = cargar_numpy() if len(filas) >= UMBRAL_NUMPY else None
+        columnas = list(zip(*filas)) if filas else [()] * len(self._CAMPOS)
+        tipos = ("int64", "int64", "float64", "float64", "float64", "int8")
+        for campo, valores, tipo in zip(self._CAMPOS, columnas, tipos):
+            setattr(self, campo, np.array(valores, dtype=tipo) if np is not None else list(valores))
+
+    # ---------------- cambios por fila ----------------
+    def actualizar(self, indice, medicamento):
+        for campo, valor in zip(self._CAMPOS, _compilar_fila(medicamento)):
+            getattr(self, campo)[indice] = valor
+
+    def agregar(self, medicamento):
+        np = self.np
+        for campo, valor in zip(self._CAMPOS, _compilar_fila(medicamento)):
+            columna = getattr(self, campo)
+            if np is not None:
+                setattr(self, campo, np.append(columna, np.array([valor], dtype=columna.dtype)))
+            else:
+                columna.append(valor)
+
+    def eliminar(self, indice):
+        np = self.np
+        for campo in self._CAMPOS:
+            columna = getattr(self, campo)
+            if np is not None:
+                setattr(self, campo, np.delete(columna, indice))
+            else:
+                del columna[indice]
+
+    # ---------------- cálculos ----------------
+    def calcular(self, ahora=None):
+        """Devuelve (dias_restantes, urgencia) para todas las filas
+
+        `dias_restantes` equivale a `(fecha_fin - ahora).days`; solo tiene sentido
+        donde la urgencia no es SIN_FECHA ni ERROR.
+        """
+        np = self.np
+        ahora_s = segundos_epoch(ahora or datetime.now())
+        if np is None:
+            dias = [int((fin - ahora_s) // SEGUNDOS_DIA) for fin in self.fin]
+            return dias, [_urgencia(d, e) for d, e in zip(dias, self.estado_fin)]
+
+        dias = np.floor_divide(self.fin - ahora_s, SEGUNDOS_DIA).astype("int64")
+        urgencia = np.select(
+            [self.estado_fin == _FIN_SIN_FECHA, self.estado_fin == _FIN_ERROR,
+             dias < 0, dias <= 3, dias <= 7],
+            [SIN_FECHA, ERROR, AGOTADO, URGENTE, ADVERTENCIA],
+            default=NORMAL,
+        ).astype("int8")
+        return dias, urgencia
+
+    def fila(self, indice, ahora=None):
+        """(dias_restantes, urgencia) de un único medicamento"""
+        ahora_s = segundos_epoch(ahora or datetime.now())
+        dias = int((float(self.fin[indice]) - ahora_s) // SEGUNDOS_DIA)
+        return dias, _urgencia(dias, int(self.estado_fin[indice]))
+
+    def proximo_cambio(self, ahora=None):
+        """Segundos hasta que cambien los días restantes de algún medicamento (None si ninguno)
+
+        Los días bajan cada vez que se cumple un día justo hasta la fecha de
+        fin; los agotados y los que no tienen fecha ya no cambian.
+        """
+        np = self.np
+        ahora_s = segundos_epoch(ahora or datetime.now())
+        if np is None:
+            restos = [(fin - ahora_s) % SEGUNDOS_DIA
+                      for fin, estado in zip(self.fin, self.estado_fin) if estado == _FIN_OK and fin >= ahora_s]
+            return min(restos) if restos else None
+        vigentes = (self.estado_fin == _FIN_OK) & (self.fin >= ahora_s)
+        if not vigentes.any():
+            return None
+        return float(np.mod(self.fin[vigentes] - ahora_s, SEGUNDOS_DIA).min())
+
+    def debidos_en(self, fecha):
+        """Máscara de los medicamentos que tocan en `fecha`"""
+        np = self.np
+        dia = dia_epoch(fecha)
+        if np is None:
+            return [
+                periodo == SIEMPRE or (dia >= inicio and (dia - inicio) % periodo == 0)
+                for inicio, periodo in zip(self.inicio, self.periodo)
+            ]
+        desde_inicio = dia - self.inicio
+        periodo = np.where(self.periodo == SIEMPRE, 1, self.periodo)
+        return (self.periodo == SIEMPRE) | ((desde_inicio >= 0) & (desde_inicio % periodo == 0))
+
+    def contar(self, urgencia):
+        """Cantidad de medicamentos en cada nivel de urgencia"""
+        np = self.np
+        if np is None:
+            conteo = [0] * (ERROR + 1)
+            for u in urgencia:
+                conteo[u] += 1
+            return conteo
+        return np.bincount(np.asarray(urgencia, dtype="int64"), minlength=ERROR + 1).tolist()
@@ -0,0 +1,366 @@
+"""Gráficas de la pantalla de estadísticas, renderizadas a PNG y cacheadas.
+
+Las funciones ``render_*`` reciben solo los datos que se dibujan y usan la API
+de objetos de matplotlib (``Figure`` + ``FigureCanvasAgg``) en lugar del estado
+global de pyplot. ``CacheGraficas`` guarda los PNG resultantes en memoria (LRU)
+y, opcionalmente, en disco, indexados por la huella de esos datos: volver a
+abrir las estadísticas sin cambios no vuelve a pasar por matplotlib.
+
+``RenderizadorGraficas`` hace los renders que faltan en un hilo aparte, de a
+uno, y entrega los PNG en el hilo de la UI, para que la ventana abra sin esperar.
+
+Por defecto la app dibuja las gráficas con el canvas de Kivy
+(``graficas_kivy``); este módulo se usa con ``TRACKER_GRAFICAS=matplotlib`` y
+para exportar las gráficas a PNG cuando matplotlib está instalado.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from columnas import ADVERTENCIA, NORMAL, URGENTE
+from storage import escribir_bytes_atomico
+from tracing import medir
+
+CACHE_DIR = "graficas_cache"
+EXPORT_DIR = "graficas_exportadas"
+
+# "kivy" (canvas nativo) o "matplotlib" (PNG)
+BACKEND = os.environ.get("TRACKER_GRAFICAS", "kivy").strip().lower()
+
+# Cambiarla invalida los PNG guardados en disco cuando cambia el dibujo
+VERSION = 1
+
+MESES_TENDENCIA = ['Ago', 'Sep', 'Oct', 'Nov', 'Dic', 'Ene']
+
+# Color de cada barra en la gráfica de días restantes
+COLORES_BARRA = {
+    URGENTE: '#FF6B6B',      # Rojo
+    ADVERTENCIA: '#FFB347',  # Naranja
+    NORMAL: '#4ECDC4',       # Verde azulado
+}
+
+_matplotlib = None
+_matplotlib_lock = threading.Lock()
+
+
+def cargar_matplotlib():
+    """Importa matplotlib (backend Agg) la primera vez; devuelve (Figure, FigureCanvasAgg)"""
+    global _matplotlib
+    with _matplotlib_lock:
+        if _matplotlib is None:
+            import matplotlib
+            matplotlib.use('Agg')  # Backend sin GUI para Kivy
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            _matplotlib = (Figure, FigureCanvasAgg)
+    return _matplotlib
+
+
+def matplotlib_disponible():
+    """True si matplotlib está instalado (sin importarlo)"""
+    return importlib.util.find_spec("matplotlib") is not None
+
+
+def huella(tipo, *partes):
+    """Hash estable del tipo de gráfica y de los datos que la determinan"""
+    texto = json.dumps([VERSION, tipo, partes], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+# ---------------- render ----------------
+def _nueva_figura(figsize):
+    Figure, FigureCanvasAgg = cargar_matplotlib()
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    fig.patch.set_facecolor('white')
+    return fig, fig.add_subplot()
+
+
+def _a_png(fig, tight_layout=True):
+    if tight_layout:
+        fig.tight_layout()
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    return buf.getvalue()
+
+
+# ---------------- datos ----------------
+# Cada una devuelve (tipo, datos): los datos se toman en el hilo de la UI y se
+# dibujan con el canvas de Kivy o se renderizan a PNG en otro hilo
+def grafica_barras(medicamentos, columnas):
+    """Gráfica de barras de duración de medicamentos"""
+    nombres = [med['nombre'][:15] + '...' if len(med['nombre']) > 15 else med['nombre'] for med in medicamentos]
+    dias_restantes, urgencias = columnas.calcular()
+    # Agotados, sin fecha o con error se muestran en 0 y en gris
+    colores = [COLORES_BARRA.get(int(u), '#95A5A6') for u in urgencias]
+    dias = [int(d) if int(u) in COLORES_BARRA else 0 for d, u in zip(dias_restantes, urgencias)]
+
+    return "barras", {"nombres": nombres, "dias": dias, "colores": colores}
+
+
+def grafica_pastel(medicamentos, columnas):
+    """Gráfica de pastel del estado de medicamentos"""
+    conteo = columnas.contar(columnas.calcular()[1])
+    activos = conteo[NORMAL]
+    por_agotar = conteo[URGENTE] + conteo[ADVERTENCIA]
+    agotados = len(medicamentos) - activos - por_agotar
+
+    return "pastel", {"activos": activos, "por_agotar": por_agotar, "agotados": agotados}
+
+
+def grafica_lineas(medicamentos, hoy=None):
+    """Gráfica de líneas de tendencia de consumo"""
+    # Datos simulados a partir de los medicamentos actuales, fijos durante el día
+    base_consumo = len(medicamentos)
+    hoy = hoy or datetime.now().date().toordinal()
+    consumo_total, consumo_activos = datos_tendencia(base_consumo, hoy * 1000 + base_consumo)
+
+    return "lineas", {"consumo_total": consumo_total, "consumo_activos": consumo_activos}
+
+
+# ---------------- render ----------------
+@medir("render_barras")
+def render_barras(nombres, dias, colores):
+    """Barras de días restantes por medicamento"""
+    fig, ax = _nueva_figura((10, 6))
+
+    bars = ax.bar(nombres, dias, color=colores, alpha=0.8, edgecolor='white', linewidth=2)
+
+    ax.set_title('📊 Días Restantes por Medicamento', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Medicamentos', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Días Restantes', fontsize=12, fontweight='bold')
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+
+    # Rotar etiquetas del eje X
+    for etiqueta in ax.get_xticklabels():
+        etiqueta.set_rotation(45)
+        etiqueta.set_ha('right')
+
+    # Agregar valores en las barras
+    for bar, valor in zip(bars, dias):
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 0.5,
+                f'{valor}d', ha='center', va='bottom', fontweight='bold')
+
+    return _a_png(fig)
+
+
+@medir("render_pastel")
+def render_pastel(activos, por_agotar, agotados):
+    """Pastel de medicamentos activos, por agotar y agotados"""
+    fig, ax = _nueva_figura((8, 8))
+
+    labels = ['Activos', 'Por Agotar (≤7d)', 'Agotados']
+    sizes = [activos, por_agotar, agotados]
+    colors = ['#4ECDC4', '#FFB347', '#FF6B6B']
+    explode = (0.05, 0.05, 0.05)
+
+    # Filtrar valores cero
+    filtered_data = [(label, size, color, exp) for label, size, color, exp in zip(labels, sizes, colors, explode) if size > 0]
+    if filtered_data:
+        labels, sizes, colors, explode = zip(*filtered_data)
+
+    wedges, texts, autotexts = ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%',
+                                      explode=explode, shadow=True, startangle=90)
+
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+        autotext.set_fontsize(12)
+
+    for text in texts:
+        text.set_fontsize(11)
+        text.set_fontweight('bold')
+
+    ax.set_title('📈 Estado de Medicamentos', fontsize=16, fontweight='bold', pad=20)
+
+    return _a_png(fig, tight_layout=False)
+
+
+def datos_tendencia(base_consumo, semilla):
+    """Consumo simulado de los últimos 6 meses (igual para la misma semilla)"""
+    rng = random.Random(semilla)
+    consumo_total = []
+    consumo_activos = []
+    for i in range(len(MESES_TENDENCIA)):
+        # Simular variación en el consumo
+        variacion = rng.randrange(-2, 4)
+        consumo_total.append(max(1, base_consumo + variacion))
+        consumo_activos.append(max(0, consumo_total[i] - rng.randrange(0, 3)))
+    return consumo_total, consumo_activos
+
+
+@medir("render_lineas")
+def render_lineas(consumo_total, consumo_activos):
+    """Líneas de tendencia de consumo"""
+    fig, ax = _nueva_figura((10, 6))
+    meses = MESES_TENDENCIA
+
+    ax.plot(meses, consumo_total, marker='o', linewidth=3, markersize=8,
+            color='#3498DB', label='Total Medicamentos', markerfacecolor='white', markeredgewidth=2)
+    ax.plot(meses, consumo_activos, marker='s', linewidth=3, markersize=8,
+            color='#2ECC71', label='Medicamentos Activos', markerfacecolor='white', markeredgewidth=2)
+
+    ax.set_title('📈 Tendencia de Consumo (Últimos 6 Meses)', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Mes', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Número de Medicamentos', fontsize=12, fontweight='bold')
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.legend(loc='upper left', frameon=True, fancybox=True, shadow=True)
+
+    # Agregar valores en los puntos
+    for i, (total, activo) in enumerate(zip(consumo_total, consumo_activos)):
+        ax.annotate(f'{total}', (i, total), textcoords="offset points", xytext=(0, 10), ha='center', fontweight='bold')
+        ax.annotate(f'{activo}', (i, activo), textcoords="offset points", xytext=(0, -15), ha='center', fontweight='bold')
+
+    return _a_png(fig)
+
+
+RENDERS = {"barras": render_barras, "pastel": render_pastel, "lineas": render_lineas}
+
+
+def pedido_png(tipo, datos):
+    """(clave de caché, función que renderiza el PNG) de una gráfica"""
+    return huella(tipo, datos), lambda: RENDERS[tipo](**datos)
+
+
+# ---------------- caché ----------------
+class CacheGraficas:
+    """PNG ya renderizados, por huella: LRU en memoria y, si hay directorio, en disco"""
+
+    def __init__(self, capacidad=12, directorio=None, capacidad_disco=48):
+        self.capacidad = capacidad
+        self.directorio = directorio
+        self.capacidad_disco = capacidad_disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + ".png")
+
+    def obtener(self, clave):
+        """PNG de la clave o None"""
+        with self._lock:
+            png = self._memoria.get(clave)
+            if png is not None:
+                self._memoria.move_to_end(clave)
+                return png
+        if not self.directorio:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as f:
+                png = f.read()
+            os.utime(ruta)  # el orden del disco también es por último uso
+        except OSError:
+            return None
+        self._en_memoria(clave, png)
+        return png
+
+    def guardar(self, clave, png):
+        self._en_memoria(clave, png)
+        if not self.directorio:
+            return
+        try:
+            escribir_bytes_atomico(self._ruta(clave), png)
+            self._podar_disco()
+        except OSError as e:
+            print(f"Error guardando gráfica en caché: {e}")
+
+    def obtener_o_crear(self, clave, crear):
+        """Devuelve el PNG cacheado o lo crea con `crear()` y lo guarda"""
+        png = self.obtener(clave)
+        if png is None:
+            png = crear()
+            self.guardar(clave, png)
+        return png
+
+    def limpiar(self):
+        with self._lock:
+            self._memoria.clear()
+
+    def _en_memoria(self, clave, png):
+        with self._lock:
+            self._memoria[clave] = png
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.capacidad:
+                self._memoria.popitem(last=False)
+
+    def _podar_disco(self):
+        archivos = [os.path.join(self.directorio, nombre)
+                    for nombre in os.listdir(self.directorio) if nombre.endswith(".png")]
+        if len(archivos) <= self.capacidad_disco:
+            return
+        archivos.sort(key=os.path.getmtime)
+        for ruta in archivos[:len(archivos) - self.capacidad_disco]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+# ---------------- render en segundo plano ----------------
+class PedidoGrafica:
+    """Render pendiente; `cancelar()` descarta el resultado si aún no se entregó"""
+
+    def __init__(self):
+        self.cancelado = False
+        self.futuro = None
+
+    def cancelar(self):
+        self.cancelado = True
+        if self.futuro is not None:
+            self.futuro.cancel()
+
+
+class RenderizadorGraficas:
+    """Renderiza en un hilo aparte y entrega los PNG con `entregar(callback)`
+
+    Los renders van en serie, uno detrás de otro: matplotlib no garantiza que
+    dibujar figuras desde varios hilos a la vez sea seguro (cachés de fuentes y
+    de texto compartidas), así que el pool tiene un solo hilo.
+
+    En la app Kivy `entregar` programa el callback con ``Clock.schedule_once``,
+    así la textura se crea en el hilo principal.
+    """
+
+    def __init__(self, cache, entregar):
+        self.cache = cache
+        self._entregar = entregar
+        self._pool = None
+
+    def pedir(self, clave, render, listo, error=None):
+        """Llama a `listo(png)` (o `error(excepcion)`) en el hilo de la UI"""
+        pedido = PedidoGrafica()
+        png = self.cache.obtener(clave)
+        if png is not None:
+            listo(png)
+            return pedido
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graficas")
+        pedido.futuro = self._pool.submit(self._renderizar, pedido, clave, render, listo, error)
+        return pedido
+
+    def _renderizar(self, pedido, clave, render, listo, error):
+        if pedido.cancelado:
+            return
+        try:
+            png = self.cache.obtener_o_crear(clave, render)
+        except Exception as e:
+            if error is not None:
+                self._entregar(lambda e=e: pedido.cancelado or error(e))
+            return
+        self._entregar(lambda: pedido.cancelado or listo(png))
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,204 @@
+"""Gráficas dibujadas directamente en el canvas de Kivy, sin matplotlib.
+
+Dibujan las mismas barras, pastel y líneas de ``graficas`` a partir de los
+mismos datos con instrucciones ``Rectangle``, ``Mesh`` y ``Line``. No hace falta
+empaquetar matplotlib/NumPy en el APK ni importar nada pesado, y redibujar es
+solo regenerar unas decenas de instrucciones. matplotlib queda como backend
+opcional para exportar PNG (``graficas.render_*``).
+"""
+import math
+
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Ellipse, Line, Mesh, PopMatrix, PushMatrix, Rectangle, Rotate
+from kivy.metrics import dp, sp
+from kivy.uix.widget import Widget
+from kivy.utils import get_color_from_hex
+
+from graficas import MESES_TENDENCIA
+
+COLOR_TEXTO = (0.2, 0.2, 0.2, 1)
+COLOR_GRILLA = (0, 0, 0, 0.15)
+
+
+class GraficaCanvas(Widget):
+    """Base: fondo, título y redibujado al cambiar tamaño o posición"""
+
+    titulo = ""
+
+    def __init__(self, datos, **kwargs):
+        super().__init__(**kwargs)
+        self.datos = datos
+        # Texturas de texto por (texto, tamaño, negrita): redibujar al cambiar
+        # tamaño o posición no vuelve a rasterizar las etiquetas
+        self._texturas = {}
+        self.bind(pos=self.redibujar, size=self.redibujar)
+
+    def redibujar(self, *args):
+        self.canvas.clear()
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            Rectangle(pos=self.pos, size=self.size)
+            # center_x/top pueden no estar actualizados todavía cuando llega el evento de size
+            self.texto(self.titulo, self.x + self.width / 2, self.y + self.height - dp(14),
+                       font_size=sp(14), bold=True)
+            self.dibujar()
+
+    def dibujar(self):
+        raise NotImplementedError
+
+    def area(self, izquierda=dp(40), derecha=dp(12), abajo=dp(24), arriba=dp(34)):
+        """(x, y, ancho, alto) del área de datos dentro del widget"""
+        return (self.x + izquierda, self.y + abajo,
+                max(1, self.width - izquierda - derecha), max(1, self.height - abajo - arriba))
+
+    def texto(self, texto, x, y, font_size=sp(10), color=COLOR_TEXTO, bold=False,
+              ancla_x=0.5, ancla_y=0.5, angulo=0):
+        """Dibuja `texto` con su punto de anclaje (fracción del tamaño) en (x, y)"""
+        clave = (str(texto), font_size, bold)
+        textura = self._texturas.get(clave)
+        if textura is None:
+            etiqueta = CoreLabel(text=clave[0], font_size=font_size, bold=bold)
+            etiqueta.refresh()
+            textura = etiqueta.texture
+            if textura is None:
+                return
+            self._texturas[clave] = textura
+        ancho, alto = textura.size
+        Color(*color)
+        if angulo:
+            PushMatrix()
+            Rotate(angle=angulo, origin=(x, y))
+        Rectangle(texture=textura, size=textura.size, pos=(x - ancho * ancla_x, y - alto * ancla_y))
+        if angulo:
+            PopMatrix()
+
+    def grilla_y(self, x, y, ancho, alto, maximo, divisiones=4):
+        """Líneas horizontales punteadas con sus valores en el eje Y"""
+        for i in range(divisiones + 1):
+            fy = y + alto * i / divisiones
+            Color(*COLOR_GRILLA)
+            Line(points=[x, fy, x + ancho, fy], width=1, dash_length=dp(4), dash_offset=dp(3))
+            self.texto(_numero(maximo * i / divisiones), x - dp(4), fy, ancla_x=1)
+
+
+class GraficaBarras(GraficaCanvas):
+    titulo = "📊 Días Restantes por Medicamento"
+
+    def dibujar(self):
+        nombres, dias, colores = self.datos["nombres"], self.datos["dias"], self.datos["colores"]
+        if not nombres:
+            return
+        x, y, ancho, alto = self.area(abajo=dp(56))
+        maximo = _escala(max(dias) * 1.15)
+        self.grilla_y(x, y, ancho, alto, maximo)
+
+        paso = ancho / len(nombres)
+        ancho_barra = paso * 0.8
+        for i, (nombre, valor, color) in enumerate(zip(nombres, dias, colores)):
+            bx = x + paso * i + (paso - ancho_barra) / 2
+            bh = alto * max(valor, 0) / maximo
+            r, g, b, _ = get_color_from_hex(color)
+            Color(r, g, b, 0.8)
+            Rectangle(pos=(bx, y), size=(ancho_barra, bh))
+            self.texto(f"{valor}d", bx + ancho_barra / 2, y + bh + dp(2), bold=True, ancla_y=0)
+            # Etiqueta del eje X a 45°, como en la versión de matplotlib
+            self.texto(nombre, bx + ancho_barra / 2, y - dp(4), ancla_x=1, ancla_y=1, angulo=45)
+
+
+class GraficaPastel(GraficaCanvas):
+    titulo = "📈 Estado de Medicamentos"
+
+    ETIQUETAS = ("Activos", "Por Agotar (≤7d)", "Agotados")
+    COLORES = ("#4ECDC4", "#FFB347", "#FF6B6B")
+
+    def dibujar(self):
+        valores = (self.datos["activos"], self.datos["por_agotar"], self.datos["agotados"])
+        total = float(sum(valores))
+        if total <= 0:
+            return
+        x, y, ancho, alto = self.area(izquierda=dp(12), abajo=dp(12))
+        radio = min(ancho, alto) / 2 * 0.75
+        cx, cy = x + ancho / 2, y + alto / 2
+
+        angulo = 90.0  # Empieza arriba y avanza en sentido antihorario
+        for etiqueta, valor, color in zip(self.ETIQUETAS, valores, self.COLORES):
+            if valor <= 0:
+                continue
+            barrido = 360.0 * valor / total
+            medio = math.radians(angulo + barrido / 2)
+            # Porción separada del centro (explode)
+            ox, oy = cx + math.cos(medio) * radio * 0.05, cy + math.sin(medio) * radio * 0.05
+            Color(*get_color_from_hex(color))
+            _sector(ox, oy, radio, angulo, barrido)
+            self.texto(f"{100 * valor / total:.1f}%", ox + math.cos(medio) * radio * 0.6,
+                       oy + math.sin(medio) * radio * 0.6, font_size=sp(12), color=(1, 1, 1, 1), bold=True)
+            self.texto(etiqueta, ox + math.cos(medio) * radio * 1.15, oy + math.sin(medio) * radio * 1.15,
+                       font_size=sp(11), bold=True, ancla_x=0 if math.cos(medio) >= 0 else 1)
+            angulo += barrido
+
+
+class GraficaLineas(GraficaCanvas):
+    titulo = "📈 Tendencia de Consumo (Últimos 6 Meses)"
+
+    SERIES = (("consumo_total", "#3498DB", "Total Medicamentos", 10),
+              ("consumo_activos", "#2ECC71", "Medicamentos Activos", -15))
+
+    def dibujar(self):
+        x, y, ancho, alto = self.area(derecha=dp(20))
+        valores = self.datos["consumo_total"] + self.datos["consumo_activos"]
+        maximo = _escala(max(valores) * 1.2)
+        self.grilla_y(x, y, ancho, alto, maximo)
+
+        n = len(MESES_TENDENCIA)
+        paso = ancho / max(n - 1, 1)
+        for i, mes in enumerate(MESES_TENDENCIA):
+            self.texto(mes, x + paso * i, y - dp(4), ancla_y=1)
+
+        for fila, (campo, color, nombre, desplazamiento) in enumerate(self.SERIES):
+            serie = self.datos[campo]
+            puntos = []
+            for i, valor in enumerate(serie):
+                puntos += [x + paso * i, y + alto * valor / maximo]
+            rgba = get_color_from_hex(color)
+            Color(*rgba)
+            Line(points=puntos, width=dp(1.5))
+            for i, valor in enumerate(serie):
+                px, py = puntos[2 * i], puntos[2 * i + 1]
+                Color(1, 1, 1, 1)
+                Ellipse(pos=(px - dp(4), py - dp(4)), size=(dp(8), dp(8)))
+                Color(*rgba)
+                Line(circle=(px, py, dp(4)), width=dp(1))
+                self.texto(valor, px, py + dp(desplazamiento), bold=True)
+
+            # Leyenda arriba a la izquierda
+            ly = y + alto - dp(8) - fila * dp(16)
+            Color(*rgba)
+            Rectangle(pos=(x + dp(6), ly - dp(4)), size=(dp(14), dp(8)))
+            self.texto(nombre, x + dp(24), ly, ancla_x=0)
+
+
+GRAFICAS = {"barras": GraficaBarras, "pastel": GraficaPastel, "lineas": GraficaLineas}
+
+
+def crear(tipo, datos, **kwargs):
+    """Widget de la gráfica `tipo` ("barras", "pastel" o "lineas")"""
+    return GRAFICAS[tipo](datos, **kwargs)
+
+
+def _escala(maximo, divisiones=4):
+    """Máximo del eje redondeado para que las divisiones sean enteras"""
+    return max(divisiones, math.ceil(maximo / divisiones) * divisiones)
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else f"{valor:.1f}"
+
+
+def _sector(cx, cy, radio, inicio, barrido, pasos_por_vuelta=72):
+    """Porción de círculo como Mesh en abanico (triangle_fan)"""
+    pasos = max(2, int(pasos_por_vuelta * barrido / 360.0) + 1)
+    vertices = [cx, cy, 0, 0]
+    for i in range(pasos + 1):
+        a = math.radians(inicio + barrido * i / pasos)
+        vertices += [cx + math.cos(a) * radio, cy + math.sin(a) * radio, 0, 0]
+    Mesh(vertices=vertices, indices=list(range(len(vertices) // 4)), mode="triangle_fan")
@@ -0,0 +1,47 @@
+"""Historial de notificaciones en memoria: un buffer circular acotado.
+
+Las notificaciones se agregan al final de un ``deque`` con ``maxlen``, así que
+agregar es O(1) y la más vieja se descarta sola al llenarse. Se leen por
+páginas, de la más reciente a la más vieja, sin copiar el historial completo.
+"""
+from collections import deque
+from itertools import islice
+
+from storage import LIMITE_HISTORIAL
+
+
+class HistorialNotificaciones:
+    """Últimas `capacidad` notificaciones, de la más vieja a la más reciente"""
+
+    def __init__(self, notificaciones=(), capacidad=LIMITE_HISTORIAL):
+        self.capacidad = capacidad
+        self._buffer = deque(maxlen=capacidad)
+        self.cargar(notificaciones)
+
+    def cargar(self, recientes_primero):
+        """Reemplaza el contenido por una lista con las más recientes primero"""
+        self._buffer.clear()
+        self._buffer.extend(reversed(list(islice(recientes_primero, self.capacidad))))
+
+    def agregar(self, notificacion):
+        self._buffer.append(notificacion)
+
+    def limpiar(self):
+        self._buffer.clear()
+
+    def pagina(self, numero, tamano=20):
+        """La página `numero` (desde 0) con las más recientes primero"""
+        inicio = numero * tamano
+        return list(islice(reversed(self._buffer), inicio, inicio + tamano))
+
+    def hay_pagina(self, numero, tamano=20):
+        return numero * tamano < len(self._buffer)
+
+    def recientes_primero(self):
+        return list(reversed(self._buffer))
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __bool__(self):
+        return bool(self._buffer)
@@ -0,0 +1,266 @@
+"""Índice de horarios: qué medicamentos tocan cada día sin volver a parsear fechas.
+
+Cada medicamento se compila una sola vez a dos enteros: el día de inicio
+(días desde 1970-01-01) y el período en días. Los medicamentos se agrupan por
+(período, inicio % período), así que los que tocan un día ``d`` son los del
+grupo ``d % período`` de cada período distinto.
+
+``PlanTomas`` baja al detalle de la hora: genera los instantes exactos de cada
+toma (varias horas fijas por día o cada N horas) con aritmética y bisect, sin
+recorrer día por día.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M"
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Período especial: sin fecha de inicio (o con datos inválidos) se toma todos los días
+SIEMPRE = 0
+
+
+def dia_epoch(fecha):
+    """Convierte una fecha/datetime (o un entero ya convertido) a días desde 1970-01-01"""
+    if isinstance(fecha, int):
+        return fecha
+    return fecha.toordinal() - EPOCH_ORDINAL
+
+
+def compilar(medicamento):
+    """Devuelve (dia_inicio, periodo) con la misma semántica que es_dia_de_toma"""
+    fecha_inicio_str = medicamento.get('fecha_inicio') or medicamento.get('inicio')
+    if not fecha_inicio_str:
+        return 0, SIEMPRE
+    try:
+        inicio = datetime.strptime(fecha_inicio_str, FORMATO_FECHA)
+        periodo = abs(int(medicamento.get('frecuencia_dias', 1)))
+    except Exception:
+        return 0, SIEMPRE
+    # Frecuencia 0: la versión anterior hacía `dias >= 0 and dias % 0 == 0`.
+    # Antes del inicio el `and` cortaba y daba False; desde el inicio, el
+    # ZeroDivisionError caía en su `except` y daba True. Es decir, todos los
+    # días a partir del inicio, que es lo mismo que período 1.
+    return dia_epoch(inicio), periodo or 1
+
+
+FORMATO_HORA = "%H:%M"
+
+
+def parsear_horas(texto):
+    """Interpreta el campo de horarios: "08:00, 20:00" o "8h" (cada 8 horas)
+
+    Devuelve (horas, intervalo_horas); lanza ValueError si no es válido. El
+    intervalo debe dividir 24 o ser múltiplo de 24, así cada día (o cada N
+    días) tiene las mismas tomas.
+    """
+    texto = texto.strip().lower()
+    if not texto:
+        return [], None
+    if texto.endswith("h"):
+        intervalo = int(texto[:-1].strip())
+        if intervalo <= 0 or (24 % intervalo and intervalo % 24):
+            raise ValueError(f"intervalo no válido: {intervalo}h")
+        return [], intervalo
+    horas = set()
+    for parte in texto.replace(";", ",").split(","):
+        if parte.strip():
+            horas.add(datetime.strptime(parte.strip(), FORMATO_HORA).strftime(FORMATO_HORA))
+    return sorted(horas), None
+
+
+def formatear_horas(medicamento):
+    """Texto del campo de horarios para editar un medicamento"""
+    if medicamento.get("intervalo_horas"):
+        return f"{medicamento['intervalo_horas']}h"
+    return ", ".join(medicamento.get("horas") or [])
+
+
+class PlanTomas:
+    """Instantes de toma: ``base + k * periodo + desplazamiento`` a partir de ``desde``
+
+    Las tomas se numeran con un índice global ``k * len(desplazamientos) + j``,
+    así la toma siguiente a un instante sale con una división y un bisect
+    (O(log tomas por ciclo)) y la n-ésima siguiente en O(1).
+    """
+
+    __slots__ = ("base", "periodo", "desplazamientos", "desde", "_primera")
+
+    def __init__(self, base, periodo, desplazamientos, desde):
+        self.base = base
+        self.periodo = periodo
+        self.desplazamientos = sorted(desplazamientos)
+        self.desde = desde
+        self._primera = self._indice(desde)
+
+    @classmethod
+    def desde_medicamento(cls, medicamento):
+        """Plan de un medicamento, o None si no tiene inicio o frecuencia válidos
+
+        - ``intervalo_horas``: cada N horas desde el inicio.
+        - ``horas``: a esas horas, cada ``frecuencia_dias`` días desde el día de inicio.
+        - si no: a la hora del inicio, cada ``frecuencia_dias`` días.
+        """
+        try:
+            inicio = datetime.strptime(medicamento["inicio"], FORMATO_FECHA)
+            intervalo = medicamento.get("intervalo_horas")
+            if intervalo:
+                periodo = timedelta(hours=int(intervalo))
+                return cls(inicio, periodo, [timedelta(0)], inicio) if periodo > timedelta(0) else None
+            periodo = timedelta(days=int(medicamento["frecuencia_dias"]))
+            if periodo <= timedelta(0):
+                return None
+            horas = medicamento.get("horas")
+            if horas:
+                dia = datetime(inicio.year, inicio.month, inicio.day)
+                desplazamientos = []
+                for hora in horas:
+                    h = datetime.strptime(hora, FORMATO_HORA)
+                    desplazamientos.append(timedelta(hours=h.hour, minutes=h.minute))
+                return cls(dia, periodo, desplazamientos, inicio)
+            return cls(inicio, periodo, [timedelta(0)], inicio)
+        except Exception:
+            return None
+
+    def _indice(self, instante, estricto=False):
+        """Índice global de la primera toma >= instante (> si `estricto`)"""
+        diferencia = instante - self.base
+        ciclo = diferencia // self.periodo
+        resto = diferencia - ciclo * self.periodo
+        buscar = bisect_right if estricto else bisect_left
+        return ciclo * len(self.desplazamientos) + buscar(self.desplazamientos, resto)
+
+    def toma(self, indice):
+        ciclo, j = divmod(indice, len(self.desplazamientos))
+        return self.base + ciclo * self.periodo + self.desplazamientos[j]
+
+    def indice(self, instante):
+        """Índice de la primera toma en `instante` o después"""
+        return max(self._primera, self._indice(instante))
+
+    def cercano(self, instante):
+        """Índice de la toma más cercana a `instante` (anterior o siguiente)"""
+        siguiente = self.indice(instante)
+        if siguiente > self._primera and instante - self.toma(siguiente - 1) < self.toma(siguiente) - instante:
+            return siguiente - 1
+        return siguiente
+
+    def siguiente(self, instante):
+        """Primera toma en `instante` o después"""
+        return self.toma(max(self._primera, self._indice(instante)))
+
+    def anterior(self, instante):
+        """Última toma en `instante` o antes (None si todavía no empezó)"""
+        indice = self._indice(instante, estricto=True) - 1
+        return self.toma(indice) if indice >= self._primera else None
+
+    def tomas(self, desde, n):
+        """Las `n` tomas siguientes a partir de `desde`"""
+        primera = max(self._primera, self._indice(desde))
+        return [self.toma(i) for i in range(primera, primera + n)]
+
+    def entre(self, inicio, fin):
+        """Tomas en [inicio, fin)"""
+        primera = max(self._primera, self._indice(inicio))
+        ultima = self._indice(fin)
+        return [self.toma(i) for i in range(primera, ultima)]
+
+
+def proxima_toma(medicamento, desde):
+    """Primera toma en `desde` o después (None si el medicamento no tiene horario)"""
+    plan = PlanTomas.desde_medicamento(medicamento)
+    return plan.siguiente(desde) if plan else None
+
+
+class ScheduleIndex:
+    """Arreglos compactos de inicio/período por medicamento con búsqueda por día"""
+
+    def __init__(self, medicamentos=()):
+        self._inicio = array('l')
+        self._periodo = array('l')
+        self._grupos = None
+        self.reconstruir(medicamentos)
+
+    def __len__(self):
+        return len(self._periodo)
+
+    def reconstruir(self, medicamentos):
+        """Compila la lista completa (al cargar los medicamentos)"""
+        self._inicio = array('l')
+        self._periodo = array('l')
+        for med in medicamentos:
+            inicio, periodo = compilar(med)
+            self._inicio.append(inicio)
+            self._periodo.append(periodo)
+        self._grupos = None
+
+    # ---------------- cambios incrementales ----------------
+    def agregar(self, medicamento):
+        inicio, periodo = compilar(medicamento)
+        self._inicio.append(inicio)
+        self._periodo.append(periodo)
+        if self._grupos is not None:
+            self._agrupar(len(self._periodo) - 1)
+
+    def actualizar(self, indice, medicamento):
+        if self._grupos is not None:
+            self._desagrupar(indice)
+        self._inicio[indice], self._periodo[indice] = compilar(medicamento)
+        if self._grupos is not None:
+            self._agrupar(indice)
+
+    def eliminar(self, indice):
+        """Quita el medicamento `indice`; es O(N), no incremental
+
+        Los grupos guardan posiciones, así que todas las posteriores bajan
+        uno (igual que en los arreglos y en la lista de medicamentos). Borrar
+        es poco frecuente; agregar y actualizar sí son O(1).
+        """
+        if self._grupos is not None:
+            self._desagrupar(indice)
+            for grupos in self._grupos.values():
+                for residuo, indices in grupos.items():
+                    if any(i > indice for i in indices):
+                        grupos[residuo] = {i - 1 if i > indice else i for i in indices}
+        del self._inicio[indice]
+        del self._periodo[indice]
+
+    def _agrupar(self, indice):
+        periodo = self._periodo[indice]
+        residuo = self._inicio[indice] % periodo if periodo else 0
+        self._grupos.setdefault(periodo, {}).setdefault(residuo, set()).add(indice)
+
+    def _desagrupar(self, indice):
+        periodo = self._periodo[indice]
+        residuo = self._inicio[indice] % periodo if periodo else 0
+        self._grupos.get(periodo, {}).get(residuo, set()).discard(indice)
+
+    def _asegurar_grupos(self):
+        if self._grupos is None:
+            self._grupos = {}
+            for indice in range(len(self._periodo)):
+                self._agrupar(indice)
+
+    # ---------------- consultas ----------------
+    def es_dia_de_toma(self, indice, fecha):
+        """True si el medicamento `indice` toca en `fecha` (O(1))"""
+        periodo = self._periodo[indice]
+        if periodo == SIEMPRE:
+            return True
+        dias_desde_inicio = dia_epoch(fecha) - self._inicio[indice]
+        return dias_desde_inicio >= 0 and dias_desde_inicio % periodo == 0
+
+    def debidos(self, fecha):
+        """Índices (ordenados) de los medicamentos que tocan en `fecha`"""
+        self._asegurar_grupos()
+        dia = dia_epoch(fecha)
+        resultado = []
+        for periodo, grupos in self._grupos.items():
+            if periodo == SIEMPRE:
+                resultado.extend(grupos.get(0, ()))
+                continue
+            for indice in grupos.get(dia % periodo, ()):
+                if self._inicio[indice] <= dia:
+                    resultado.append(indice)
+        resultado.sort()
+        return resultado
@@ -0,0 +1,138 @@
+"""Inventario: cantidad actual y fecha de agotamiento de cada medicamento.
+
+Toda la cantidad pasa por aquí: cada toma, deshacer, compra o ajuste se anota
+en el diario de tomas y actualiza la proyección del medicamento en O(1), sin
+recalcularla desde el inicio del tratamiento.
+
+El modelo: cada toma del plan (``horario.PlanTomas``) consume ``dosis``. La
+proyección es la *cobertura*, el índice (fraccionario) de la toma del plan
+hasta donde alcanza el stock; el medicamento se agota en la primera toma que
+ya no queda cubierta entera, ``plan.toma(floor(cobertura))``. Se guarda en el
+medicamento (``med["inventario"]``) y la fecha resultante en ``fecha_fin``,
+que es lo que leen la lista, las estadísticas y los avisos.
+
+- Ajuste (alta, edición): la cobertura arranca en la próxima toma.
+- Compra: se suma a la cobertura (o a la próxima toma, si ya se había agotado).
+- Toma de una dosis del plan: la cobertura no cambia, esa toma ya estaba
+  contada. Solo baja si se tomó más de lo previsto.
+- Deshacer: vuelve a cubrir la toma más cercana si hace falta.
+
+Sin hora de inicio no hay plan propio: se usa uno cada ``frecuencia_dias``
+días desde el momento del último ajuste (``ancla``).
+"""
+import math
+from datetime import datetime, timedelta
+
+from horario import FORMATO_FECHA, PlanTomas
+from journal import AJUSTE, COMPRA, DESHACER, TOMA
+
+
+class Inventario:
+    """Cantidades (vía el diario de tomas) y proyecciones de agotamiento"""
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    # ---------------- plan ----------------
+    @staticmethod
+    def _plan(med):
+        plan = PlanTomas.desde_medicamento(med)
+        if plan is not None:
+            return plan
+        ancla = (med.get("inventario") or {}).get("ancla")
+        try:
+            ancla = datetime.strptime(ancla, FORMATO_FECHA)
+            periodo = timedelta(days=int(med.get("frecuencia_dias") or 1))
+        except (TypeError, ValueError):
+            return None
+        return PlanTomas(ancla, periodo, [timedelta(0)], ancla) if periodo > timedelta(0) else None
+
+    @staticmethod
+    def _dosis(med):
+        try:
+            return float(med.get("dosis") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def cantidad(med):
+        return float(med.get("cantidad_actual", med.get("cantidad_total", 0)) or 0)
+
+    def _proyectar(self, med, cobertura, plan=None):
+        """Guarda la cobertura y la fecha de agotamiento que resulta"""
+        estado = med.setdefault("inventario", {})
+        if cobertura is None:
+            estado["cobertura"] = None
+            med["fecha_fin"] = None
+            return
+        plan = plan or self._plan(med)
+        estado["cobertura"] = cobertura
+        # Tolerancia para que 10/3*3 no quede apenas por debajo de 10
+        med["fecha_fin"] = plan.toma(math.floor(cobertura + 1e-9)).strftime(FORMATO_FECHA)
+
+    # ---------------- eventos ----------------
+    def reanclar(self, med, ahora=None):
+        """Proyección desde cero con la cantidad actual (alta o cambio de plan o dosis)"""
+        ahora = ahora or datetime.now()
+        if PlanTomas.desde_medicamento(med) is None:
+            med.setdefault("inventario", {})["ancla"] = ahora.strftime(FORMATO_FECHA)
+        plan = self._plan(med)
+        dosis = self._dosis(med)
+        if plan is None or dosis <= 0:
+            self._proyectar(med, None)
+            return
+        self._proyectar(med, plan.indice(ahora) + max(0.0, self.cantidad(med)) / dosis, plan)
+
+    def registrar(self, med, tipo, cantidad=0, ahora=None):
+        """Anota el evento en el diario y actualiza cantidad y proyección; devuelve la cantidad"""
+        ahora = ahora or datetime.now()
+        med["cantidad_actual"] = self.journal.registrar(tipo, med["id"], cantidad)
+        if tipo == AJUSTE:
+            self.reanclar(med, ahora)
+            return med["cantidad_actual"]
+
+        plan = self._plan(med)
+        dosis = self._dosis(med)
+        cobertura = (med.get("inventario") or {}).get("cobertura")
+        if plan is None or dosis <= 0:
+            return med["cantidad_actual"]
+        if cobertura is None:
+            self.reanclar(med, ahora)
+            return med["cantidad_actual"]
+
+        restante = self.cantidad(med) / dosis
+        if tipo == COMPRA:
+            cobertura = max(cobertura, plan.indice(ahora)) + float(cantidad) / dosis
+        elif tipo == TOMA:
+            # La toma cubre la dosis más cercana; lo que quede alcanza para las siguientes
+            cobertura = min(cobertura, plan.cercano(ahora) + 1 + restante)
+        elif tipo == DESHACER:
+            cobertura = max(cobertura, plan.cercano(ahora) + restante)
+        self._proyectar(med, cobertura, plan)
+        return med["cantidad_actual"]
+
+    # ---------------- carga ----------------
+    def cargar(self, medicamentos, ahora=None):
+        """Toma las cantidades del diario y proyecta los medicamentos que aún no tienen
+
+        Devuelve los índices de los medicamentos cuya proyección cambió.
+        """
+        cambiados = []
+        for i, med in enumerate(medicamentos):
+            med_id = med["id"]
+            if self.journal.conoce(med_id):
+                med["cantidad_actual"] = self.journal.cantidad(med_id)
+            else:
+                self.journal.registrar(AJUSTE, med_id, self.cantidad(med))
+            if "cobertura" not in (med.get("inventario") or {}):
+                # Datos de versiones anteriores: fecha_fin se recalculaba de formas distintas
+                self.reanclar(med, ahora)
+                cambiados.append(i)
+        return cambiados
+
+    def agotamiento(self, med):
+        """Fecha proyectada en que se acaba el medicamento (None si no se puede proyectar)"""
+        try:
+            return datetime.strptime(med["fecha_fin"], FORMATO_FECHA)
+        except (KeyError, TypeError, ValueError):
+            return None
@@ -0,0 +1,199 @@
+"""Diario de tomas: registro append-only de cada toma, deshacer y compra.
+
+Cada evento es una línea JSON agregada al final de ``tomas.log``. La cantidad
+actual de cada medicamento es el resultado de aplicar (fold) los eventos sobre
+la última instantánea; un hilo en segundo plano agrupa los ``fsync`` y, cuando
+el log crece, guarda una instantánea nueva y lo trunca.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+from storage import escribir_json_atomico
+
+JOURNAL_FILE = "tomas.log"
+SNAPSHOT_FILE = "tomas_snapshot.json"
+
+TOMA = "toma"
+DESHACER = "deshacer"
+COMPRA = "compra"
+AJUSTE = "ajuste"  # fija la cantidad (alta o edición del medicamento)
+BAJA = "baja"      # el medicamento se eliminó
+
+
+def aplicar_evento(estado, consumo, evento):
+    """Aplica un evento sobre el estado en memoria y devuelve la nueva cantidad"""
+    tipo = evento["tipo"]
+    med_id = evento["id"]
+    cantidad = float(evento.get("cantidad", 0))
+
+    if tipo == BAJA:
+        estado.pop(med_id, None)
+        consumo.pop(med_id, None)
+        return None
+    if tipo == AJUSTE:
+        estado[med_id] = cantidad
+        return cantidad
+
+    actual = estado.get(med_id, 0.0)
+    if tipo == TOMA:
+        tomado = min(actual, cantidad)
+        estado[med_id] = actual - tomado
+        dia = evento["ts"][:10]
+        por_dia = consumo.setdefault(med_id, {})
+        por_dia[dia] = por_dia.get(dia, 0.0) + tomado
+    elif tipo == DESHACER:
+        estado[med_id] = actual + cantidad
+        dia = evento["ts"][:10]
+        por_dia = consumo.setdefault(med_id, {})
+        por_dia[dia] = max(0.0, por_dia.get(dia, 0.0) - cantidad)
+    elif tipo == COMPRA:
+        estado[med_id] = actual + cantidad
+    return estado.get(med_id)
+
+
+class IntakeJournal:
+    """Registro append-only de tomas con fsync agrupado y compactación"""
+
+    def __init__(self, ruta=JOURNAL_FILE, ruta_snapshot=SNAPSHOT_FILE,
+                 fsync_intervalo=1.0, umbral_compactacion=1000):
+        self.ruta = ruta
+        self.ruta_snapshot = ruta_snapshot
+        self.fsync_intervalo = fsync_intervalo
+        self.umbral_compactacion = umbral_compactacion
+        self.estado = {}
+        self.consumo = {}
+        self.on_compactado = None
+        self._seq = 0
+        self._pendientes = 0  # eventos en el log desde la última instantánea
+        self._sucio = False
+        self._archivo = None
+        self._lock = threading.RLock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    # ---------------- carga ----------------
+    def cargar(self):
+        """Reconstruye el estado desde la instantánea y el log"""
+        with self._lock:
+            self.estado = {}
+            self.consumo = {}
+            self._seq = 0
+            self._pendientes = 0
+            if os.path.exists(self.ruta_snapshot):
+                try:
+                    with open(self.ruta_snapshot, "r", encoding="utf-8") as f:
+                        snapshot = json.load(f)
+                    self.estado = snapshot.get("estado", {})
+                    self.consumo = snapshot.get("consumo", {})
+                    self._seq = snapshot.get("seq", 0)
+                except Exception as e:
+                    print(f"Error cargando instantánea de tomas: {e}")
+
+            if os.path.exists(self.ruta):
+                valido = 0
+                with open(self.ruta, "rb") as f:
+                    for linea in f:
+                        try:
+                            if not linea.endswith(b"\n"):
+                                raise ValueError("línea sin terminar")
+                            evento = json.loads(linea.decode("utf-8"))
+                        except ValueError:
+                            # Línea incompleta por un cierre inesperado: se descarta
+                            break
+                        valido += len(linea)
+                        # Eventos ya incluidos en la instantánea (compactación interrumpida)
+                        if evento.get("seq", 0) <= self._seq:
+                            continue
+                        aplicar_evento(self.estado, self.consumo, evento)
+                        self._seq = evento["seq"]
+                        self._pendientes += 1
+                if valido < os.path.getsize(self.ruta):
+                    with open(self.ruta, "r+b") as f:
+                        f.truncate(valido)
+            self._archivo = open(self.ruta, "a", encoding="utf-8")
+
+    # ---------------- escritura ----------------
+    def registrar(self, tipo, med_id, cantidad=0, ts=None):
+        """Agrega un evento al log y devuelve la cantidad resultante"""
+        with self._lock:
+            if self._archivo is None:
+                self.cargar()
+            self._seq += 1
+            evento = {
+                "seq": self._seq,
+                "ts": ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "tipo": tipo,
+                "id": med_id,
+                "cantidad": cantidad,
+            }
+            self._archivo.write(json.dumps(evento, ensure_ascii=False) + "\n")
+            self._archivo.flush()
+            self._sucio = True
+            self._pendientes += 1
+            return aplicar_evento(self.estado, self.consumo, evento)
+
+    def cantidad(self, med_id, defecto=None):
+        with self._lock:
+            return self.estado.get(med_id, defecto)
+
+    def conoce(self, med_id):
+        with self._lock:
+            return med_id in self.estado
+
+    def consumo_diario(self, med_id):
+        """Cantidad consumida por día ({"YYYY-MM-DD": cantidad}) de un medicamento"""
+        with self._lock:
+            return dict(self.consumo.get(med_id, {}))
+
+    def sync(self):
+        """Fuerza a disco los eventos pendientes"""
+        with self._lock:
+            if self._archivo is not None and self._sucio:
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+                self._sucio = False
+
+    def compactar(self):
+        """Guarda una instantánea del estado y trunca el log"""
+        with self._lock:
+            if self._archivo is None:
+                return
+            snapshot = {"seq": self._seq, "estado": self.estado, "consumo": self.consumo}
+            escribir_json_atomico(self.ruta_snapshot, snapshot)
+            # Si se corta aquí, los eventos con seq <= snapshot se ignoran al cargar
+            self._archivo.close()
+            self._archivo = open(self.ruta, "w", encoding="utf-8")
+            self._sucio = False
+            self._pendientes = 0
+        if self.on_compactado:
+            self.on_compactado()
+
+    # ---------------- hilo de fondo ----------------
+    def iniciar(self):
+        """Inicia el hilo que agrupa fsync y compacta el log"""
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._worker, daemon=True)
+            self._hilo.start()
+
+    def _worker(self):
+        while not self._detener.wait(self.fsync_intervalo):
+            try:
+                self.sync()
+                if self._pendientes >= self.umbral_compactacion:
+                    self.compactar()
+            except Exception as e:
+                print(f"Error en el diario de tomas: {e}")
+
+    def cerrar(self):
+        """Detiene el hilo de fondo y deja todo en disco"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+        with self._lock:
+            if self._archivo is not None:
+                self.sync()
+                self._archivo.close()
+                self._archivo = None
@@ -1,28 +1,26 @@
+import time
+_INICIO_PROCESO = time.perf_counter()
+
 from datetime import datetime, timedelta
 import json
 import os
 import threading
-import time
 try:
     import winsound  # Para sonidos en Windows
 except ImportError:
     winsound = None  # Para Android/otros sistemas
 
-import matplotlib
-matplotlib.use('Agg')  # Backend sin GUI para Kivy
-import matplotlib.pyplot as plt
-import numpy as np
 from io import BytesIO
-import base64
 
 from kivy.app import App
 from kivy.core.window import Window
 from kivy.lang import Builder
 from kivy.metrics import dp
-from kivy.properties import ListProperty
+from kivy.properties import NumericProperty
 from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.button import Button
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
@@ -38,12 +36,44 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
 from kivy.core.image import Image as CoreImage
 
+from storage import USUARIO_FILE, asegurar_id, crear_storage, escribir_bytes_atomico, escribir_json_atomico
+from journal import COMPRA, TOMA
+from horario import PlanTomas, formatear_horas, parsear_horas, proxima_toma
+from nucleo import Tracker, calcular_dias_restantes, es_dia_de_toma
+from planificador import Planificador
+from alarmas import calcular_avisos, crear_alarmas, pedir_permisos
+from columnas import ADVERTENCIA, AGOTADO, NORMAL, URGENTE, cargar_numpy, formatear_dias
+from tracing import Arranque, evento, medir, span, tracer
+from graficas import (BACKEND as BACKEND_GRAFICAS, CACHE_DIR, EXPORT_DIR, CacheGraficas, RenderizadorGraficas,
+                      cargar_matplotlib, grafica_barras, grafica_lineas, grafica_pastel, matplotlib_disponible,
+                      pedido_png)
+import graficas_kivy
+
 Window.size = (420, 720)
 
-USUARIO_FILE = "usuario.json"
-MEDICAMENTOS_FILE = "medicamentos.json"
-HISTORIAL_FILE = "historial_notificaciones.json"
-CHECKLIST_FILE = "checklist_diario.json"
+arranque = Arranque(_INICIO_PROCESO)
+arranque.marcar("importaciones")
+
+def precargar_graficas():
+    """Calienta matplotlib y NumPy en segundo plano para que Stats abra rápido"""
+    if BACKEND_GRAFICAS != "matplotlib":
+        return
+
+    def cargar():
+        try:
+            with span("precargar_graficas"):
+                cargar_matplotlib()
+                cargar_numpy()
+        except Exception as e:
+            print(f"Error precargando gráficas: {e}")
+    threading.Thread(target=cargar, daemon=True).start()
+
+# Color de fondo de cada medicamento en la lista según su urgencia
+COLORES_URGENCIA = {
+    URGENTE: (1, 0.8, 0.8, 1),       # Rojo más intenso para urgente
+    ADVERTENCIA: (1, 0.9, 0.6, 1),   # Amarillo más intenso para advertencia
+    NORMAL: (0.8, 1, 0.8, 1),        # Verde más intenso para normal
+}
 
 
 class LoginScreen(Screen):
@@ -54,35 +84,64 @@ class LoginScreen(Screen):
         if not nombre:
             self.ids.info_label.text = "[color=#FF0000]Debes ingresar un nombre[/color]"
             return
-        with open(USUARIO_FILE, "w", encoding="utf-8") as f:
-            json.dump({"nombre": nombre}, f)
+        escribir_json_atomico(USUARIO_FILE, {"nombre": nombre})
         self.manager.current = "main"
         self.manager.get_screen("main").bienvenida()
 
+class FilaMedicamento(RecycleDataViewBehavior, Button):
+    """Fila reutilizable de la lista de medicamentos (RecycleView)"""
+    indice = NumericProperty(0)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.indice = index
+        return super().refresh_view_attrs(rv, index, data)
+
+    def on_release(self):
+        App.get_running_app().root.get_screen("main").mostrar_opciones(self.indice)
+
+
 class MainScreen(Screen):
-    medicamentos = ListProperty([])
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.medicamentos = []
-        self.checklist_diario = {}
         self.usuario_actual = ""
+        self.cache_graficas = CacheGraficas(directorio=CACHE_DIR)
+        self.renderizador = RenderizadorGraficas(
+            self.cache_graficas, lambda callback: Clock.schedule_once(lambda dt: callback(), 0))
+        # Los guardados de un mismo frame se escriben juntos en el siguiente
+        self.nucleo = Tracker(programar=lambda callback, segundos: Clock.schedule_once(lambda dt: callback(), segundos))
+        self.nucleo.al_guardar = self.programar_avisos
+        self.nucleo.al_eliminar = self.cancelar_avisos
         self.load_meds()
         self.load_checklist()
         self.load_usuario()
-        self.iniciar_notificaciones_thread = None
-        self.dose_reminder_thread = None
-        self.notification_thread = None
-        self.stop_notifications = False
-        self.historial_notificaciones = []
+        # Los avisos vencen en el hilo del planificador y se atienden en el de la UI
+        self.planificador = Planificador(lambda clave: Clock.schedule_once(lambda dt: self.aviso_vencido(clave), 0))
+        # En Android además se registran en AlarmManager, para que suenen con la app cerrada
+        self.alarmas = crear_alarmas()
+        # Los cruces de stock de un mismo frame se avisan juntos en el siguiente
+        self.cruces_stock = []
+        self._aviso_stock = Clock.create_trigger(lambda dt: self.avisar_stock_bajo())
         Clock.schedule_once(lambda dt: self.load_meds_and_setup(), 0)
 
+    # El estado vive en el núcleo (nucleo.Tracker), compartido con la versión Flet
+    medicamentos = property(lambda self: self.nucleo.medicamentos)
+    checklist_diario = property(lambda self: self.nucleo.checklist)
+    historial_notificaciones = property(lambda self: self.nucleo.historial)
+    archivo_historial = property(lambda self: self.nucleo.archivo)
+    storage = property(lambda self: self.nucleo.storage)
+    guardado = property(lambda self: self.nucleo.guardado)
+    journal = property(lambda self: self.nucleo.journal)
+    inventario = property(lambda self: self.nucleo.inventario)
+    horario = property(lambda self: self.nucleo.horario)
+    columnas = property(lambda self: self.nucleo.columnas)
+
     def load_meds_and_setup(self):
         self.load_meds()
         self.load_historial()
         self.refresh_list()
-        self.start_notification_system()
-        self.start_dose_reminders()
+        self.journal.iniciar()
+        self.iniciar_avisos()
 
     def load_usuario(self):
         """Carga el usuario actual desde el archivo"""
@@ -113,164 +172,116 @@ class MainScreen(Screen):
 
     # ---------------- persistence ----------------
     def load_meds(self):
-        try:
-            if os.path.exists(MEDICAMENTOS_FILE):
-                with open(MEDICAMENTOS_FILE, "r", encoding="utf-8") as f:
-                    contenido = f.read().strip()
-                    self.medicamentos = json.loads(contenido) if contenido else []
-            else:
-                self.medicamentos = []
-        except Exception:
-            self.medicamentos = []
+        self.nucleo.cargar()
 
     def save_meds(self):
+        self.nucleo.save_meds()
+
+    def save_med(self, indice):
+        """Guarda solo el medicamento modificado (y reprograma sus avisos)"""
+        self.nucleo.save_med(indice)
+
+    def save_meds_cambiados(self, indices):
+        """Guarda varios medicamentos modificados en una sola escritura"""
+        self.nucleo.save_meds_cambiados(indices)
+
+    def flush(self):
+        """Escribe ya los guardados pendientes (pausa o cierre de la app)"""
+        self.nucleo.flush()
+
+    def leer_avisos_servicio(self):
+        """Toma las dosis que el servicio de avisos ya notificó mientras la app estaba en pausa"""
         try:
-            with open(MEDICAMENTOS_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.medicamentos, f, ensure_ascii=False, indent=2)
+            # Se lee con una instancia aparte, cerrada enseguida, y no con
+            # self.nucleo.storage: en JSONStorage, load_meds reemplaza la lista
+            # con la que el núcleo reescribe el archivo en cada guardado
+            storage = crear_storage()
+            try:
+                marcas = {med.get("id"): med.get("ultima_notif_dosis") for med in storage.load_meds()}
+            finally:
+                storage.close()
         except Exception as e:
-            print(f"Error guardando medicamentos: {e}")
+            print(f"Error leyendo avisos del servicio: {e}")
+            return
+        for med in self.medicamentos:
+            marca = marcas.get(med["id"])
+            # Mismo formato fijo: comparar el texto compara las fechas
+            if marca and marca > (med.get("ultima_notif_dosis") or ""):
+                med["ultima_notif_dosis"] = marca
+                self.programar_avisos(med)
     
     def load_checklist(self):
         """Carga el checklist diario"""
-        try:
-            if os.path.exists(CHECKLIST_FILE):
-                with open(CHECKLIST_FILE, "r", encoding="utf-8") as f:
-                    contenido = f.read().strip()
-                    data = json.loads(contenido) if contenido else {}
-                    
-                    # Solo cargar si es del día actual
-                    hoy = datetime.now().strftime("%Y-%m-%d")
-                    if data.get('fecha') == hoy:
-                        self.checklist_diario = data.get('medicamentos', {})
-                    else:
-                        self.checklist_diario = {}
-            else:
-                self.checklist_diario = {}
-        except Exception as e:
-            print(f"Error cargando checklist: {e}")
-            self.checklist_diario = {}
+        self.nucleo.cargar_checklist()
     
     def save_checklist(self):
         """Guarda el checklist diario"""
-        try:
-            hoy = datetime.now().strftime("%Y-%m-%d")
-            data = {
-                'fecha': hoy,
-                'medicamentos': self.checklist_diario
-            }
-            with open(CHECKLIST_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error guardando checklist: {e}")
+        self.nucleo.save_checklist()
+
+    def save_checklist_item(self, indice):
+        """Guarda solo la entrada del checklist que cambió"""
+        self.nucleo.save_checklist_item(indice)
     
+    # ---------------- diario de tomas ----------------
+    def registrar_evento(self, indice, tipo, cantidad):
+        """Agrega una toma/deshacer/compra al inventario y actualiza cantidad y fecha de fin"""
+        return self.nucleo.registrar_evento(indice, tipo, cantidad)
+
+    def deshacer_toma(self, indice, cantidad=None):
+        """Devuelve la cantidad de una toma de hoy que se desmarcó (una dosis por defecto)"""
+        self.nucleo.deshacer_toma(indice, cantidad)
+
     # ---------------- historial notificaciones ----------------
     def load_historial(self):
-        try:
-            if os.path.exists(HISTORIAL_FILE):
-                with open(HISTORIAL_FILE, "r", encoding="utf-8") as f:
-                    contenido = f.read().strip()
-                    self.historial_notificaciones = json.loads(contenido) if contenido else []
-            else:
-                self.historial_notificaciones = []
-        except Exception:
-            self.historial_notificaciones = []
+        self.nucleo.cargar_historial()
 
-    def save_historial(self):
-        try:
-            with open(HISTORIAL_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.historial_notificaciones, f, ensure_ascii=False, indent=4)
-        except Exception:
-            pass
-
-    def agregar_al_historial(self, tipo, medicamento, mensaje):
+    def agregar_al_historial(self, tipo, medicamento, mensaje, detalle=None):
         """Agrega una notificación al historial"""
-        notificacion = {
-            "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "tipo": tipo,  # "dosis", "stock_bajo", "agotado"
-            "medicamento": medicamento,
-            "mensaje": mensaje,
-            "leida": False
-        }
-        self.historial_notificaciones.insert(0, notificacion)  # Más recientes primero
-        # Mantener solo las últimas 50 notificaciones
-        if len(self.historial_notificaciones) > 50:
-            self.historial_notificaciones = self.historial_notificaciones[:50]
-        self.save_historial()
+        self.nucleo.agregar_notificacion(tipo, medicamento, mensaje, detalle)
 
     # ---------------- lista UI ----------------
+    @medir("refresh_list")
     def refresh_list(self):
+        debidos_hoy = set(self.horario.debidos(datetime.now()))
+        # Días restantes y urgencia de toda la lista en una sola pasada
+        dias, urgencias = self.columnas.calcular()
+        self.ids.lista_medicamentos.data = [
+            self._datos_fila(i, dias[i], int(urgencias[i]), i in debidos_hoy)
+            for i in range(len(self.medicamentos))
+        ]
+
+    def refresh_row(self, indice):
+        """Actualiza solo la fila de un medicamento en la lista"""
         lista = self.ids.lista_medicamentos
-        lista.clear_widgets()
-        for i, m in enumerate(self.medicamentos):
-            # Calcular días restantes
-            dias_restantes = "N/A"
-            if m.get("fecha_fin"):
-                try:
-                    fecha_fin = datetime.strptime(m["fecha_fin"], "%Y-%m-%d %H:%M")
-                    dias_restantes = (fecha_fin - datetime.now()).days
-                    if dias_restantes < 0:
-                        dias_restantes = "¡AGOTADO!"
-                    else:
-                        dias_restantes = f"{dias_restantes} días"
-                except:
-                    dias_restantes = "Error"
-            
-            # Color de alerta
-            color_texto = "white"
-            if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                try:
-                    dias_num = int(dias_restantes.split()[0])
-                    if dias_num <= 3:
-                        color_texto = "red"
-                except:
-                    pass
-            
-            # Color de fondo según estado
-            print(f"DEBUG COLOR: medicamento={m['nombre']}, dias_restantes={dias_restantes}, tipo={type(dias_restantes)}")
-            if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                try:
-                    dias_num = int(dias_restantes.split()[0])
-                    print(f"DEBUG COLOR: dias_num={dias_num}")
-                    if dias_num <= 3:
-                        bg_color = (1, 0.8, 0.8, 1)  # Rojo más intenso para urgente
-                        print("DEBUG COLOR: usando rojo")
-                    elif dias_num <= 7:
-                        bg_color = (1, 0.9, 0.6, 1)  # Amarillo más intenso para advertencia
-                        print("DEBUG COLOR: usando amarillo")
-                    else:
-                        bg_color = (0.8, 1, 0.8, 1)  # Verde más intenso para normal
-                        print("DEBUG COLOR: usando verde")
-                except Exception as e:
-                    bg_color = (1, 0.7, 0.9, 1)  # Rosado intenso para errores
-                    print(f"DEBUG COLOR: error en parsing, usando rosado: {e}")
-            else:
-                bg_color = (1, 0.6, 0.8, 1)  # ROSADO MUY VISIBLE para sin fecha
-                print("DEBUG COLOR: sin fecha, usando rosado intenso")
-            
-            # Verificar si debe tomarse hoy y si ya se tomó
-            debe_tomarse_hoy = self.es_dia_de_toma(m, datetime.now())
-            ya_tomado = self.checklist_diario.get(str(i), False)
-            
-            # Emoji de estado
-            estado_emoji = "✅" if ya_tomado else "⏰" if debe_tomarse_hoy else "💊"
-            
-            # Color de fondo adicional para medicamentos completados
-            if ya_tomado and debe_tomarse_hoy:
-                bg_color = (0.9, 1, 0.9, 1)  # Verde claro para completado
-        
-            item = Button(
-                text=f"{estado_emoji} {m['nombre']} - {m.get('descripcion', 'Sin descripción')}\n📦 {m['presentacion']} • Cantidad: {m.get('cantidad_actual', m['cantidad_total'])} • Dosis: {m['dosis']}\n⏰ Cada {m['frecuencia_dias']} días | Se acaba en: {dias_restantes}\n{'✅ TOMADO HOY' if ya_tomado and debe_tomarse_hoy else '📋 Pendiente hoy' if debe_tomarse_hoy else ''}",
-                size_hint_y=None,
-                height=dp(110),
-                text_size=(None, None),
-                halign='left',
-                valign='middle',
-                background_color=bg_color,
-                color=(0.2, 0.2, 0.2, 1),
-                font_size='14sp'
-            )
-            item.bind(on_release=lambda x, idx=i: self.mostrar_opciones(idx))
-            lista.add_widget(item)
+        if indice >= len(lista.data):
+            self.refresh_list()
+            return
+        dias, urgencia = self.columnas.fila(indice)
+        debe_tomarse_hoy = self.horario.es_dia_de_toma(indice, datetime.now())
+        lista.data[indice] = self._datos_fila(indice, dias, urgencia, debe_tomarse_hoy)
+
+    def _datos_fila(self, i, dias, urgencia, debe_tomarse_hoy):
+        """Texto y color de la fila `i` de la lista"""
+        m = self.medicamentos[i]
+        dias_restantes = formatear_dias(dias, urgencia, sin_fecha="N/A")
+
+        # Color de fondo según estado
+        bg_color = COLORES_URGENCIA.get(urgencia, (1, 0.6, 0.8, 1))  # ROSADO MUY VISIBLE para sin fecha
+
+        # Verificar si ya se tomó hoy
+        ya_tomado = self.checklist_diario.get(str(i), False)
+
+        # Emoji de estado
+        estado_emoji = "✅" if ya_tomado else "⏰" if debe_tomarse_hoy else "💊"
+
+        # Color de fondo adicional para medicamentos completados
+        if ya_tomado and debe_tomarse_hoy:
+            bg_color = (0.9, 1, 0.9, 1)  # Verde claro para completado
+
+        return {
+            "text": f"{estado_emoji} {m['nombre']} - {m.get('descripcion', 'Sin descripción')}\n📦 {m['presentacion']} • Cantidad: {m.get('cantidad_actual', m['cantidad_total'])} • Dosis: {m['dosis']}\n⏰ Cada {m['frecuencia_dias']} días | Se acaba en: {dias_restantes}\n{'✅ TOMADO HOY' if ya_tomado and debe_tomarse_hoy else '📋 Pendiente hoy' if debe_tomarse_hoy else ''}",
+            "background_color": bg_color,
+        }
 
     # ---------------- agregar / editar ----------------
     def agregar_medicamento(self):
@@ -281,6 +292,7 @@ class MainScreen(Screen):
         dosis_text = self.ids.m_dosis.text.strip()
         frecuencia_text = self.ids.m_frecuencia.text.strip()
         inicio_text = self.ids.m_inicio.text.strip()
+        horas_text = self.ids.m_horas.text.strip()
 
         if not nombre:
             self._show_snackbar("Debes ingresar el nombre del medicamento")
@@ -298,6 +310,14 @@ class MainScreen(Screen):
             frecuencia = int(frecuencia_text) if frecuencia_text else 1
         except Exception:
             frecuencia = 1
+        try:
+            horas, intervalo_horas = parsear_horas(horas_text)
+        except ValueError:
+            self._show_snackbar("Horarios no válidos: usa 08:00, 20:00 o cada N horas (8h)")
+            return
+        if intervalo_horas:
+            # Cada N horas: la frecuencia en días sale del intervalo
+            frecuencia = max(1, intervalo_horas // 24)
 
         inicio_valido = None
         if inicio_text:
@@ -307,9 +327,6 @@ class MainScreen(Screen):
             except Exception:
                 inicio_valido = None
 
-        # Calcular fecha de finalización
-        fecha_fin = self.calcular_fecha_fin(cantidad, dosis, frecuencia, inicio_valido)
-        
         nuevo = {
             "nombre": nombre,
             "descripcion": descripcion or "Sin descripción",
@@ -318,11 +335,14 @@ class MainScreen(Screen):
             "cantidad_actual": cantidad,
             "dosis": dosis,
             "frecuencia_dias": frecuencia,
+            "horas": horas,
+            "intervalo_horas": intervalo_horas,
             "inicio": inicio_valido,
-            "fecha_fin": fecha_fin,
+            "fecha_fin": None,  # la proyecta el inventario
             "ultima_alerta": None,
             "notificaciones_activas": False
         }
+        asegurar_id(nuevo)
 
         # Control de duplicados (solo si NO estás editando)
         if not hasattr(self, "indice_editando"):
@@ -330,24 +350,21 @@ class MainScreen(Screen):
                 if med["nombre"].strip().lower() == nombre.strip().lower() and med["presentacion"].strip().lower() == presentacion.strip().lower():
                     self._show_snackbar("Ese medicamento ya está registrado")
                     return
-            self.medicamentos.append(nuevo)
+            self.nucleo.agregar(nuevo, cantidad)
             self._show_snackbar(f"{nombre} agregado")
         else:
             idx = self.indice_editando
             if 0 <= idx < len(self.medicamentos):
-                # Preservar cantidad actual al editar
-                med_anterior = self.medicamentos[idx]
-                nuevo["cantidad_actual"] = med_anterior.get("cantidad_actual", cantidad)
-                # Recalcular fecha de fin con los nuevos datos
-                nuevo["fecha_fin"] = self.calcular_fecha_fin(nuevo["cantidad_actual"], dosis, frecuencia, inicio_valido)
-                # Debug: imprimir valores
-                print(f"DEBUG EDIT: cantidad_actual={nuevo['cantidad_actual']}, dosis={dosis}, frecuencia={frecuencia}, inicio={inicio_valido}")
-                print(f"DEBUG EDIT: nueva fecha_fin={nuevo['fecha_fin']}")
-                self.medicamentos[idx] = nuevo
+                # Conserva id y cantidad actual, y proyecta de nuevo desde ahora
+                self.nucleo.actualizar(idx, nuevo)
+                evento("editar_medicamento", cantidad_actual=nuevo["cantidad_actual"],
+                       dosis=dosis, frecuencia=frecuencia, fecha_fin=nuevo["fecha_fin"])
                 del self.indice_editando
                 self._show_snackbar(f"{nombre} actualizado")
+                self.refresh_list()
+                self.limpiar_campos()
+                return
 
-        self.save_meds()
         self.refresh_list()
         # limpiar inputs
         self.limpiar_campos()
@@ -356,17 +373,8 @@ class MainScreen(Screen):
         med = self.medicamentos[index]
         
         # Calcular días restantes para mostrar en el popup
-        dias_restantes = "N/A"
-        if med.get("fecha_fin"):
-            try:
-                fecha_fin = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
-                dias_restantes = (fecha_fin - datetime.now()).days
-                if dias_restantes < 0:
-                    dias_restantes = "¡AGOTADO!"
-                else:
-                    dias_restantes = f"{dias_restantes} días"
-            except:
-                dias_restantes = "Error"
+        dias, urgencia = self.columnas.fila(index)
+        dias_restantes = formatear_dias(dias, urgencia, sin_fecha="N/A")
         
         content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(25))
         
@@ -382,20 +390,11 @@ class MainScreen(Screen):
         content.add_widget(info_label)
         
         # Verificar si debe tomarse hoy y si ya se tomó
-        debe_tomarse_hoy = self.es_dia_de_toma(med, datetime.now())
+        debe_tomarse_hoy = self.horario.es_dia_de_toma(index, datetime.now())
         ya_tomado = self.checklist_diario.get(str(index), False)
         
         # Verificar si necesita mostrar botón comprar (≤3 días restantes)
-        mostrar_comprar = False
-        if isinstance(dias_restantes, str) and "días" in dias_restantes:
-            try:
-                dias_num = int(dias_restantes.split()[0])
-                if dias_num <= 3:
-                    mostrar_comprar = True
-            except:
-                pass
-        elif dias_restantes == "¡AGOTADO!":
-            mostrar_comprar = True
+        mostrar_comprar = urgencia in (URGENTE, AGOTADO)
         
         # Crear menú de opciones
         opciones_layout = BoxLayout(orientation='horizontal', spacing=dp(5), size_hint_y=None, height=dp(40))
@@ -462,8 +461,7 @@ class MainScreen(Screen):
 
     def eliminar_medicamento(self, index):
         try:
-            med = self.medicamentos.pop(index)
-            self.save_meds()
+            med = self.nucleo.eliminar(index)
             self.refresh_list()
             self._show_snackbar(f"{med.get('nombre','Medicamento')} eliminado")
         except Exception:
@@ -478,6 +476,7 @@ class MainScreen(Screen):
         self.ids.m_dosis.text = str(med.get("dosis",""))
         self.ids.m_frecuencia.text = str(med.get("frecuencia_dias",""))
         self.ids.m_inicio.text = med.get("inicio") or ""
+        self.ids.m_horas.text = formatear_horas(med)
         self.indice_editando = index
         self._show_snackbar(f"Editando: {med.get('nombre','')}")
 
@@ -518,180 +517,64 @@ class MainScreen(Screen):
         self.ids.m_presentacion.text = text_item
         self.dropdown.dismiss()
 
-    def crear_grafica_barras(self):
-        """Crea gráfica de barras de duración de medicamentos"""
-        if not self.medicamentos:
-            return None
-        
-        # Configurar estilo
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=(10, 6))
-        fig.patch.set_facecolor('white')
-        
-        nombres = []
-        dias = []
-        colores = []
-        
-        for med in self.medicamentos:
-            dias_restantes = self.calcular_dias_restantes(med)
-            nombres.append(med['nombre'][:15] + '...' if len(med['nombre']) > 15 else med['nombre'])
-            
-            if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                try:
-                    dias_num = int(dias_restantes.split()[0])
-                    dias.append(dias_num)
-                    
-                    # Colores según urgencia
-                    if dias_num <= 3:
-                        colores.append('#FF6B6B')  # Rojo
-                    elif dias_num <= 7:
-                        colores.append('#FFB347')  # Naranja
-                    else:
-                        colores.append('#4ECDC4')  # Verde azulado
-                except:
-                    dias.append(0)
-                    colores.append('#95A5A6')  # Gris
-            else:
-                dias.append(0)
-                colores.append('#95A5A6')  # Gris
-        
-        # Crear gráfica
-        bars = ax.bar(nombres, dias, color=colores, alpha=0.8, edgecolor='white', linewidth=2)
-        
-        # Personalizar
-        ax.set_title('📊 Días Restantes por Medicamento', fontsize=16, fontweight='bold', pad=20)
-        ax.set_xlabel('Medicamentos', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Días Restantes', fontsize=12, fontweight='bold')
-        ax.grid(axis='y', alpha=0.3, linestyle='--')
-        
-        # Rotar etiquetas del eje X
-        plt.xticks(rotation=45, ha='right')
-        
-        # Agregar valores en las barras
-        for bar, valor in zip(bars, dias):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                   f'{valor}d', ha='center', va='bottom', fontweight='bold')
-        
-        plt.tight_layout()
-        
-        # Convertir a imagen para Kivy
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return buf
+    # ---------------- gráficas ----------------
+    def grafica_barras(self):
+        return grafica_barras(self.medicamentos, self.columnas)
     
-    def crear_grafica_pastel(self):
-        """Crea gráfica de pastel del estado de medicamentos"""
-        if not self.medicamentos:
-            return None
-        
-        # Contar estados
-        activos = 0
-        por_agotar = 0
-        agotados = 0
-        
-        for med in self.medicamentos:
-            dias_restantes = self.calcular_dias_restantes(med)
-            if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                try:
-                    dias_num = int(dias_restantes.split()[0])
-                    if dias_num <= 7:
-                        por_agotar += 1
-                    else:
-                        activos += 1
-                except:
-                    agotados += 1
-            else:
-                agotados += 1
-        
-        # Crear gráfica
-        fig, ax = plt.subplots(figsize=(8, 8))
-        fig.patch.set_facecolor('white')
-        
-        labels = ['Activos', 'Por Agotar (≤7d)', 'Agotados']
-        sizes = [activos, por_agotar, agotados]
-        colors = ['#4ECDC4', '#FFB347', '#FF6B6B']
-        explode = (0.05, 0.05, 0.05)
-        
-        # Filtrar valores cero
-        filtered_data = [(label, size, color, exp) for label, size, color, exp in zip(labels, sizes, colors, explode) if size > 0]
-        if filtered_data:
-            labels, sizes, colors, explode = zip(*filtered_data)
-        
-        wedges, texts, autotexts = ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%',
-                                         explode=explode, shadow=True, startangle=90)
-        
-        # Personalizar texto
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontweight('bold')
-            autotext.set_fontsize(12)
-        
-        for text in texts:
-            text.set_fontsize(11)
-            text.set_fontweight('bold')
-        
-        ax.set_title('📈 Estado de Medicamentos', fontsize=16, fontweight='bold', pad=20)
-        
-        # Convertir a imagen
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return buf
+    def grafica_pastel(self):
+        return grafica_pastel(self.medicamentos, self.columnas)
     
-    def crear_grafica_lineas(self):
-        """Crea gráfica de líneas de tendencia de consumo"""
-        if not self.medicamentos:
+    def grafica_lineas(self):
+        return grafica_lineas(self.medicamentos)
+
+    def pedir_grafica(self, layout, grafica, alto, nombre):
+        """Agrega la gráfica al layout
+
+        Con el backend nativo se dibuja enseguida en el canvas. Con matplotlib se
+        agrega un marcador que se reemplaza por el PNG cuando está listo y se
+        devuelve el pedido para poder cancelarlo.
+        """
+        tipo, datos = grafica
+        if BACKEND_GRAFICAS != "matplotlib":
+            layout.add_widget(graficas_kivy.crear(tipo, datos, size_hint_y=None, height=dp(alto)))
             return None
-        
-        # Simular datos de consumo por mes (últimos 6 meses)
-        meses = ['Ago', 'Sep', 'Oct', 'Nov', 'Dic', 'Ene']
-        consumo_total = []
-        consumo_activos = []
-        
-        # Generar datos basados en medicamentos actuales
-        base_consumo = len(self.medicamentos)
-        for i in range(6):
-            # Simular variación en el consumo
-            variacion = np.random.randint(-2, 4)
-            consumo_total.append(max(1, base_consumo + variacion))
-            consumo_activos.append(max(0, consumo_total[i] - np.random.randint(0, 3)))
-        
-        # Crear gráfica
-        fig, ax = plt.subplots(figsize=(10, 6))
-        fig.patch.set_facecolor('white')
-        
-        ax.plot(meses, consumo_total, marker='o', linewidth=3, markersize=8, 
-               color='#3498DB', label='Total Medicamentos', markerfacecolor='white', markeredgewidth=2)
-        ax.plot(meses, consumo_activos, marker='s', linewidth=3, markersize=8, 
-               color='#2ECC71', label='Medicamentos Activos', markerfacecolor='white', markeredgewidth=2)
-        
-        # Personalizar
-        ax.set_title('📈 Tendencia de Consumo (Últimos 6 Meses)', fontsize=16, fontweight='bold', pad=20)
-        ax.set_xlabel('Mes', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Número de Medicamentos', fontsize=12, fontweight='bold')
-        ax.grid(True, alpha=0.3, linestyle='--')
-        ax.legend(loc='upper left', frameon=True, fancybox=True, shadow=True)
-        
-        # Agregar valores en los puntos
-        for i, (total, activo) in enumerate(zip(consumo_total, consumo_activos)):
-            ax.annotate(f'{total}', (i, total), textcoords="offset points", xytext=(0,10), ha='center', fontweight='bold')
-            ax.annotate(f'{activo}', (i, activo), textcoords="offset points", xytext=(0,-15), ha='center', fontweight='bold')
-        
-        plt.tight_layout()
-        
-        # Convertir a imagen
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return buf
+
+        marcador = Label(
+            text="⏳ Generando gráfica...",
+            size_hint_y=None,
+            height=dp(alto),
+            color=(0.5, 0.5, 0.5, 1)
+        )
+        layout.add_widget(marcador)
+
+        def listo(png):
+            if marcador.parent is None:
+                return
+            img = Image(source='', size_hint_y=None, height=dp(alto))
+            img.texture = CoreImage(BytesIO(png), ext='png').texture
+            posicion = layout.children.index(marcador)
+            layout.remove_widget(marcador)
+            layout.add_widget(img, index=posicion)
+
+        def error(e):
+            print(f"Error creando gráfica de {nombre}: {e}")
+            marcador.text = "⚠️ No se pudo generar la gráfica"
+
+        clave, render = pedido_png(tipo, datos)
+        return self.renderizador.pedir(clave, render, listo, error)
+
+    def exportar_graficas(self):
+        """Guarda las tres gráficas como PNG (requiere matplotlib)"""
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        for grafica in (self.grafica_barras(), self.grafica_pastel(), self.grafica_lineas()):
+            tipo = grafica[0]
+            ruta = os.path.join(EXPORT_DIR, f"grafica_{tipo}.png")
+            clave, render = pedido_png(*grafica)
+            self.renderizador.pedir(
+                clave, render,
+                lambda png, ruta=ruta: (escribir_bytes_atomico(ruta, png), self._show_snackbar(f"Gráfica guardada en {ruta}")),
+                lambda e: self._show_snackbar(f"No se pudo exportar la gráfica: {e}"),
+            )
     
     def mostrar_estadisticas(self):
         """Muestra estadísticas con gráficas visuales"""
@@ -718,6 +601,7 @@ class MainScreen(Screen):
         stats_layout = BoxLayout(orientation='vertical', spacing=dp(15), size_hint_y=None)
         stats_layout.bind(minimum_height=stats_layout.setter('height'))
         
+        pedidos = []
         if not self.medicamentos:
             no_data = Label(
                 text="📭 No hay medicamentos para mostrar estadísticas",
@@ -729,7 +613,7 @@ class MainScreen(Screen):
         else:
             # Estadísticas generales
             total_meds = len(self.medicamentos)
-            meds_activos = len([m for m in self.medicamentos if self.calcular_dias_restantes(m) != "¡AGOTADO!"])
+            meds_activos = total_meds - self.columnas.contar(self.columnas.calcular()[1])[AGOTADO]
             
             stats_generales = Label(
                 text=f"📈 RESUMEN GENERAL\n\n• Total medicamentos: {total_meds}\n• Medicamentos activos: {meds_activos}\n• Medicamentos agotados: {total_meds - meds_activos}",
@@ -741,42 +625,20 @@ class MainScreen(Screen):
             )
             stats_layout.add_widget(stats_generales)
             
-            # Gráfica de barras
-            try:
-                grafica_barras = self.crear_grafica_barras()
-                if grafica_barras:
-                    img_barras = Image(source='', size_hint_y=None, height=dp(250))
-                    img_barras.texture = CoreImage(grafica_barras, ext='png').texture
-                    stats_layout.add_widget(img_barras)
-            except Exception as e:
-                print(f"Error creando gráfica de barras: {e}")
-            
-            # Gráfica de pastel
-            try:
-                grafica_pastel = self.crear_grafica_pastel()
-                if grafica_pastel:
-                    img_pastel = Image(source='', size_hint_y=None, height=dp(300))
-                    img_pastel.texture = CoreImage(grafica_pastel, ext='png').texture
-                    stats_layout.add_widget(img_pastel)
-            except Exception as e:
-                print(f"Error creando gráfica de pastel: {e}")
-            
-            # Gráfica de líneas
-            try:
-                grafica_lineas = self.crear_grafica_lineas()
-                if grafica_lineas:
-                    img_lineas = Image(source='', size_hint_y=None, height=dp(250))
-                    img_lineas.texture = CoreImage(grafica_lineas, ext='png').texture
-                    stats_layout.add_widget(img_lineas)
-            except Exception as e:
-                print(f"Error creando gráfica de líneas: {e}")
+            # Gráficas: se muestran marcadores y se renderizan en paralelo en segundo plano
+            pedidos = [
+                self.pedir_grafica(stats_layout, self.grafica_barras(), 250, "barras"),
+                self.pedir_grafica(stats_layout, self.grafica_pastel(), 300, "pastel"),
+                self.pedir_grafica(stats_layout, self.grafica_lineas(), 250, "líneas"),
+            ]
+            pedidos = [pedido for pedido in pedidos if pedido is not None]
             
             # Estadísticas de consumo
             duraciones = []
             for med in self.medicamentos:
-                if med.get('fecha_inicio') and med.get('fecha_fin'):
+                if med.get('inicio') and med.get('fecha_fin'):
                     try:
-                        inicio = datetime.strptime(med['fecha_inicio'], "%Y-%m-%d %H:%M")
+                        inicio = datetime.strptime(med['inicio'], "%Y-%m-%d %H:%M")
                         fin = datetime.strptime(med['fecha_fin'], "%Y-%m-%d %H:%M")
                         duracion = (fin - inicio).days
                         if duracion > 0:
@@ -820,10 +682,30 @@ class MainScreen(Screen):
         )
         
         btn_cerrar.bind(on_release=popup.dismiss)
+        if self.medicamentos and matplotlib_disponible():
+            btn_exportar = Button(
+                text="💾 Exportar PNG",
+                size_hint_y=None,
+                height=dp(40),
+                background_color=(0.2, 0.6, 0.9, 1),
+                color=(1, 1, 1, 1)
+            )
+            btn_exportar.bind(on_release=lambda x: self.exportar_graficas())
+            content.add_widget(btn_exportar)
         content.add_widget(btn_cerrar)
+        # Si se cierra antes de que terminen, los renders pendientes se descartan
+        popup.bind(on_dismiss=lambda *args: [pedido.cancelar() for pedido in pedidos])
         
         popup.open()
     
+    def horas_del_dia(self, plan, fecha):
+        """Horas de las tomas de `fecha` para el calendario (" · 08:00, 20:00")"""
+        if plan is None:
+            return ""
+        dia = datetime(fecha.year, fecha.month, fecha.day)
+        tomas = plan.entre(dia, dia + timedelta(days=1))
+        return " · " + ", ".join(t.strftime("%H:%M") for t in tomas) if tomas else ""
+
     def mostrar_calendario(self):
         """Muestra calendario con próximas tomas y fechas importantes"""
         content = BoxLayout(orientation='vertical', spacing=dp(10), padding=dp(20))
@@ -871,15 +753,19 @@ class MainScreen(Screen):
             )
             cal_layout.add_widget(hoy_titulo)
             
-            medicamentos_hoy = []
-            for i, med in enumerate(self.medicamentos):
-                if self.es_dia_de_toma(med, hoy):
-                    medicamentos_hoy.append(i)
+            medicamentos_hoy = self.horario.debidos(hoy)
+            # Solo se arman los planes de los medicamentos que tocan en la semana
+            planes = {}
+            
+            def plan_de(i):
+                if i not in planes:
+                    planes[i] = PlanTomas.desde_medicamento(self.medicamentos[i])
+                return planes[i]
             
             if medicamentos_hoy:
                 for i in medicamentos_hoy:
                     item_hoy = Button(
-                        text=f"💊 {self.medicamentos[i]['nombre']} - Dosis: {self.medicamentos[i]['dosis']}",
+                        text=f"💊 {self.medicamentos[i]['nombre']} - Dosis: {self.medicamentos[i]['dosis']}{self.horas_del_dia(plan_de(i), hoy)}",
                         size_hint_y=None,
                         height=dp(40),
                         background_color=(0.9, 1, 0.9, 1),
@@ -910,10 +796,7 @@ class MainScreen(Screen):
                 dia_nombre = fecha.strftime('%A')
                 fecha_str = fecha.strftime('%d/%m')
                 
-                medicamentos_dia = []
-                for med in self.medicamentos:
-                    if self.es_dia_de_toma(med, fecha):
-                        medicamentos_dia.append(med)
+                debidos_dia = self.horario.debidos(fecha)
                 
                 # Layout para cada día
                 dia_layout = BoxLayout(orientation='vertical', spacing=dp(3), size_hint_y=None)
@@ -928,10 +811,11 @@ class MainScreen(Screen):
                 )
                 dia_layout.add_widget(dia_header)
                 
-                if medicamentos_dia:
-                    for med in medicamentos_dia:
+                if debidos_dia:
+                    for j in debidos_dia:
+                        med = self.medicamentos[j]
                         med_item = Label(
-                            text=f"  💊 {med['nombre']} ({med['dosis']})",
+                            text=f"  💊 {med['nombre']} ({med['dosis']}){self.horas_del_dia(plan_de(j), fecha)}",
                             size_hint_y=None,
                             height=dp(25),
                             color=(0.4, 0.4, 0.4, 1),
@@ -962,16 +846,12 @@ class MainScreen(Screen):
             )
             cal_layout.add_widget(finalizacion_titulo)
             
-            finalizaciones = []
-            for med in self.medicamentos:
-                dias_restantes = self.calcular_dias_restantes(med)
-                if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                    try:
-                        dias_num = int(dias_restantes.split()[0])
-                        if dias_num <= 14:  # Próximas 2 semanas
-                            finalizaciones.append((med, dias_num))
-                    except:
-                        continue
+            dias_restantes, urgencias = self.columnas.calcular(hoy)
+            finalizaciones = [
+                (self.medicamentos[i], int(dias_restantes[i]))
+                for i in range(len(self.medicamentos))
+                if int(urgencias[i]) in (URGENTE, ADVERTENCIA, NORMAL) and dias_restantes[i] <= 14  # Próximas 2 semanas
+            ]
             
             finalizaciones.sort(key=lambda x: x[1])  # Ordenar por días restantes
             
@@ -1030,44 +910,27 @@ class MainScreen(Screen):
         popup.open()
     
     def es_dia_de_toma(self, medicamento, fecha):
-        """Determina si un medicamento debe tomarse en una fecha específica"""
-        # Verificar fecha de inicio - usar tanto 'fecha_inicio' como 'inicio'
-        fecha_inicio_str = medicamento.get('fecha_inicio') or medicamento.get('inicio')
-        if not fecha_inicio_str:
-            # Si no hay fecha de inicio, asumir que debe tomarse (medicamento activo)
-            return True
-        
-        try:
-            inicio = datetime.strptime(fecha_inicio_str, "%Y-%m-%d %H:%M")
-            frecuencia = int(medicamento.get('frecuencia_dias', 1))
-            
-            # Calcular días desde el inicio
-            dias_desde_inicio = (fecha.date() - inicio.date()).days
-            
-            # Verificar si es día de toma
-            return dias_desde_inicio >= 0 and dias_desde_inicio % frecuencia == 0
-        except:
-            # Si hay error en el parsing, asumir que debe tomarse
-            return True
+        """Determina si un medicamento debe tomarse en una fecha específica
+
+        Para medicamentos de la lista usar `self.horario`, que no vuelve a parsear fechas.
+        """
+        return es_dia_de_toma(medicamento, fecha)
     
     def calcular_dias_restantes(self, medicamento):
         """Calcula días restantes para un medicamento"""
-        if not medicamento.get("fecha_fin"):
-            return "Sin fecha"
-        
-        try:
-            fecha_fin = datetime.strptime(medicamento["fecha_fin"], "%Y-%m-%d %H:%M")
-            dias_restantes = (fecha_fin - datetime.now()).days
-            if dias_restantes < 0:
-                return "¡AGOTADO!"
-            else:
-                return f"{dias_restantes} días"
-        except:
-            return "Error"
+        return calcular_dias_restantes(medicamento)
     
+    TAMANO_PAGINA_HISTORIAL = 20
+    TODOS = "Todos"
+
     def mostrar_historial(self):
-        """Muestra el historial de notificaciones"""
+        """Muestra el historial de notificaciones, de a una página (más recientes primero)
+
+        Sin filtros muestra el historial reciente; con alguno, busca en el archivo completo.
+        """
         historial = self.historial_notificaciones
+        tamano = self.TAMANO_PAGINA_HISTORIAL
+        self.guardado.flush()  # que el archivo tenga también las notificaciones recién agregadas
         
         content = BoxLayout(orientation='vertical', spacing=dp(10), padding=dp(20))
         
@@ -1086,44 +949,111 @@ class MainScreen(Screen):
             color=(0.2, 0.2, 0.2, 1)
         )
         content.add_widget(titulo)
+
+        # Filtros del archivo: los valores salen de sus facetas (medicamentos, tipos y meses con avisos)
+        facetas = self.archivo_historial.facetas()
+        filtros_layout = BoxLayout(orientation='horizontal', spacing=dp(5), size_hint_y=None, height=dp(40))
+        spinners = {}
+        for campo, valores in (("medicamento", facetas["medicamento"]), ("tipo", facetas["tipo"]),
+                               ("mes", sorted(facetas["mes"], reverse=True))):
+            spinners[campo] = Spinner(
+                text=self.TODOS,
+                values=[self.TODOS] + list(valores),
+                background_color=(0.9, 0.95, 1, 1),
+                color=(0.1, 0.1, 0.1, 1),
+                font_size='12sp'
+            )
+            filtros_layout.add_widget(spinners[campo])
+        content.add_widget(filtros_layout)
+
+        busqueda_layout = BoxLayout(orientation='horizontal', spacing=dp(5), size_hint_y=None, height=dp(40))
+        texto_input = TextInput(
+            hint_text="Buscar en el mensaje",
+            multiline=False,
+            background_color=(0.97, 0.98, 1, 1),
+            foreground_color=(0.2, 0.2, 0.2, 1),
+            font_size='14sp'
+        )
+        btn_buscar = Button(
+            text="🔍 Buscar",
+            size_hint_x=None,
+            width=dp(90),
+            background_color=(0.2, 0.6, 0.9, 1),
+            color=(1, 1, 1, 1)
+        )
+        busqueda_layout.add_widget(texto_input)
+        busqueda_layout.add_widget(btn_buscar)
+        content.add_widget(busqueda_layout)
+
+        resultados_label = Label(
+            text="",
+            font_size='12sp',
+            size_hint_y=None,
+            height=dp(20),
+            color=(0.4, 0.5, 0.6, 1)
+        )
+        content.add_widget(resultados_label)
         
         # Lista scrolleable
         scroll = ScrollView()
         lista_layout = BoxLayout(orientation='vertical', spacing=dp(5), size_hint_y=None)
         lista_layout.bind(minimum_height=lista_layout.setter('height'))
-        
-        if not historial:
-            no_data = Label(
-                text="📭 No hay notificaciones en el historial",
-                color=(0.5, 0.5, 0.5, 1),
-                size_hint_y=None,
-                height=dp(40)
-            )
-            lista_layout.add_widget(no_data)
-        else:
-            for notif in reversed(historial[-20:]):  # Últimas 20
-                # Color según tipo
-                if notif['tipo'] == 'dosis':
-                    bg_color = (0.9, 1, 0.9, 1)  # Verde claro
-                    emoji = "💊"
-                elif notif['tipo'] == 'stock_bajo':
-                    bg_color = (1, 0.95, 0.8, 1)  # Amarillo claro
-                    emoji = "⚠️"
-                else:
-                    bg_color = (1, 0.9, 0.9, 1)  # Rojo claro
-                    emoji = "🚨"
-                
-                item = Button(
-                    text=f"{emoji} {notif['medicamento']}\n{notif['mensaje']}\n🕐 {notif['fecha']}",
+
+        btn_mas = Button(
+            text="⬇️ Ver anteriores",
+            size_hint_y=None,
+            height=dp(40),
+            background_color=(0.2, 0.4, 0.7, 1),
+            color=(1, 1, 1, 1)
+        )
+        estado = {"pagina": 0, "fuente": None}
+
+        def cargar_pagina(*args):
+            # Los widgets de cada página se crean recién cuando se piden
+            if btn_mas.parent:
+                lista_layout.remove_widget(btn_mas)
+            notificaciones, hay_mas = estado["fuente"](estado["pagina"])
+            for notif in notificaciones:
+                lista_layout.add_widget(self._item_historial(notif))
+            estado["pagina"] += 1
+            if hay_mas:
+                lista_layout.add_widget(btn_mas)
+
+        def recientes(pagina):
+            return historial.pagina(pagina, tamano), historial.hay_pagina(pagina + 1, tamano)
+
+        def buscar(*args):
+            filtros = {campo: spinner.text for campo, spinner in spinners.items() if spinner.text != self.TODOS}
+            if texto_input.text.strip():
+                filtros["texto"] = texto_input.text.strip()
+            lista_layout.clear_widgets()
+            estado["pagina"] = 0
+            if filtros:
+                def archivo(pagina):
+                    notificaciones = self.archivo_historial.buscar(pagina=pagina, tamano=tamano, **filtros)
+                    return notificaciones, len(notificaciones) == tamano
+                estado["fuente"] = archivo
+                resultados_label.text = f"{self.archivo_historial.contar(**filtros)} en el archivo"
+                vacio = "📭 No hay notificaciones con esos filtros"
+            else:
+                estado["fuente"] = recientes
+                resultados_label.text = f"Últimas {len(historial)} notificaciones"
+                vacio = "📭 No hay notificaciones en el historial"
+            cargar_pagina()
+            if not lista_layout.children:
+                lista_layout.add_widget(Label(
+                    text=vacio,
+                    color=(0.5, 0.5, 0.5, 1),
                     size_hint_y=None,
-                    height=dp(70),
-                    background_color=bg_color,
-                    color=(0.2, 0.2, 0.2, 1),
-                    text_size=(dp(300), None),
-                    halign='left',
-                    valign='middle'
-                )
-                lista_layout.add_widget(item)
+                    height=dp(40)
+                ))
+
+        btn_mas.bind(on_release=cargar_pagina)
+        btn_buscar.bind(on_release=buscar)
+        for spinner in spinners.values():
+            spinner.bind(text=buscar)
+        texto_input.bind(on_text_validate=buscar)
+        buscar()
         
         scroll.add_widget(lista_layout)
         content.add_widget(scroll)
@@ -1160,10 +1090,32 @@ class MainScreen(Screen):
         
         popup.open()
 
+    def _item_historial(self, notif):
+        # Color según tipo
+        if notif['tipo'] == 'dosis':
+            bg_color = (0.9, 1, 0.9, 1)  # Verde claro
+            emoji = "💊"
+        elif notif['tipo'] == 'stock_bajo':
+            bg_color = (1, 0.95, 0.8, 1)  # Amarillo claro
+            emoji = "⚠️"
+        else:
+            bg_color = (1, 0.9, 0.9, 1)  # Rojo claro
+            emoji = "🚨"
+
+        return Button(
+            text=f"{emoji} {notif['medicamento']}\n{notif['mensaje']}\n🕐 {notif['fecha']}",
+            size_hint_y=None,
+            height=dp(70),
+            background_color=bg_color,
+            color=(0.2, 0.2, 0.2, 1),
+            text_size=(dp(300), None),
+            halign='left',
+            valign='middle'
+        )
+
     def limpiar_historial(self):
         """Limpia el historial de notificaciones"""
-        self.historial_notificaciones = []
-        self.save_historial()
+        self.nucleo.limpiar_historial()
         self._show_snackbar("Historial limpiado")
 
     def limpiar_campos(self):
@@ -1174,117 +1126,148 @@ class MainScreen(Screen):
         self.ids.m_dosis.text = ""
         self.ids.m_frecuencia.text = ""
         self.ids.m_inicio.text = ""
+        self.ids.m_horas.text = ""
 
     # ---------------- Sistema de notificaciones ----------------
-    def calcular_fecha_fin(self, cantidad, dosis, frecuencia, inicio=None):
-        """Calcula cuándo se acabará el medicamento"""
-        if cantidad <= 0 or dosis <= 0 or frecuencia <= 0:
-            return None
-        
-        # Días que durará el medicamento
-        dias_duracion = (cantidad / dosis) * frecuencia
-        
-        # Fecha de inicio (ahora si no se especifica)
-        if inicio:
-            try:
-                fecha_inicio = datetime.strptime(inicio, "%Y-%m-%d %H:%M")
-            except:
-                fecha_inicio = datetime.now()
-        else:
-            fecha_inicio = datetime.now()
-        
-        # Calcular fecha de finalización
-        fecha_fin = fecha_inicio + timedelta(days=dias_duracion)
-        return fecha_fin.strftime("%Y-%m-%d %H:%M")
-
-    def start_notification_system(self):
-        """Inicia el sistema de notificaciones en segundo plano"""
-        if self.notification_thread is None or not self.notification_thread.is_alive():
-            self.stop_notifications = False
-            self.notification_thread = threading.Thread(target=self.notification_worker, daemon=True)
-            self.notification_thread.start()
-
-    def start_dose_reminders(self):
-        """Inicia el sistema de recordatorios de dosis"""
-        if self.dose_reminder_thread is None or not self.dose_reminder_thread.is_alive():
-            self.dose_reminder_thread = threading.Thread(target=self.dose_reminder_worker, daemon=True)
-            self.dose_reminder_thread.start()
-
-    def dose_reminder_worker(self):
-        """Hilo que verifica recordatorios de dosis cada 30 minutos"""
-        while not self.stop_notifications:
+    # ---------------- avisos programados ----------------
+    VENTANA_DOSIS = timedelta(minutes=30)
+
+    def iniciar_avisos(self):
+        """Programa el próximo aviso de dosis y de stock de cada medicamento"""
+        self.planificador.limpiar()
+        for med in self.medicamentos:
+            self.programar_avisos(med)
+        self.planificador.iniciar()
+
+    def programar_avisos(self, med, desde_dosis=None):
+        """(Re)calcula los vencimientos de un medicamento tras un cambio"""
+        ahora = datetime.now()
+        med_id = med["id"]
+
+        # Recordatorio de dosis: la toma pendiente más próxima que no se haya avisado ya
+        desde = desde_dosis or ahora - self.VENTANA_DOSIS
+        ultima_notif = med.get("ultima_notif_dosis")
+        if ultima_notif:
             try:
-                Clock.schedule_once(lambda dt: self.check_dose_reminders(), 0)
-                # Esperar 30 minutos (1800 segundos)
-                for _ in range(180):  # 30 minutos dividido en intervalos de 10 segundos
-                    if self.stop_notifications:
-                        break
-                    time.sleep(10)
-            except Exception:
-                break
+                desde = max(desde, datetime.strptime(ultima_notif, "%Y-%m-%d %H:%M:%S") + timedelta(seconds=1))
+            except ValueError:
+                pass
+        toma = proxima_toma(med, desde)
+        self.planificador.programar(("dosis", med_id), toma.timestamp() if toma else None)
 
-    def notification_worker(self):
-        """Hilo que verifica medicamentos cada 4 horas"""
-        while not self.stop_notifications:
+        # Stock bajo: cuando (fecha_fin - ahora).days pasa a ser 3
+        instante = None
+        if med.get("fecha_fin") and not med.get("notificaciones_activas", False):
             try:
-                Clock.schedule_once(lambda dt: self.check_medications(), 0)
-                # Esperar 4 horas (14400 segundos)
-                for _ in range(1440):  # 4 horas dividido en intervalos de 10 segundos
-                    if self.stop_notifications:
-                        break
-                    time.sleep(10)
-            except Exception:
-                break
+                fecha_fin = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
+                instante = (fecha_fin - timedelta(days=4) + timedelta(seconds=1)).timestamp()
+            except ValueError:
+                pass
+        self.planificador.programar(("stock", med_id), instante)
+        self.programar_alarmas()
+
+    def cancelar_avisos(self, med):
+        self.planificador.cancelar(("dosis", med["id"]))
+        self.planificador.cancelar(("stock", med["id"]))
+        self.programar_alarmas()
+
+    def programar_alarmas(self):
+        """Rearma las alarmas del sistema en el próximo guardado (una vez por frame)"""
+        if self.alarmas.nativo:
+            self.guardado.schedule("alarmas", self.sincronizar_alarmas)
+
+    def sincronizar_alarmas(self):
+        with span("sincronizar_alarmas"):
+            self.alarmas.sincronizar(calcular_avisos(self.medicamentos))
+
+    def aviso_vencido(self, clave):
+        """Atiende un aviso vencido (en el hilo de la UI)"""
+        tipo, med_id = clave
+        indice = next((i for i, med in enumerate(self.medicamentos) if med.get("id") == med_id), None)
+        if indice is None:
+            return
+        ahora = datetime.now()
+        if tipo == "dosis":
+            self.revisar_dosis(indice, ahora)
+        else:
+            self.revisar_stock(indice, ahora)
+        self.programar_avisos(self.medicamentos[indice], desde_dosis=ahora + timedelta(seconds=1))
 
     def check_dose_reminders(self):
         """Verifica si es hora de tomar algún medicamento"""
         ahora = datetime.now()
-        
-        for i, med in enumerate(self.medicamentos):
-            if not med.get("inicio"):
-                continue
-                
-            try:
-                fecha_inicio = datetime.strptime(med["inicio"], "%Y-%m-%d %H:%M")
-                frecuencia_horas = med["frecuencia_dias"] * 24
-                
-                # Calcular cuántas horas han pasado desde el inicio
-                horas_transcurridas = (ahora - fecha_inicio).total_seconds() / 3600
-                
-                # Verificar si es momento de tomar la dosis
-                if horas_transcurridas > 0 and horas_transcurridas % frecuencia_horas < 0.5:  # Ventana de 30 minutos
-                    # Verificar si ya se notificó en la última hora
-                    ultima_notif = med.get("ultima_notif_dosis")
-                    if not ultima_notif or (ahora - datetime.strptime(ultima_notif, "%Y-%m-%d %H:%M:%S")).total_seconds() > 3600:
-                        med["ultima_notif_dosis"] = ahora.strftime("%Y-%m-%d %H:%M:%S")
-                        self.save_meds()
-                        self.mostrar_recordatorio_dosis(i, med)
-                        
-            except Exception:
-                continue
+        for i in range(len(self.medicamentos)):
+            self.revisar_dosis(i, ahora)
+
+    def revisar_dosis(self, i, ahora):
+        """Avisa si una toma del medicamento venció hace menos de 30 minutos y no se avisó"""
+        med = self.medicamentos[i]
+        plan = PlanTomas.desde_medicamento(med)
+        if plan is None:
+            return
+        toma = plan.anterior(ahora)
+        if toma is None or ahora - toma >= self.VENTANA_DOSIS:
+            return
+        ultima_notif = med.get("ultima_notif_dosis")
+        try:
+            if ultima_notif and datetime.strptime(ultima_notif, "%Y-%m-%d %H:%M:%S") >= toma:
+                return
+        except ValueError:
+            pass
+        med["ultima_notif_dosis"] = ahora.strftime("%Y-%m-%d %H:%M:%S")
+        self.save_med(i)
+        self.mostrar_recordatorio_dosis(i, med)
 
+    @medir("check_medications")
     def check_medications(self):
         """Verifica si algún medicamento necesita notificación"""
         ahora = datetime.now()
-        
-        for i, med in enumerate(self.medicamentos):
-            if not med.get("fecha_fin"):
-                continue
-                
-            try:
-                fecha_fin = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
-                dias_restantes = (fecha_fin - ahora).days
+        for i in range(len(self.medicamentos)):
+            self.revisar_stock(i, ahora)
+
+    def revisar_stock(self, i, ahora):
+        """Anota el medicamento si cruzó el umbral de stock; el aviso sale en el próximo frame"""
+        med = self.medicamentos[i]
+        if not med.get("fecha_fin"):
+            return
+            
+        try:
+            fecha_fin = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
+            dias_restantes = (fecha_fin - ahora).days
+            
+            # Si faltan 3 días o menos y no se han activado las notificaciones
+            if dias_restantes <= 3 and not med.get("notificaciones_activas", False):
+                med["notificaciones_activas"] = True
+                self.cruces_stock.append((med, dias_restantes))
+                self._aviso_stock()
                 
-                # Si faltan 3 días o menos y no se han activado las notificaciones
-                if dias_restantes <= 3 and not med.get("notificaciones_activas", False):
-                    med["notificaciones_activas"] = True
-                    self.save_meds()
-                    mensaje = f"Tu medicamento '{med['nombre']}' se acabará en {dias_restantes} días"
-                    self.agregar_al_historial("stock_bajo", med['nombre'], mensaje)
-                    self.mostrar_notificacion_compra(i, med, dias_restantes)
-                    
-            except Exception:
-                continue
+        except Exception:
+            return
+
+    def avisar_stock_bajo(self):
+        """Un guardado, una entrada de historial y un aviso para todos los cruces pendientes"""
+        cruces, self.cruces_stock = self.cruces_stock, []
+        posiciones = {id(med): i for i, med in enumerate(self.medicamentos)}
+        cruces = [(posiciones[id(med)], med, dias) for med, dias in cruces if id(med) in posiciones]
+        if not cruces:
+            return
+        self.save_meds_cambiados([i for i, _, _ in cruces])
+
+        if len(cruces) == 1:
+            i, med, dias_restantes = cruces[0]
+            mensaje = f"Tu medicamento '{med['nombre']}' se acabará en {dias_restantes} días"
+            self.agregar_al_historial("stock_bajo", med['nombre'], mensaje)
+            self.mostrar_notificacion_compra(i, med, dias_restantes)
+            return
+
+        detalle = ", ".join(f"{med['nombre']} ({dias} días)" for _, med, dias in cruces)
+        # Una línea en el historial; en el archivo, una por medicamento
+        self.agregar_al_historial(
+            "stock_bajo", f"{len(cruces)} medicamentos", f"Se acabarán pronto: {detalle}",
+            detalle=[(med['nombre'], f"Tu medicamento '{med['nombre']}' se acabará en {dias} días")
+                     for _, med, dias in cruces],
+        )
+        self.mostrar_resumen_stock(cruces)
 
     def play_notification_sound(self):
         """Reproduce sonido de notificación"""
@@ -1308,7 +1291,7 @@ class MainScreen(Screen):
             medicamento = self.medicamentos[indice]
             
             # Verificar si debe tomarse hoy
-            if not self.es_dia_de_toma(medicamento, datetime.now()):
+            if not self.horario.es_dia_de_toma(indice, datetime.now()):
                 self.mostrar_notificacion(
                     "ℹ️ Información",
                     f"{medicamento['nombre']} no debe tomarse hoy según su frecuencia.",
@@ -1322,24 +1305,12 @@ class MainScreen(Screen):
             if not ya_completado:
                 # Marcar como completado
                 self.checklist_diario[str(indice)] = True
-                self.save_checklist()
+                self.save_checklist_item(indice)
                 
-                # Reducir cantidad actual
+                # Reducir cantidad actual (una dosis; el inventario actualiza la fecha de fin)
                 cantidad_actual = medicamento.get('cantidad_actual', medicamento['cantidad_total'])
                 if cantidad_actual > 0:
-                    medicamento['cantidad_actual'] = cantidad_actual - 1
-                    
-                    # Recalcular fecha de fin
-                    if medicamento.get('fecha_inicio'):
-                        try:
-                            fecha_inicio = datetime.strptime(medicamento['fecha_inicio'], "%Y-%m-%d %H:%M")
-                            dias_restantes = medicamento['cantidad_actual'] * medicamento['frecuencia_dias']
-                            nueva_fecha_fin = fecha_inicio + timedelta(days=dias_restantes)
-                            medicamento['fecha_fin'] = nueva_fecha_fin.strftime("%Y-%m-%d %H:%M")
-                        except:
-                            pass
-                    
-                    self.save_meds()
+                    self.registrar_evento(indice, TOMA, medicamento['dosis'])
                 
                 # Notificación de felicitación personalizada
                 nombre_usuario = self.usuario_actual if self.usuario_actual else "Usuario"
@@ -1372,7 +1343,8 @@ class MainScreen(Screen):
             else:
                 # Desmarcar como completado
                 self.checklist_diario[str(indice)] = False
-                self.save_checklist()
+                self.save_checklist_item(indice)
+                self.deshacer_toma(indice)
                 
                 self.mostrar_notificacion(
                     "↩️ Desmarcado",
@@ -1380,14 +1352,11 @@ class MainScreen(Screen):
                     "info"
                 )
             
-            self.refresh_list()
+            self.refresh_row(indice)
     
     def verificar_dia_completado(self):
         """Verifica si se completaron todos los medicamentos del día"""
-        medicamentos_hoy = []
-        for i, med in enumerate(self.medicamentos):
-            if self.es_dia_de_toma(med, datetime.now()):
-                medicamentos_hoy.append(i)
+        medicamentos_hoy = self.horario.debidos(datetime.now())
         
         if not medicamentos_hoy:
             return
@@ -1470,22 +1439,13 @@ class MainScreen(Screen):
     def marcar_dosis_tomada(self, index):
         """Marca que se tomó la dosis"""
         med = self.medicamentos[index]
-        # Reducir cantidad actual
-        cantidad_actual = med.get("cantidad_actual", med["cantidad_total"])
-        nueva_cantidad = max(0, cantidad_actual - med["dosis"])
-        med["cantidad_actual"] = nueva_cantidad
+        # Reducir cantidad actual (el inventario actualiza la fecha de fin)
+        nueva_cantidad = self.registrar_evento(index, TOMA, med["dosis"])
         
-        # Recalcular fecha de fin si es necesario
         if nueva_cantidad <= 0:
             mensaje = f"¡MEDICAMENTO AGOTADO! {med['nombre']} se ha terminado"
             self.agregar_al_historial("agotado", med['nombre'], mensaje)
-        else:
-            # Recalcular fecha de fin con la nueva cantidad
-            if med.get("inicio"):
-                med["fecha_fin"] = self.calcular_fecha_fin(nueva_cantidad, med["dosis"], med["frecuencia_dias"], med["inicio"])
-        
-        self.save_meds()
-        self.refresh_list()
+        self.refresh_row(index)
         self._show_snackbar(f"Dosis de {med['nombre']} registrada")
     
     def tomar_medicamento(self, indice):
@@ -1496,21 +1456,11 @@ class MainScreen(Screen):
             # Reducir cantidad actual
             cantidad_actual = medicamento.get('cantidad_actual', medicamento['cantidad_total'])
             if cantidad_actual > 0:
-                medicamento['cantidad_actual'] = cantidad_actual - 1
-                
-                # Recalcular fecha de fin si es necesario
-                if medicamento.get('fecha_inicio'):
-                    try:
-                        fecha_inicio = datetime.strptime(medicamento['fecha_inicio'], "%Y-%m-%d %H:%M")
-                        dias_restantes = medicamento['cantidad_actual'] * medicamento['frecuencia_dias']
-                        nueva_fecha_fin = fecha_inicio + timedelta(days=dias_restantes)
-                        medicamento['fecha_fin'] = nueva_fecha_fin.strftime("%Y-%m-%d %H:%M")
-                    except:
-                        pass
+                self.registrar_evento(indice, TOMA, medicamento['dosis'])
                 
                 # SINCRONIZAR CON CHECKLIST - marcar como completado automáticamente
                 self.checklist_diario[str(indice)] = True
-                self.save_checklist()
+                self.save_checklist_item(indice)
                 
                 # Sonido de celebración
                 if winsound:
@@ -1524,8 +1474,7 @@ class MainScreen(Screen):
                 # Verificar si el día está completado
                 self.verificar_dia_completado()
                 
-                self.save_meds()
-                self.refresh_list()
+                self.refresh_row(indice)
                 
                 # Notificación de confirmación
                 self._show_snackbar(f"💊 Has tomado {medicamento['nombre']}. Quedan {medicamento['cantidad_actual']} dosis.")
@@ -1555,14 +1504,8 @@ class MainScreen(Screen):
         
         # Título con progreso
         hoy = datetime.now()
-        medicamentos_hoy = []
-        completados_hoy = 0
-        
-        for i, med in enumerate(self.medicamentos):
-            if self.es_dia_de_toma(med, hoy):
-                medicamentos_hoy.append(i)
-                if self.checklist_diario.get(str(i), False):
-                    completados_hoy += 1
+        medicamentos_hoy = self.horario.debidos(hoy)
+        completados_hoy = sum(1 for i in medicamentos_hoy if self.checklist_diario.get(str(i), False))
         
         total_hoy = len(medicamentos_hoy)
         progreso_texto = f"✅ Checklist Diario - {completados_hoy}/{total_hoy} completados"
@@ -1721,7 +1664,7 @@ class MainScreen(Screen):
             medicamento = self.medicamentos[indice]
             
             # Verificar si debe tomarse hoy
-            if not self.es_dia_de_toma(medicamento, datetime.now()):
+            if not self.horario.es_dia_de_toma(indice, datetime.now()):
                 self._show_snackbar(f"{medicamento['nombre']} no debe tomarse hoy.")
                 return
             
@@ -1731,24 +1674,12 @@ class MainScreen(Screen):
             if not ya_completado:
                 # Marcar como completado
                 self.checklist_diario[str(indice)] = True
-                self.save_checklist()
+                self.save_checklist_item(indice)
                 
-                # Reducir cantidad
+                # Reducir cantidad (una dosis; el inventario actualiza la fecha de fin)
                 cantidad_actual = medicamento.get('cantidad_actual', medicamento['cantidad_total'])
                 if cantidad_actual > 0:
-                    medicamento['cantidad_actual'] = cantidad_actual - 1
-                    
-                    # Recalcular fecha de fin
-                    if medicamento.get('fecha_inicio'):
-                        try:
-                            fecha_inicio = datetime.strptime(medicamento['fecha_inicio'], "%Y-%m-%d %H:%M")
-                            dias_restantes = medicamento['cantidad_actual'] * medicamento['frecuencia_dias']
-                            nueva_fecha_fin = fecha_inicio + timedelta(days=dias_restantes)
-                            medicamento['fecha_fin'] = nueva_fecha_fin.strftime("%Y-%m-%d %H:%M")
-                        except:
-                            pass
-                    
-                    self.save_meds()
+                    self.registrar_evento(indice, TOMA, medicamento['dosis'])
                 
                 # Sonido y notificación de celebración
                 if winsound:
@@ -1767,20 +1698,17 @@ class MainScreen(Screen):
             else:
                 # Desmarcar
                 self.checklist_diario[str(indice)] = False
-                self.save_checklist()
+                self.save_checklist_item(indice)
+                self.deshacer_toma(indice)
                 self._show_snackbar(f"↩️ {medicamento['nombre']} desmarcado")
             
-            self.refresh_list()
+            self.refresh_row(indice)
             # No reabrir checklist automáticamente para evitar crashes
     
     def completar_todos_medicamentos(self):
         """Marca todos los medicamentos del día como completados"""
         hoy = datetime.now()
-        medicamentos_hoy = []
-        
-        for i, med in enumerate(self.medicamentos):
-            if self.es_dia_de_toma(med, hoy):
-                medicamentos_hoy.append(i)
+        medicamentos_hoy = self.horario.debidos(hoy)
         
         completados = 0
         for i in medicamentos_hoy:
@@ -1791,13 +1719,12 @@ class MainScreen(Screen):
                 medicamento = self.medicamentos[i]
                 cantidad_actual = medicamento.get('cantidad_actual', medicamento['cantidad_total'])
                 if cantidad_actual > 0:
-                    medicamento['cantidad_actual'] = cantidad_actual - 1
+                    self.registrar_evento(i, TOMA, medicamento['dosis'])
                 
                 completados += 1
         
         if completados > 0:
             self.save_checklist()
-            self.save_meds()
             
             # Sonido especial para completar todos
             if winsound:
@@ -1813,9 +1740,58 @@ class MainScreen(Screen):
         else:
             self._show_snackbar("✅ Todos los medicamentos ya están completados")
 
-    def mostrar_notificacion_compra(self, index, med, dias_restantes):
-        """Muestra notificación para comprar medicamento"""
+    def mostrar_resumen_stock(self, cruces):
+        """Un solo aviso para varios medicamentos por agotarse; cada fila abre el suyo"""
         self.play_notification_sound()
+
+        content = BoxLayout(orientation='vertical', spacing=dp(10), padding=dp(20))
+        content.add_widget(Label(
+            text=f"⚠️ ¡ATENCIÓN!\n\n{len(cruces)} medicamentos se acabarán pronto.\nToca uno para registrar la compra.",
+            text_size=(dp(320), None),
+            halign='center',
+            color=(0.2, 0.2, 0.2, 1),
+            font_size='16sp',
+            size_hint_y=None,
+            height=dp(90)
+        ))
+
+        scroll = ScrollView(do_scroll_x=False)
+        filas = GridLayout(cols=1, spacing=dp(8), size_hint_y=None)
+        filas.bind(minimum_height=filas.setter('height'))
+        popup = Popup(title="⚠️ Medicamentos por agotarse", content=content, size_hint=(0.9, 0.7))
+
+        for i, med, dias_restantes in sorted(cruces, key=lambda cruce: cruce[2]):
+            fila = Button(
+                text=f"💊 {med['nombre']} - {dias_restantes} días",
+                size_hint_y=None,
+                height=dp(45),
+                background_color=(0.8, 0.3, 0.3, 1) if dias_restantes <= 1 else (0.9, 0.6, 0.2, 1),
+                color=(1, 1, 1, 1),
+                font_size='14sp'
+            )
+            fila.bind(on_release=lambda x, i=i, med=med, dias=dias_restantes:
+                      self.mostrar_notificacion_compra(i, med, dias, sonido=False))
+            filas.add_widget(fila)
+        scroll.add_widget(filas)
+        content.add_widget(scroll)
+
+        btn_cerrar = Button(
+            text="⏰ Recordar después",
+            size_hint_y=None,
+            height=dp(50),
+            background_color=(0.7, 0.5, 0.2, 1),
+            color=(1, 1, 1, 1),
+            font_size='14sp'
+        )
+        btn_cerrar.bind(on_release=popup.dismiss)
+        content.add_widget(btn_cerrar)
+
+        popup.open()
+
+    def mostrar_notificacion_compra(self, index, med, dias_restantes, sonido=True):
+        """Muestra notificación para comprar medicamento"""
+        if sonido:
+            self.play_notification_sound()
         
         content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(20))
         
@@ -1955,34 +1931,19 @@ class MainScreen(Screen):
                 
             med = self.medicamentos[index]
             
-            # Calcular días restantes actuales
-            dias_restantes_actuales = 0
+            # Fin proyectado antes de la compra (o ahora, si ya se había agotado)
             ahora = datetime.now()
-            if med.get("fecha_fin"):
-                try:
-                    fecha_fin_original = datetime.strptime(med["fecha_fin"], "%Y-%m-%d %H:%M")
-                    if fecha_fin_original > ahora:
-                        dias_restantes_actuales = (fecha_fin_original - ahora).days
-                except:
-                    dias_restantes_actuales = 0
+            fin_anterior = max(self.inventario.agotamiento(med) or ahora, ahora)
             
-            # Calcular días que durará la nueva compra
-            dias_nueva_compra = (nueva_cantidad / med["dosis"]) * med["frecuencia_dias"]
-            
-            # Sumar días totales
-            dias_totales = dias_restantes_actuales + int(dias_nueva_compra)
-            
-            # Actualizar cantidad actual
-            cantidad_restante_actual = med.get("cantidad_actual", 0)
-            med["cantidad_actual"] = cantidad_restante_actual + nueva_cantidad
-            
-            # Calcular nueva fecha de finalización
-            nueva_fecha_fin = ahora + timedelta(days=dias_totales)
-            med["fecha_fin"] = nueva_fecha_fin.strftime("%Y-%m-%d %H:%M")
+            # La compra extiende la proyección del inventario
             med["notificaciones_activas"] = False  # Resetear notificaciones
+            self.registrar_evento(index, COMPRA, nueva_cantidad)
+            nueva_fecha_fin = self.inventario.agotamiento(med) or ahora
+            dias_nueva_compra = max(0, (nueva_fecha_fin - fin_anterior).days)
+            dias_totales = max(0, (nueva_fecha_fin - ahora).days)
             
-            self.save_meds()
-            self.refresh_list()
+            self.save_med(index)
+            self.refresh_row(index)
             
             popup.dismiss()
             
@@ -2012,8 +1973,35 @@ class TrackerApp(App):
     def build(self):
         screen_manager = Builder.load_file("tracker.kv")
         screen_manager.current = "login"
+        arranque.marcar("kv")
         return screen_manager
 
+    def on_start(self):
+        Window.bind(on_flip=self._primer_frame)
+        pedir_permisos()
+
+    def _primer_frame(self, *args):
+        Window.unbind(on_flip=self._primer_frame)
+        arranque.marcar("primer_frame")
+        arranque.informar()
+        # Las gráficas se cargan cuando la app ya está en pantalla
+        precargar_graficas()
+
+    def on_pause(self):
+        # Android puede matar la app en pausa: escribir todo lo pendiente
+        self.root.get_screen("main").flush()
+        return True
+
+    def on_resume(self):
+        self.root.get_screen("main").leer_avisos_servicio()
+
+    def on_stop(self):
+        main_screen = self.root.get_screen("main")
+        main_screen.nucleo.cerrar()
+        main_screen.renderizador.cerrar()
+        main_screen.planificador.detener()
+        tracer.exportar()
+
 
 if __name__ == "__main__":
     TrackerApp().run()
@@ -1,204 +1,371 @@
 import flet as ft
 from datetime import datetime, timedelta
-import json
-import os
-import threading
-import time
+from functools import partial
+from itertools import islice
 import asyncio
 
-# Archivos de datos
-USUARIO_FILE = "usuario.json"
-MEDICAMENTOS_FILE = "medicamentos.json"
-HISTORIAL_FILE = "historial_notificaciones.json"
+from acceso import AccesoDenegado
+from columnas import ADVERTENCIA, AGOTADO, ERROR, NORMAL, SIN_FECHA, URGENTE, formatear_dias
+from journal import AJUSTE
+from pacientes import AlmacenPacientes, ConflictoVersion, cambio_de_dias
 
-class MedicationTrackerApp:
-    def __init__(self):
-        self.medicamentos = []
-        self.historial_notificaciones = []
-        self.usuario_actual = None
-        self.notification_thread = None
-        self.dose_reminder_thread = None
-        self.stop_notifications = False
-        
-        # Cargar datos
-        self.load_meds()
-        self.cargar_historial()
-        
-    def load_meds(self):
-        """Carga medicamentos desde archivo JSON"""
-        try:
-            if os.path.exists(MEDICAMENTOS_FILE):
-                with open(MEDICAMENTOS_FILE, 'r', encoding='utf-8') as f:
-                    self.medicamentos = json.load(f)
-        except:
-            self.medicamentos = []
-    
-    def save_meds(self):
-        """Guarda medicamentos en archivo JSON"""
-        try:
-            with open(MEDICAMENTOS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.medicamentos, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error guardando medicamentos: {e}")
+# Único por proceso: las sesiones de un mismo paciente comparten sus datos en memoria
+almacen = AlmacenPacientes()
+
+# Filas que se piden al servidor por vez en las listas largas
+TAMANO_PAGINA = 20
+# Las filas del calendario son más bajas: con menos no se llena el diálogo y no hay scroll
+TAMANO_PAGINA_CALENDARIO = 40
+# A esta distancia (px) del final de una lista se pide la página siguiente
+UMBRAL_SCROLL = 300
+DIAS_CALENDARIO = 8
+
+
+def calcular_estadisticas(nucleo, dias, urgencia):
+    """Resumen de `show_statistics` a partir de los días restantes de toda la lista"""
+    medicamentos = nucleo.medicamentos
+    agotados = nucleo.columnas.contar(urgencia)[AGOTADO]
     
-    def cargar_historial(self):
-        """Carga historial de notificaciones"""
-        try:
-            if os.path.exists(HISTORIAL_FILE):
-                with open(HISTORIAL_FILE, 'r', encoding='utf-8') as f:
-                    self.historial_notificaciones = json.load(f)
-        except:
-            self.historial_notificaciones = []
-    
-    def save_historial(self):
-        """Guarda historial de notificaciones"""
-        try:
-            with open(HISTORIAL_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.historial_notificaciones, f, ensure_ascii=False, indent=2)
-        except:
-            pass
-    
-    def calcular_fecha_fin(self, cantidad, dosis, frecuencia, inicio=None):
-        """Calcula cuándo se acabará el medicamento"""
-        if cantidad <= 0 or dosis <= 0 or frecuencia <= 0:
-            return None
-        
-        dias_duracion = (cantidad / dosis) * frecuencia
-        
-        if inicio:
+    # Barras de duración: (nombre, días restantes, urgencia, progreso con máximo 30 días)
+    duraciones_restantes = []
+    for med, d, u in zip(medicamentos, dias, urgencia):
+        progreso = 0 if u in (AGOTADO, SIN_FECHA, ERROR) else min(int(d) / 30, 1.0)
+        duraciones_restantes.append((med['nombre'], formatear_dias(d, u), int(u), progreso))
+    
+    # Duración de cada tratamiento, de inicio a fin
+    duraciones = []
+    for med in medicamentos:
+        if (med.get('inicio') or med.get('fecha_inicio')) and med.get('fecha_fin'):
             try:
-                fecha_inicio = datetime.strptime(inicio, "%Y-%m-%d %H:%M")
+                inicio = datetime.strptime(med.get('inicio') or med['fecha_inicio'], "%Y-%m-%d %H:%M")
+                fin = datetime.strptime(med['fecha_fin'], "%Y-%m-%d %H:%M")
+                duracion = (fin - inicio).days
+                if duracion > 0:
+                    duraciones.append(duracion)
             except:
-                fecha_inicio = datetime.now()
-        else:
-            fecha_inicio = datetime.now()
-        
-        fecha_fin = fecha_inicio + timedelta(days=dias_duracion)
-        return fecha_fin.strftime("%Y-%m-%d %H:%M")
+                continue
     
-    def calcular_dias_restantes(self, medicamento):
-        """Calcula días restantes para un medicamento"""
-        if not medicamento.get("fecha_fin"):
-            return "Sin fecha"
-        
+    return {
+        "total": len(medicamentos),
+        "activos": len(medicamentos) - agotados,
+        "agotados": agotados,
+        "duraciones_restantes": duraciones_restantes,
+        "duraciones": duraciones,
+    }
+
+class MedicationTrackerApp:
+    def __init__(self, paciente, token):
+        # Mismos datos, inventario y horario que la app Kivy, en la carpeta del paciente
+        self.paciente = paciente
+        # Se revoca al cerrar sesión
+        self.token = token
+        self.nucleo = paciente.nucleo
+        self.usuario_actual = paciente.usuario
+
+    @property
+    def medicamentos(self):
+        """Copia de la lista: otra sesión del mismo paciente puede cambiarla mientras se lee"""
+        with self.paciente.lock:
+            return [dict(med) for med in self.nucleo.medicamentos]
+
+    # Vistas derivadas: se calculan una vez por cambio para todas las sesiones del paciente
+    def dias_restantes(self):
+        """(días restantes, urgencia) de toda la lista, en una pasada sobre las columnas"""
+        return self.paciente.vista("dias_restantes", lambda nucleo: nucleo.columnas.calcular(), vence=cambio_de_dias)
+
+    def estadisticas(self):
+        """Resumen para el diálogo de estadísticas (None si no hay medicamentos)"""
+        with self.paciente.lock:
+            if not self.nucleo.medicamentos:
+                return None
+            dias, urgencia = self.dias_restantes()
+            return self.paciente.vista(
+                "estadisticas", lambda nucleo: calcular_estadisticas(nucleo, dias, urgencia), vence=cambio_de_dias)
+
+    def debidos(self, hoy, dias=DIAS_CALENDARIO):
+        """[(fecha, índices que tocan)] de `dias` días desde `hoy`"""
+        def calcular(nucleo):
+            fechas = [hoy + timedelta(days=d) for d in range(dias)]
+            return [(fecha, nucleo.horario.debidos(fecha)) for fecha in fechas]
+        return self.paciente.vista(("debidos", hoy.date(), dias), calcular)
+
+    def filas(self, desde=0, cantidad=TAMANO_PAGINA):
+        """(medicamento, días restantes, urgencia) de `cantidad` medicamentos desde `desde`, y el total
+
+        Solo se copian los de la ventana: la lista completa no sale del servidor.
+        """
+        with self.paciente.lock:
+            total = len(self.nucleo.medicamentos)
+            hasta = min(total, desde + cantidad)
+            dias, urgencia = self.dias_restantes()
+            return [(dict(self.nucleo.medicamentos[i]), formatear_dias(dias[i], urgencia[i]), int(urgencia[i]))
+                    for i in range(desde, hasta)], total
+
+    def medicamento(self, med_id):
+        """(copia del medicamento, revisión) o (None, None) si ya no existe"""
+        with self.paciente.lock:
+            indice = self.paciente.indice(med_id)
+            if indice is None:
+                return None, None
+            return dict(self.nucleo.medicamentos[indice]), self.paciente.revision(med_id)
+
+    def historial(self, pagina=0, tamano=TAMANO_PAGINA):
+        """(notificaciones de la página, hay más)"""
+        with self.paciente.lock:
+            historial = self.nucleo.historial
+            return historial.pagina(pagina, tamano), historial.hay_pagina(pagina + 1, tamano)
+
+    def calendario(self, hoy, pagina=0, tamano=TAMANO_PAGINA_CALENDARIO, dias=DIAS_CALENDARIO):
+        """(filas de la página, hay más) del calendario de `dias` días desde `hoy`
+
+        Cada día es una fila ``(fecha, None, cantidad de tomas)`` seguida de una
+        ``(fecha, medicamento, None)`` por medicamento que toca. Los índices
+        salen de la vista `debidos` y solo se copian los medicamentos de la página.
+        """
+        def filas(debidos):
+            for fecha, indices in debidos:
+                yield fecha, None, len(indices)
+                for indice in indices:
+                    yield fecha, indice, None
+
+        inicio = pagina * tamano
+        with self.paciente.lock:
+            ventana = list(islice(filas(self.debidos(hoy, dias)), inicio, inicio + tamano + 1))
+            meds = self.nucleo.medicamentos
+            resultado = [(fecha, None if indice is None else dict(meds[indice]), cantidad)
+                         for fecha, indice, cantidad in ventana[:tamano]]
+        return resultado, len(ventana) > tamano
+
+    # Los handlers son async: lo que toma el lock del paciente (que también toma la
+    # escritura a disco) corre en un hilo, para no frenar a las demás sesiones
+    async def leer(self, funcion, *args):
+        return await asyncio.to_thread(funcion, *args)
+
+    async def cambiar(self, funcion, med_id=None, revision=None):
+        """Aplica `funcion(nucleo)` con el paciente bloqueado (ver `Paciente.cambio`)"""
+        def aplicar():
+            with self.paciente.cambio(med_id, revision, origen=self) as nucleo:
+                return funcion(nucleo)
+        return await asyncio.to_thread(aplicar)
+
+def cerca_del_final(e):
+    """True si el evento de scroll llegó a UMBRAL_SCROLL del final de la lista"""
+    return e.max_scroll_extent is not None and e.max_scroll_extent - e.pixels <= UMBRAL_SCROLL
+
+
+class ListaPaginada(ft.ListView):
+    """ListView que pide sus filas al servidor de a una página, al acercarse al final
+
+    `cargar(pagina)` (async) devuelve ``(controles, hay_mas)``; el navegador
+    recibe solo las páginas que se llegan a ver.
+    """
+
+    def __init__(self, cargar, **kwargs):
+        super().__init__(on_scroll=self._al_desplazar, on_scroll_interval=100, **kwargs)
+        self.cargar = cargar
+        self.pagina = 0
+        self.hay_mas = True
+        self._cargando = False
+
+    async def siguiente(self):
+        """Agrega la página siguiente (sin enviarla); False si no había más"""
+        if self._cargando or not self.hay_mas:
+            return False
+        self._cargando = True
         try:
-            fecha_fin = datetime.strptime(medicamento["fecha_fin"], "%Y-%m-%d %H:%M")
-            dias_restantes = (fecha_fin - datetime.now()).days
-            if dias_restantes < 0:
-                return "¡AGOTADO!"
-            else:
-                return f"{dias_restantes} días"
-        except:
-            return "Error"
+            controles, self.hay_mas = await self.cargar(self.pagina)
+            self.pagina += 1
+            self.controls.extend(controles)
+        finally:
+            self._cargando = False
+        return True
+
+    async def _al_desplazar(self, e):
+        if cerca_del_final(e) and await self.siguiente():
+            self.update()
+
 
-def main(page: ft.Page):
+def mismos_controles(actuales, nuevos):
+    """True si las dos listas tienen los mismos controles (los mismos objetos) en el mismo orden"""
+    return len(actuales) == len(nuevos) and all(a is b for a, b in zip(actuales, nuevos))
+
+
+class TarjetaMedicamento(ft.Card):
+    """Card de un medicamento que se reutiliza entre refrescos de la lista
+
+    La lista guarda una por id de medicamento; `actualizar` cambia solo los
+    textos y colores que cambiaron, así cada edición manda al navegador unos
+    pocos atributos en lugar de toda la lista.
+    """
+
+    def __init__(self, al_editar, al_eliminar):
+        self.icono = ft.Icon(ft.icons.MEDICATION)
+        self.nombre = ft.Text(weight=ft.FontWeight.BOLD)
+        self.descripcion = ft.Text()
+        self.presentacion = ft.Text(size=12)
+        self.dosis = ft.Text(size=12)
+        self.cantidad = ft.Text(size=12)
+        self.frecuencia = ft.Text(size=12)
+        self.etiqueta_fin = ft.Text("Se acaba en:", size=10)
+        self.dias = ft.Text(size=12, weight=ft.FontWeight.BOLD)
+        self.fondo = ft.Container(
+            content=ft.Column([
+                ft.ListTile(
+                    leading=self.icono,
+                    title=self.nombre,
+                    subtitle=self.descripcion,
+                    trailing=ft.PopupMenuButton(
+                        icon=ft.icons.MORE_VERT,
+                        items=[
+                            ft.PopupMenuItem(text="✏️ Editar", on_click=al_editar),
+                            ft.PopupMenuItem(text="🗑️ Eliminar", on_click=al_eliminar),
+                        ]
+                    )
+                ),
+                ft.Divider(height=1),
+                ft.Container(
+                    content=ft.Row([
+                        ft.Column([self.presentacion, self.dosis], expand=True),
+                        ft.Column([self.cantidad, self.frecuencia], expand=True),
+                        ft.Column([self.etiqueta_fin, self.dias], horizontal_alignment=ft.CrossAxisAlignment.END)
+                    ]),
+                    padding=ft.padding.all(10)
+                )
+            ]),
+            border_radius=8,
+            padding=5
+        )
+        super().__init__(content=self.fondo, elevation=2, margin=ft.margin.symmetric(vertical=4))
+        self._mostrado = None
+
+    def actualizar(self, med, dias_restantes, colores):
+        """Pone los datos del medicamento; devuelve False si no había nada que cambiar"""
+        bg_color, text_color = colores
+        textos = [
+            (self.nombre, f"{med['nombre']}"),
+            (self.descripcion, f"{med.get('descripcion', 'Sin descripción')}"),
+            (self.presentacion, f"📦 {med['presentacion']}"),
+            (self.dosis, f"💊 Dosis: {med['dosis']}"),
+            (self.cantidad, f"📊 Cantidad: {med.get('cantidad_actual', med['cantidad_total'])}"),
+            (self.frecuencia, f"⏰ Cada {med['frecuencia_dias']} días"),
+            (self.dias, f"{dias_restantes}"),
+        ]
+        mostrado = (tuple(texto for _, texto in textos), bg_color, text_color)
+        if mostrado == self._mostrado:
+            return False
+        anterior_color = self._mostrado[2] if self._mostrado else None
+        for control, texto in textos:
+            if control.value != texto:
+                control.value = texto
+        if text_color != anterior_color:
+            for control in [self.icono, self.etiqueta_fin] + [control for control, _ in textos]:
+                control.color = text_color
+        if self.fondo.bgcolor != bg_color:
+            self.fondo.bgcolor = bg_color
+        self._mostrado = mostrado
+        return True
+
+async def main(page: ft.Page):
     page.title = "💊 Tracker de Medicamentos"
     page.theme_mode = ft.ThemeMode.LIGHT
     page.padding = 0
     page.spacing = 0
     page.bgcolor = ft.colors.BLUE_GREY_50
     
-    # Instancia de la app
-    app = MedicationTrackerApp()
+    # Instancia de la app (al iniciar sesión)
+    app = None
     
     # Variables de estado
     current_view = ft.Ref[ft.View]()
     
+    # Un único SnackBar: cada handler lo prepara y se envía con su page.update()
+    snack_bar = ft.SnackBar(content=ft.Text("", color=ft.colors.WHITE), duration=3000)
+    page.overlay.append(snack_bar)
+    
     def show_snackbar(message, color=ft.colors.GREEN):
-        """Muestra mensaje temporal"""
-        page.show_snack_bar(
-            ft.SnackBar(
-                content=ft.Text(message, color=ft.colors.WHITE),
-                bgcolor=color,
-                duration=3000
-            )
-        )
+        """Prepara un mensaje temporal (se muestra en el próximo page.update())"""
+        snack_bar.content.value = message
+        snack_bar.bgcolor = color
+        snack_bar.open = True
     
-    def get_urgency_color(dias_restantes):
-        """Obtiene color según urgencia"""
-        if isinstance(dias_restantes, str) and "días" in dias_restantes:
-            try:
-                dias_num = int(dias_restantes.split()[0])
-                if dias_num <= 3:
-                    return ft.colors.RED_100, ft.colors.RED_800
-                elif dias_num <= 7:
-                    return ft.colors.ORANGE_100, ft.colors.ORANGE_800
-                else:
-                    return ft.colors.GREEN_100, ft.colors.GREEN_800
-            except:
-                return ft.colors.GREY_100, ft.colors.GREY_800
+    def get_urgency_color(urgencia):
+        """Obtiene color según la urgencia de `columnas`"""
+        if urgencia == URGENTE:
+            return ft.colors.RED_100, ft.colors.RED_800
+        elif urgencia == ADVERTENCIA:
+            return ft.colors.ORANGE_100, ft.colors.ORANGE_800
+        elif urgencia == NORMAL:
+            return ft.colors.GREEN_100, ft.colors.GREEN_800
         else:
+            # Agotado, sin fecha o con fecha inválida
             return ft.colors.BLUE_GREY_100, ft.colors.BLUE_GREY_800
     
-    def refresh_medication_list():
-        """Actualiza la lista de medicamentos"""
-        medication_list.controls.clear()
-        
-        if not app.medicamentos:
-            medication_list.controls.append(
-                ft.Container(
-                    content=ft.Column([
-                        ft.Icon(ft.icons.MEDICATION, size=64, color=ft.colors.GREY_400),
-                        ft.Text("No hay medicamentos registrados", 
-                               size=16, color=ft.colors.GREY_600, text_align=ft.TextAlign.CENTER)
-                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                    padding=40,
-                    alignment=ft.alignment.center
-                )
-            )
-        else:
-            for i, med in enumerate(app.medicamentos):
-                dias_restantes = app.calcular_dias_restantes(med)
-                bg_color, text_color = get_urgency_color(dias_restantes)
-                
-                # Crear card del medicamento
-                med_card = ft.Card(
-                    content=ft.Container(
-                        content=ft.Column([
-                            ft.ListTile(
-                                leading=ft.Icon(ft.icons.MEDICATION, color=text_color),
-                                title=ft.Text(f"{med['nombre']}", weight=ft.FontWeight.BOLD, color=text_color),
-                                subtitle=ft.Text(f"{med.get('descripcion', 'Sin descripción')}", color=text_color),
-                                trailing=ft.PopupMenuButton(
-                                    icon=ft.icons.MORE_VERT,
-                                    items=[
-                                        ft.PopupMenuItem(text="✏️ Editar", on_click=lambda e, idx=i: edit_medication(idx)),
-                                        ft.PopupMenuItem(text="🗑️ Eliminar", on_click=lambda e, idx=i: delete_medication(idx)),
-                                    ]
-                                )
-                            ),
-                            ft.Divider(height=1),
-                            ft.Container(
-                                content=ft.Row([
-                                    ft.Column([
-                                        ft.Text(f"📦 {med['presentacion']}", size=12, color=text_color),
-                                        ft.Text(f"💊 Dosis: {med['dosis']}", size=12, color=text_color),
-                                    ], expand=True),
-                                    ft.Column([
-                                        ft.Text(f"📊 Cantidad: {med.get('cantidad_actual', med['cantidad_total'])}", size=12, color=text_color),
-                                        ft.Text(f"⏰ Cada {med['frecuencia_dias']} días", size=12, color=text_color),
-                                    ], expand=True),
-                                    ft.Column([
-                                        ft.Text("Se acaba en:", size=10, color=text_color),
-                                        ft.Text(f"{dias_restantes}", size=12, weight=ft.FontWeight.BOLD, color=text_color),
-                                    ], horizontal_alignment=ft.CrossAxisAlignment.END)
-                                ]),
-                                padding=ft.padding.all(10)
-                            )
-                        ]),
-                        bgcolor=bg_color,
-                        border_radius=8,
-                        padding=5
-                    ),
-                    elevation=2,
-                    margin=ft.margin.symmetric(vertical=4)
-                )
-                
-                medication_list.controls.append(med_card)
+    # Cards por id de medicamento, reutilizadas en cada refresco
+    tarjetas = {}
+    # Medicamentos que muestra la lista (crece de a una página con el scroll) y total del paciente
+    visibles = TAMANO_PAGINA
+    total_medicamentos = 0
+    lista_vacia = ft.Container(
+        content=ft.Column([
+            ft.Icon(ft.icons.MEDICATION, size=64, color=ft.colors.GREY_400),
+            ft.Text("No hay medicamentos registrados", 
+                   size=16, color=ft.colors.GREY_600, text_align=ft.TextAlign.CENTER)
+        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+        padding=40,
+        alignment=ft.alignment.center
+    )
+    
+    def tarjeta_de(med, dias_restantes, urgencia):
+        tarjeta = tarjetas.get(med["id"])
+        if tarjeta is None:
+            tarjeta = TarjetaMedicamento(partial(edit_medication, med["id"]), partial(delete_medication, med["id"]))
+            tarjetas[med["id"]] = tarjeta
+        tarjeta.actualizar(med, dias_restantes, get_urgency_color(urgencia))
+        return tarjeta
+    
+    def refresh_medication_list(ventana):
+        """Pone la lista al día (sin enviarla: la envía el page.update() del handler)
+
+        `ventana` es ``app.filas(0, visibles)``: solo las páginas ya mostradas.
+        Solo se crean cards para medicamentos nuevos; en las demás se cambian
+        los textos que cambiaron y la lista se reordena solo si hace falta.
+        """
+        nonlocal total_medicamentos
+        filas, total_medicamentos = ventana
+        if not filas:
+            tarjetas.clear()
+            if not mismos_controles(medication_list.controls, [lista_vacia]):
+                medication_list.controls = [lista_vacia]
+            return
         
+        vigentes = [tarjeta_de(*fila) for fila in filas]
+        ids = {med["id"] for med, _, _ in filas}
+        for med_id in [med_id for med_id in tarjetas if med_id not in ids]:
+            del tarjetas[med_id]
+        if not mismos_controles(medication_list.controls, vigentes):
+            medication_list.controls = vigentes
+    
+    async def refrescar():
+        """Lista al día y todos los cambios del handler en un solo page.update()"""
+        refresh_medication_list(await app.leer(app.filas, 0, visibles))
         page.update()
     
-    def add_medication(e):
+    async def mas_medicamentos(e):
+        """Al acercarse al final de la lista pide solo la página siguiente"""
+        nonlocal visibles
+        # Si la página anterior todavía no llegó, len(tarjetas) < visibles
+        if app is None or not cerca_del_final(e) or len(tarjetas) < visibles or visibles >= total_medicamentos:
+            return
+        desde, visibles = visibles, visibles + TAMANO_PAGINA
+        filas, total = await app.leer(app.filas, desde, TAMANO_PAGINA)
+        nuevas = [tarjeta_de(*fila) for fila in filas if fila[0]["id"] not in tarjetas]
+        medication_list.controls.extend(nuevas)
+        if total != total_medicamentos or len(nuevas) != len(filas):
+            # Otra sesión cambió la lista mientras tanto: rearmar la ventana completa
+            refresh_medication_list(await app.leer(app.filas, 0, visibles))
+        page.update()
+    
+    async def add_medication(e):
         """Abre diálogo para agregar medicamento"""
         nombre_field = ft.TextField(label="Nombre del medicamento", autofocus=True)
         descripcion_field = ft.TextField(label="Descripción", multiline=True, max_lines=2)
@@ -219,7 +386,7 @@ def main(page: ft.Page):
         dosis_field = ft.TextField(label="Dosis por toma", keyboard_type=ft.KeyboardType.NUMBER)
         frecuencia_field = ft.TextField(label="Frecuencia (días)", keyboard_type=ft.KeyboardType.NUMBER)
         
-        def save_medication(e):
+        async def save_medication(e):
             try:
                 nuevo_med = {
                     "nombre": nombre_field.value,
@@ -229,25 +396,18 @@ def main(page: ft.Page):
                     "cantidad_actual": float(cantidad_field.value),
                     "dosis": float(dosis_field.value),
                     "frecuencia_dias": int(frecuencia_field.value),
-                    "fecha_inicio": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                    "inicio": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                    "fecha_fin": None,  # la proyecta el inventario
                     "notificaciones_activas": False
                 }
                 
-                # Calcular fecha de finalización
-                nuevo_med["fecha_fin"] = app.calcular_fecha_fin(
-                    nuevo_med["cantidad_total"],
-                    nuevo_med["dosis"],
-                    nuevo_med["frecuencia_dias"]
-                )
-                
-                app.medicamentos.append(nuevo_med)
-                app.save_meds()
-                refresh_medication_list()
+                await app.cambiar(lambda nucleo: nucleo.agregar(nuevo_med, nuevo_med["cantidad_total"]))
+                dlg.open = False
                 show_snackbar("✅ Medicamento agregado correctamente")
-                page.close(dlg)
                 
             except Exception as ex:
                 show_snackbar(f"❌ Error: {str(ex)}", ft.colors.RED)
+            await refrescar()
         
         dlg = ft.AlertDialog(
             modal=True,
@@ -273,9 +433,13 @@ def main(page: ft.Page):
         
         page.open(dlg)
     
-    def edit_medication(index):
+    async def edit_medication(med_id, e=None):
         """Edita un medicamento existente"""
-        med = app.medicamentos[index]
+        # Si otra sesión lo cambia antes de guardar, la revisión no coincide y no se pisan sus cambios
+        med, revision = await app.leer(app.medicamento, med_id)
+        if med is None:
+            await refrescar()
+            return
         
         nombre_field = ft.TextField(label="Nombre del medicamento", value=med['nombre'])
         descripcion_field = ft.TextField(label="Descripción", value=med.get('descripcion', ''), multiline=True, max_lines=2)
@@ -297,32 +461,34 @@ def main(page: ft.Page):
         dosis_field = ft.TextField(label="Dosis por toma", value=str(med['dosis']), keyboard_type=ft.KeyboardType.NUMBER)
         frecuencia_field = ft.TextField(label="Frecuencia (días)", value=str(med['frecuencia_dias']), keyboard_type=ft.KeyboardType.NUMBER)
         
-        def update_medication(e):
+        async def update_medication(e):
             try:
-                app.medicamentos[index].update({
+                cantidad = float(cantidad_field.value)
+                cambios = {
                     "nombre": nombre_field.value,
                     "descripcion": descripcion_field.value or "",
                     "presentacion": presentacion_dropdown.value,
-                    "cantidad_actual": float(cantidad_field.value),
                     "dosis": float(dosis_field.value),
                     "frecuencia_dias": int(frecuencia_field.value),
-                })
+                }
                 
-                # Recalcular fecha de finalización
-                app.medicamentos[index]["fecha_fin"] = app.calcular_fecha_fin(
-                    float(cantidad_field.value),
-                    float(dosis_field.value),
-                    int(frecuencia_field.value),
-                    app.medicamentos[index].get("fecha_inicio")
-                )
+                def editar(nucleo):
+                    indice = app.paciente.indice(med_id)
+                    nuevo = nucleo.actualizar(indice, dict(nucleo.medicamentos[indice], **cambios))
+                    # Un cambio de cantidad es un ajuste de inventario
+                    if cantidad != nuevo["cantidad_actual"]:
+                        nucleo.registrar_evento(indice, AJUSTE, cantidad)
                 
-                app.save_meds()
-                refresh_medication_list()
+                await app.cambiar(editar, med_id, revision)
+                dlg.open = False
                 show_snackbar("✅ Medicamento actualizado")
-                page.close(dlg)
                 
+            except ConflictoVersion as ex:
+                dlg.open = False
+                show_snackbar(f"⚠️ {ex}. Vuelve a abrirlo para editarlo.", ft.colors.ORANGE)
             except Exception as ex:
                 show_snackbar(f"❌ Error: {str(ex)}", ft.colors.RED)
+            await refrescar()
         
         dlg = ft.AlertDialog(
             modal=True,
@@ -348,16 +514,21 @@ def main(page: ft.Page):
         
         page.open(dlg)
     
-    def delete_medication(index):
+    async def delete_medication(med_id, e=None):
         """Elimina un medicamento"""
-        med = app.medicamentos[index]
+        med, _ = await app.leer(app.medicamento, med_id)
+        if med is None:
+            await refrescar()
+            return
         
-        def confirm_delete(e):
-            app.medicamentos.pop(index)
-            app.save_meds()
-            refresh_medication_list()
-            show_snackbar("🗑️ Medicamento eliminado")
-            page.close(dlg)
+        async def confirm_delete(e):
+            dlg.open = False
+            try:
+                await app.cambiar(lambda nucleo: nucleo.eliminar(app.paciente.indice(med_id)), med_id)
+                show_snackbar("🗑️ Medicamento eliminado")
+            except ConflictoVersion as ex:
+                show_snackbar(f"⚠️ {ex}", ft.colors.ORANGE)
+            await refrescar()
         
         dlg = ft.AlertDialog(
             modal=True,
@@ -372,36 +543,28 @@ def main(page: ft.Page):
         
         page.open(dlg)
     
-    def show_statistics(e):
+    async def show_statistics(e):
         """Muestra estadísticas de medicamentos"""
-        if not app.medicamentos:
+        estadisticas = await app.leer(app.estadisticas)
+        if estadisticas is None:
             show_snackbar("📭 No hay medicamentos para mostrar estadísticas", ft.colors.ORANGE)
+            page.update()
             return
         
-        # Calcular estadísticas
-        total_meds = len(app.medicamentos)
-        meds_activos = len([m for m in app.medicamentos if app.calcular_dias_restantes(m) != "¡AGOTADO!"])
-        meds_agotados = total_meds - meds_activos
+        # Calcular estadísticas (las comparten todas las sesiones del paciente)
+        total_meds = estadisticas["total"]
+        meds_activos = estadisticas["activos"]
+        meds_agotados = estadisticas["agotados"]
+        duraciones = estadisticas["duraciones"]
         
         # Crear gráficas de duración
         duration_charts = []
-        for med in app.medicamentos:
-            dias_restantes = app.calcular_dias_restantes(med)
-            bg_color, text_color = get_urgency_color(dias_restantes)
-            
-            if isinstance(dias_restantes, str) and "días" in dias_restantes:
-                try:
-                    dias_num = int(dias_restantes.split()[0])
-                    progress = min(dias_num / 30, 1.0)  # Máximo 30 días
-                except:
-                    progress = 0
-            else:
-                progress = 0
-            
+        for nombre, dias_restantes, urgencia, progress in estadisticas["duraciones_restantes"]:
+            bg_color, text_color = get_urgency_color(urgencia)
             duration_charts.append(
                 ft.Container(
                     content=ft.Column([
-                        ft.Text(f"💊 {med['nombre']}", weight=ft.FontWeight.BOLD),
+                        ft.Text(f"💊 {nombre}", weight=ft.FontWeight.BOLD),
                         ft.ProgressBar(value=progress, color=text_color, bgcolor=ft.colors.GREY_300),
                         ft.Text(f"{dias_restantes}", size=12, color=text_color)
                     ]),
@@ -412,19 +575,6 @@ def main(page: ft.Page):
                 )
             )
         
-        # Calcular promedios
-        duraciones = []
-        for med in app.medicamentos:
-            if med.get('fecha_inicio') and med.get('fecha_fin'):
-                try:
-                    inicio = datetime.strptime(med['fecha_inicio'], "%Y-%m-%d %H:%M")
-                    fin = datetime.strptime(med['fecha_fin'], "%Y-%m-%d %H:%M")
-                    duracion = (fin - inicio).days
-                    if duracion > 0:
-                        duraciones.append(duracion)
-                except:
-                    continue
-        
         stats_content = ft.Column([
             ft.Card(
                 content=ft.Container(
@@ -486,32 +636,14 @@ def main(page: ft.Page):
         
         page.open(dlg)
     
-    def show_calendar(e):
-        """Muestra calendario de medicamentos"""
+    async def show_calendar(e):
+        """Muestra calendario de medicamentos (hoy y los próximos 7 días, de a una página)"""
         hoy = datetime.now()
-        calendar_content = ft.Column([
-            ft.Card(
-                content=ft.Container(
-                    content=ft.Column([
-                        ft.Text(f"🗓️ HOY - {hoy.strftime('%d/%m/%Y')}", size=16, weight=ft.FontWeight.BOLD),
-                        ft.Divider(),
-                    ]),
-                    padding=15
-                ),
-                bgcolor=ft.colors.BLUE_50
-            )
-        ])
         
-        # Medicamentos de hoy
-        medicamentos_hoy = []
-        for med in app.medicamentos:
-            if es_dia_de_toma(med, hoy):
-                medicamentos_hoy.append(med)
-        
-        if medicamentos_hoy:
-            for med in medicamentos_hoy:
-                calendar_content.controls.append(
-                    ft.Card(
+        def fila_calendario(fecha, med, cantidad):
+            if med is not None:
+                if fecha.date() == hoy.date():
+                    return ft.Card(
                         content=ft.ListTile(
                             leading=ft.Icon(ft.icons.MEDICATION, color=ft.colors.GREEN),
                             title=ft.Text(f"{med['nombre']}"),
@@ -519,60 +651,49 @@ def main(page: ft.Page):
                         ),
                         bgcolor=ft.colors.GREEN_50
                     )
+                return ft.Container(
+                    content=ft.Text(f"💊 {med['nombre']} ({med['dosis']})", size=12),
+                    padding=ft.padding.only(left=25, top=2, bottom=2)
                 )
-        else:
-            calendar_content.controls.append(
-                ft.Card(
-                    content=ft.Container(
-                        content=ft.Text("✅ No hay medicamentos programados para hoy", 
-                                       color=ft.colors.GREY_600),
-                        padding=15
-                    )
-                )
-            )
-        
-        # Próximos 7 días
-        calendar_content.controls.append(
-            ft.Text("📋 PRÓXIMOS 7 DÍAS", size=16, weight=ft.FontWeight.BOLD)
-        )
-        
-        for i in range(1, 8):
-            fecha = hoy + timedelta(days=i)
-            dia_nombre = fecha.strftime('%A')
-            fecha_str = fecha.strftime('%d/%m')
             
-            medicamentos_dia = []
-            for med in app.medicamentos:
-                if es_dia_de_toma(med, fecha):
-                    medicamentos_dia.append(med)
-            
-            day_card = ft.Card(
-                content=ft.Container(
-                    content=ft.Column([
-                        ft.Text(f"📆 {dia_nombre.capitalize()} {fecha_str}", weight=ft.FontWeight.BOLD),
-                        ft.Divider(height=1),
-                    ]),
-                    padding=10
-                )
-            )
-            
-            if medicamentos_dia:
-                for med in medicamentos_dia:
-                    day_card.content.content.controls.append(
-                        ft.Text(f"  💊 {med['nombre']} ({med['dosis']})", size=12)
-                    )
-            else:
-                day_card.content.content.controls.append(
-                    ft.Text("  ✅ Sin medicamentos", size=12, color=ft.colors.GREY_600)
+            if fecha.date() == hoy.date():
+                encabezado = [
+                    ft.Text(f"🗓️ HOY - {hoy.strftime('%d/%m/%Y')}", size=16, weight=ft.FontWeight.BOLD),
+                    ft.Divider(),
+                ]
+                if not cantidad:
+                    encabezado.append(ft.Text("✅ No hay medicamentos programados para hoy",
+                                              color=ft.colors.GREY_600))
+                return ft.Card(
+                    content=ft.Container(content=ft.Column(encabezado), padding=15),
+                    bgcolor=ft.colors.BLUE_50
                 )
             
-            calendar_content.controls.append(day_card)
+            dia_nombre = fecha.strftime('%A')
+            fecha_str = fecha.strftime('%d/%m')
+            encabezado = [
+                ft.Text(f"📆 {dia_nombre.capitalize()} {fecha_str}", weight=ft.FontWeight.BOLD),
+                ft.Divider(height=1),
+            ]
+            if not cantidad:
+                encabezado.append(ft.Text("  ✅ Sin medicamentos", size=12, color=ft.colors.GREY_600))
+            day_card = ft.Card(content=ft.Container(content=ft.Column(encabezado), padding=10))
+            if (fecha.date() - hoy.date()).days == 1:
+                return ft.Column([ft.Text("📋 PRÓXIMOS 7 DÍAS", size=16, weight=ft.FontWeight.BOLD), day_card])
+            return day_card
+        
+        async def cargar(pagina):
+            filas, hay_mas = await app.leer(app.calendario, hoy, pagina)
+            return [fila_calendario(*fila) for fila in filas], hay_mas
+        
+        calendar_content = ListaPaginada(cargar, spacing=2)
+        await calendar_content.siguiente()
         
         dlg = ft.AlertDialog(
             modal=True,
             title=ft.Text("📅 Calendario"),
             content=ft.Container(
-                content=ft.Column(calendar_content.controls, scroll=ft.ScrollMode.AUTO),
+                content=calendar_content,
                 width=500,
                 height=600
             ),
@@ -583,69 +704,58 @@ def main(page: ft.Page):
         
         page.open(dlg)
     
-    def es_dia_de_toma(medicamento, fecha):
-        """Determina si un medicamento debe tomarse en una fecha específica"""
-        if not medicamento.get('fecha_inicio'):
-            return False
-        
-        try:
-            inicio = datetime.strptime(medicamento['fecha_inicio'], "%Y-%m-%d %H:%M")
-            frecuencia = int(medicamento.get('frecuencia_dias', 1))
+    async def show_history(e):
+        """Muestra historial de notificaciones (de a una página)"""
+        
+        def tarjeta_notificacion(notif):
+            if notif['tipo'] == 'dosis':
+                icon = ft.icons.MEDICATION
+                color = ft.colors.GREEN
+            elif notif['tipo'] == 'stock_bajo':
+                icon = ft.icons.WARNING
+                color = ft.colors.ORANGE
+            else:
+                icon = ft.icons.ERROR
+                color = ft.colors.RED
             
-            dias_desde_inicio = (fecha.date() - inicio.date()).days
-            return dias_desde_inicio >= 0 and dias_desde_inicio % frecuencia == 0
-        except:
-            return False
-    
-    def show_history(e):
-        """Muestra historial de notificaciones"""
-        history_content = ft.Column([])
-        
-        if not app.historial_notificaciones:
-            history_content.controls.append(
-                ft.Container(
-                    content=ft.Column([
-                        ft.Icon(ft.icons.HISTORY, size=64, color=ft.colors.GREY_400),
-                        ft.Text("No hay notificaciones en el historial", 
-                               color=ft.colors.GREY_600, text_align=ft.TextAlign.CENTER)
-                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                    padding=40,
-                    alignment=ft.alignment.center
+            return ft.Card(
+                content=ft.ListTile(
+                    leading=ft.Icon(icon, color=color),
+                    title=ft.Text(notif['medicamento']),
+                    subtitle=ft.Text(f"{notif['mensaje']}\n🕐 {notif['fecha']}", size=12),
                 )
             )
-        else:
-            for notif in reversed(app.historial_notificaciones[-20:]):
-                if notif['tipo'] == 'dosis':
-                    icon = ft.icons.MEDICATION
-                    color = ft.colors.GREEN
-                elif notif['tipo'] == 'stock_bajo':
-                    icon = ft.icons.WARNING
-                    color = ft.colors.ORANGE
-                else:
-                    icon = ft.icons.ERROR
-                    color = ft.colors.RED
-                
-                history_content.controls.append(
-                    ft.Card(
-                        content=ft.ListTile(
-                            leading=ft.Icon(icon, color=color),
-                            title=ft.Text(notif['medicamento']),
-                            subtitle=ft.Text(f"{notif['mensaje']}\n🕐 {notif['fecha']}", size=12),
-                        )
+        
+        async def cargar(pagina):
+            notificaciones, hay_mas = await app.leer(app.historial, pagina)
+            if pagina == 0 and not notificaciones:
+                return [
+                    ft.Container(
+                        content=ft.Column([
+                            ft.Icon(ft.icons.HISTORY, size=64, color=ft.colors.GREY_400),
+                            ft.Text("No hay notificaciones en el historial", 
+                                   color=ft.colors.GREY_600, text_align=ft.TextAlign.CENTER)
+                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                        padding=40,
+                        alignment=ft.alignment.center
                     )
-                )
+                ], False
+            return [tarjeta_notificacion(notif) for notif in notificaciones], hay_mas
         
-        def clear_history(e):
-            app.historial_notificaciones = []
-            app.save_historial()
+        history_content = ListaPaginada(cargar)
+        await history_content.siguiente()
+        
+        async def clear_history(e):
+            await app.cambiar(lambda nucleo: nucleo.limpiar_historial())
+            dlg.open = False
             show_snackbar("🗑️ Historial limpiado")
-            page.close(dlg)
+            page.update()
         
         dlg = ft.AlertDialog(
             modal=True,
             title=ft.Text("📋 Historial"),
             content=ft.Container(
-                content=ft.Column(history_content.controls, scroll=ft.ScrollMode.AUTO),
+                content=history_content,
                 width=500,
                 height=600
             ),
@@ -658,7 +768,7 @@ def main(page: ft.Page):
         page.open(dlg)
     
     # Lista de medicamentos
-    medication_list = ft.Column([], scroll=ft.ScrollMode.AUTO, expand=True)
+    medication_list = ft.ListView(expand=True, on_scroll=mas_medicamentos, on_scroll_interval=100)
     
     # Barra de aplicación
     app_bar = ft.AppBar(
@@ -713,8 +823,121 @@ def main(page: ft.Page):
     
     page.floating_action_button = fab
     
-    # Cargar medicamentos iniciales
-    refresh_medication_list()
+    # ---------------- sesión ----------------
+    def al_cambiar(version, origen):
+        """Otra sesión del mismo paciente cambió sus datos (llega desde el hilo de esa sesión)
+
+        Solo agenda el redibujo en el loop de esta página y vuelve: la sesión
+        que cambió no espera a las demás, y `tarjetas` y la lista se tocan
+        únicamente desde el loop de su propia sesión.
+        """
+        if app is None or origen is app:
+            return
+        page.run_task(redibujar)
+    
+    async def redibujar():
+        # La sesión pudo cerrarse entre el aviso y la ejecución
+        if app is not None:
+            await refrescar()
+    
+    async def iniciar_sesion(nombre, token):
+        """Abre los datos del paciente; lanza AccesoDenegado si el token no vale"""
+        nonlocal app
+        # La primera sesión del paciente carga sus archivos: fuera del event loop
+        app = MedicationTrackerApp(await asyncio.to_thread(almacen.abrir, nombre, token), token)
+        app.paciente.suscribir(al_cambiar)
+        show_snackbar(f"¡Hola, {app.usuario_actual}!")
+        await refrescar()
+    
+    async def terminar_sesion(e=None):
+        nonlocal app
+        if app is None:
+            return
+        paciente, app = app.paciente, None
+        paciente.desuscribir(al_cambiar)
+        await asyncio.to_thread(almacen.soltar, paciente)
+    
+    async def escribir_pendientes(e):
+        if app is not None:
+            await app.leer(app.paciente.flush)
+    
+    def pedir_usuario():
+        """Pide nombre y contraseña del paciente; sus datos se guardan aparte de los demás"""
+        nombre_field = ft.TextField(label="Tu nombre", autofocus=True)
+        clave_field = ft.TextField(label="Contraseña", password=True, can_reveal_password=True)
+        
+        async def entrar(e):
+            nombre = (nombre_field.value or "").strip()
+            clave = clave_field.value or ""
+            nombre_field.error_text = None
+            clave_field.error_text = None
+            if not nombre:
+                nombre_field.error_text = "Debes ingresar un nombre"
+                page.update()
+                return
+            try:
+                # PBKDF2 tarda a propósito: fuera del event loop
+                token = await asyncio.to_thread(almacen.entrar, nombre, clave)
+            except AccesoDenegado as ex:
+                clave_field.error_text = str(ex)
+                page.update()
+                return
+            await page.client_storage.set_async("paciente", nombre)
+            await page.client_storage.set_async("token", token)
+            dlg.open = False
+            await iniciar_sesion(nombre, token)
+        
+        nombre_field.on_submit = entrar
+        clave_field.on_submit = entrar
+        dlg = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("👋 ¡Bienvenida/o!"),
+            content=ft.Column([
+                nombre_field,
+                clave_field,
+                ft.Text("La primera vez, la contraseña que elijas queda registrada para tu nombre.",
+                        size=12, color=ft.colors.GREY_600),
+            ], tight=True),
+            actions=[ft.ElevatedButton("Entrar", on_click=entrar)],
+            actions_alignment=ft.MainAxisAlignment.END,
+        )
+        page.open(dlg)
+    
+    async def cerrar_sesion(e):
+        nonlocal visibles
+        if app is None:
+            return
+        nombre, token = app.usuario_actual, app.token
+        await terminar_sesion()
+        await asyncio.to_thread(almacen.salir, nombre, token)
+        visibles = TAMANO_PAGINA
+        await page.client_storage.remove_async("paciente")
+        await page.client_storage.remove_async("token")
+        medication_list.controls.clear()
+        tarjetas.clear()
+        pedir_usuario()
+    
+    app_bar.actions.append(
+        ft.IconButton(
+            icon=ft.icons.LOGOUT,
+            tooltip="Cerrar sesión",
+            on_click=cerrar_sesion,
+            icon_color=ft.colors.WHITE
+        )
+    )
+    page.on_disconnect = escribir_pendientes
+    page.on_close = terminar_sesion
+    
+    # La sesión anterior del navegador se retoma con su token, sin volver a pedir la contraseña
+    usuario_guardado = await page.client_storage.get_async("paciente")
+    token_guardado = await page.client_storage.get_async("token")
+    try:
+        if not (usuario_guardado and token_guardado):
+            raise AccesoDenegado("Sin sesión guardada")
+        await iniciar_sesion(usuario_guardado, token_guardado)
+    except AccesoDenegado:
+        await page.client_storage.remove_async("token")
+        pedir_usuario()
 
 if __name__ == "__main__":
     ft.app(target=main, port=8080, view=ft.AppView.WEB_BROWSER)
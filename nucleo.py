@@ -0,0 +1,303 @@
+"""Núcleo de la app, sin interfaz: medicamentos, inventario, horario e historial.
+
+``Tracker`` reúne lo que antes repetían ``MainScreen`` (Kivy) y
+``MedicationTrackerApp`` (Flet): carga y guardado en ``storage``, el diario de
+tomas y el inventario, los índices de horario y de días restantes, el checklist
+del día y el historial de notificaciones. Las dos interfaces lo usan igual y
+también se puede usar solo (scripts, mediciones), sin importar Kivy ni Flet.
+
+Los guardados pasan por un ``SaveCoalescer``; ``programar`` decide cuándo se
+escriben. Por defecto se escriben enseguida; la app Kivy los agrupa por frame.
+"""
+from datetime import datetime
+
+from archivo_historial import ArchivoHistorial
+from columnas import VistaColumnar, formatear_dias
+from historial import HistorialNotificaciones
+from horario import FORMATO_FECHA, ScheduleIndex, compilar, dia_epoch
+from inventario import Inventario
+from journal import AJUSTE, BAJA, DESHACER, IntakeJournal
+from storage import SaveCoalescer, asegurar_id, crear_storage
+from tracing import medir, span
+
+
+def guardar_ya(callback, segundos):
+    """`programar` sin espera: cada guardado se escribe en el momento"""
+    callback()
+
+
+def es_dia_de_toma(medicamento, fecha):
+    """Determina si un medicamento debe tomarse en una fecha específica
+
+    Para medicamentos de la lista usar `Tracker.horario`, que no vuelve a parsear fechas.
+    """
+    # Sin fecha de inicio o con datos inválidos se asume que debe tomarse
+    inicio, periodo = compilar(medicamento)
+    if not periodo:
+        return True
+    dias_desde_inicio = dia_epoch(fecha) - inicio
+    return dias_desde_inicio >= 0 and dias_desde_inicio % periodo == 0
+
+
+def calcular_dias_restantes(medicamento, ahora=None):
+    """Texto con los días que faltan para que se acabe el medicamento"""
+    if not medicamento.get("fecha_fin"):
+        return "Sin fecha"
+    try:
+        fecha_fin = datetime.strptime(medicamento["fecha_fin"], FORMATO_FECHA)
+    except (TypeError, ValueError):
+        return "Error"
+    dias_restantes = (fecha_fin - (ahora or datetime.now())).days
+    if dias_restantes < 0:
+        return "¡AGOTADO!"
+    return f"{dias_restantes} días"
+
+
+class Tracker:
+    """Medicamentos, checklist e historial de un usuario, con su persistencia"""
+
+    def __init__(self, storage=None, journal=None, archivo=None, programar=guardar_ya):
+        self.storage = storage or crear_storage()
+        self.guardado = SaveCoalescer(programar)
+        self.journal = journal or IntakeJournal()
+        # El diario compacta en su hilo; save_meds solo encola el guardado
+        self.journal.on_compactado = self.save_meds
+        self.journal.cargar()
+        self.inventario = Inventario(self.journal)
+        self.horario = ScheduleIndex()
+        self.columnas = VistaColumnar()
+        self.historial = HistorialNotificaciones(capacidad=self.storage.limite_historial)
+        # Todas las notificaciones, para buscarlas por medicamento, tipo o mes
+        self.archivo = archivo or ArchivoHistorial()
+        self.medicamentos = []
+        self.checklist = {}
+        # La interfaz se entera de los medicamentos guardados o eliminados (p. ej. para los avisos)
+        self.al_guardar = lambda med: None
+        self.al_eliminar = lambda med: None
+
+    def iniciar(self):
+        """Arranca la compactación del diario en segundo plano"""
+        self.journal.iniciar()
+
+    # ---------------- medicamentos ----------------
+    @medir("load_meds")
+    def cargar(self):
+        try:
+            self.medicamentos = self.storage.load_meds()
+            if self.inventario.cargar(self.medicamentos):
+                self.save_meds()
+        except Exception as e:
+            print(f"Error cargando medicamentos: {e}")
+            self.medicamentos = []
+        self.horario.reconstruir(self.medicamentos)
+        self.columnas.reconstruir(self.medicamentos)
+
+    def save_meds(self):
+        def guardar():
+            with span("save_meds", filas=len(self.medicamentos)):
+                self.storage.save_meds(self.medicamentos)
+
+        self.guardado.schedule("meds", guardar)
+
+    def save_med(self, indice):
+        """Guarda solo el medicamento modificado"""
+        if not 0 <= indice < len(self.medicamentos):
+            return
+        med = self.medicamentos[indice]
+        self.columnas.actualizar(indice, med)
+        self.al_guardar(med)
+        if not self.storage.escritura_por_fila:
+            self.save_meds()
+            return
+
+        def guardar():
+            # La posición pudo cambiar si se eliminó otro medicamento antes del flush
+            posicion = indice
+            if posicion >= len(self.medicamentos) or self.medicamentos[posicion] is not med:
+                if med not in self.medicamentos:
+                    return
+                posicion = self.medicamentos.index(med)
+            with span("save_med"):
+                self.storage.save_med(posicion, med)
+
+        self.guardado.schedule(("med", med["id"]), guardar)
+
+    def save_meds_cambiados(self, indices):
+        """Guarda varios medicamentos modificados en una sola escritura"""
+        indices = [i for i in indices if 0 <= i < len(self.medicamentos)]
+        for i in indices:
+            self.columnas.actualizar(i, self.medicamentos[i])
+            self.al_guardar(self.medicamentos[i])
+        if not self.storage.escritura_por_fila:
+            self.save_meds()
+            return
+        meds = [self.medicamentos[i] for i in indices]
+
+        def guardar():
+            posiciones = {id(med): i for i, med in enumerate(self.medicamentos)}
+            filas = [(posiciones[id(med)], med) for med in meds if id(med) in posiciones]
+            with span("save_med_filas", filas=len(filas)):
+                self.storage.save_med_filas(filas)
+
+        self.guardado.schedule(("meds", tuple(med["id"] for med in meds)), guardar)
+
+    def agregar(self, med, cantidad=None):
+        """Da de alta un medicamento nuevo con `cantidad` en stock; devuelve su índice"""
+        asegurar_id(med)
+        if cantidad is None:
+            cantidad = self.inventario.cantidad(med)
+        self.inventario.registrar(med, AJUSTE, cantidad)
+        self.medicamentos.append(med)
+        self.horario.agregar(med)
+        self.columnas.agregar(med)
+        indice = len(self.medicamentos) - 1
+        self.save_med(indice)
+        return indice
+
+    def actualizar(self, indice, nuevo):
+        """Reemplaza los datos de un medicamento conservando su id y su cantidad"""
+        anterior = self.medicamentos[indice]
+        nuevo["id"] = anterior.get("id")
+        nuevo["cantidad_actual"] = anterior.get("cantidad_actual", nuevo.get("cantidad_total", 0))
+        # Plan o dosis pueden haber cambiado: proyectar de nuevo desde ahora
+        self.inventario.reanclar(nuevo)
+        self.medicamentos[indice] = nuevo
+        self.horario.actualizar(indice, nuevo)
+        self.save_med(indice)
+        return nuevo
+
+    def eliminar(self, indice):
+        """Quita el medicamento de la lista, del almacenamiento y del diario; lo devuelve"""
+        med = self.medicamentos.pop(indice)
+        self.horario.eliminar(indice)
+        self.columnas.eliminar(indice)
+        self._desplazar_checklist(indice)
+        self.al_eliminar(med)
+        if self.storage.escritura_por_fila:
+            self.guardado.schedule(("baja", med["id"]), lambda: self.storage.delete_med(med["id"]))
+        else:
+            self.save_meds()
+        self.journal.registrar(BAJA, med.get("id"))
+        return med
+
+    def dias_restantes(self, indice, ahora=None):
+        """Texto de días restantes de un medicamento de la lista, sin parsear su fecha"""
+        return formatear_dias(*self.columnas.fila(indice, ahora))
+
+    # ---------------- diario de tomas ----------------
+    def registrar_evento(self, indice, tipo, cantidad):
+        """Agrega una toma/deshacer/compra al inventario y actualiza cantidad y fecha de fin"""
+        med = self.medicamentos[indice]
+        fecha_fin = med.get("fecha_fin")
+        self.inventario.registrar(med, tipo, cantidad)
+        if med.get("fecha_fin") != fecha_fin:
+            self.save_med(indice)
+        else:
+            # La cantidad ya quedó en el diario: el medicamento no hace falta guardarlo
+            self.columnas.actualizar(indice, med)
+        return med["cantidad_actual"]
+
+    def deshacer_toma(self, indice, cantidad=None):
+        """Devuelve la cantidad de una toma de hoy que se desmarcó (una dosis por defecto)"""
+        med = self.medicamentos[indice]
+        if cantidad is None:
+            cantidad = med.get("dosis", 0)
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        tomado_hoy = self.journal.consumo_diario(med["id"]).get(hoy, 0)
+        if tomado_hoy > 0:
+            self.registrar_evento(indice, DESHACER, min(cantidad, tomado_hoy))
+
+    # ---------------- checklist ----------------
+    def cargar_checklist(self):
+        """Carga el checklist del día actual"""
+        try:
+            hoy = datetime.now().strftime("%Y-%m-%d")
+            self.checklist = self.storage.load_checklist(hoy)
+        except Exception as e:
+            print(f"Error cargando checklist: {e}")
+            self.checklist = {}
+
+    def _desplazar_checklist(self, indice):
+        """El checklist va por posición: quita la del eliminado y baja una las posteriores"""
+        desplazado = {}
+        for clave, valor in self.checklist.items():
+            posicion = int(clave)
+            if posicion != indice:
+                desplazado[str(posicion - 1 if posicion > indice else posicion)] = valor
+        if desplazado != self.checklist:
+            self.checklist.clear()
+            self.checklist.update(desplazado)
+            # Reescribe el día completo: las entradas sueltas quedarían con la posición vieja
+            self.save_checklist()
+
+    def save_checklist(self):
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        self.guardado.schedule("checklist", lambda: self.storage.save_checklist(hoy, self.checklist))
+
+    def save_checklist_item(self, indice):
+        """Guarda solo la entrada del checklist que cambió"""
+        if not self.storage.escritura_por_fila:
+            self.save_checklist()
+            return
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        clave = str(indice)
+        self.guardado.schedule(
+            ("checklist", clave),
+            lambda: self.storage.save_checklist_item(hoy, clave, self.checklist.get(clave, False)),
+        )
+
+    # ---------------- historial ----------------
+    def cargar_historial(self):
+        try:
+            self.historial.cargar(self.storage.load_historial())
+        except Exception:
+            self.historial.limpiar()
+        try:
+            self.archivo.importar(self.historial.recientes_primero())
+        except Exception as e:
+            print(f"Error importando historial al archivo: {e}")
+
+    def save_historial(self):
+        self.guardado.schedule("historial", lambda: self.storage.save_historial(self.historial.recientes_primero()))
+
+    def agregar_notificacion(self, tipo, medicamento, mensaje, detalle=None):
+        """Agrega una notificación al historial y al archivo; la devuelve
+
+        Con `detalle` ([(medicamento, mensaje)]) es un resumen de varios
+        medicamentos: el historial muestra una sola línea y el archivo guarda
+        una por medicamento, para encontrarlas al buscar por nombre.
+        """
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        def crear(medicamento, mensaje):
+            return {
+                "fecha": fecha,
+                "tipo": tipo,  # "dosis", "stock_bajo", "agotado"
+                "medicamento": medicamento,
+                "mensaje": mensaje,
+                "leida": False
+            }
+
+        notificacion = crear(medicamento, mensaje)
+        archivadas = [crear(*fila) for fila in detalle] if detalle else [notificacion]
+        # El buffer descarta solo la más vieja al llegar a la capacidad
+        self.historial.agregar(notificacion)
+        self.guardado.schedule(("historial", id(notificacion)), lambda: self.storage.add_historial(notificacion))
+        self.guardado.schedule(("archivo", id(notificacion)), lambda: self.archivo.agregar_varias(archivadas))
+        return notificacion
+
+    def limpiar_historial(self):
+        self.historial.limpiar()
+        self.save_historial()
+
+    # ---------------- cierre ----------------
+    def flush(self):
+        """Escribe ya los guardados pendientes"""
+        self.guardado.flush()
+        self.journal.sync()
+
+    def cerrar(self):
+        self.flush()
+        self.journal.cerrar()
+        self.storage.close()
+        self.archivo.close()
@@ -0,0 +1,24 @@
+"""Hook de python-for-android: registra ReceptorAvisos en el AndroidManifest.xml.
+
+buildozer no tiene una opción para declarar receivers; este hook lo agrega al
+manifiesto generado antes de empaquetar el APK.
+"""
+from pathlib import Path
+
+RECEPTOR = """
+    <receiver android:name="com.juanita.medicamentos.medicamentostracker.ReceptorAvisos"
+              android:exported="true">
+        <intent-filter>
+            <action android:name="android.intent.action.BOOT_COMPLETED" />
+        </intent-filter>
+    </receiver>
+"""
+
+
+def after_apk_build(toolchain):
+    manifest = Path(toolchain._dist.dist_dir) / "src" / "main" / "AndroidManifest.xml"
+    texto = manifest.read_text(encoding="utf-8")
+    if "ReceptorAvisos" in texto:
+        return
+    texto = texto.replace("</application>", RECEPTOR + "</application>", 1)
+    manifest.write_text(texto, encoding="utf-8")
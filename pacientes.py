@@ -0,0 +1,294 @@
+"""Datos de varios pacientes en un mismo proceso (servidor web de Flet).
+
+Cada paciente tiene su carpeta (``pacientes/<nombre>-<hash>/``) con su base,
+su diario de tomas, su archivo de notificaciones y su contraseña (``acceso``):
+``abrir`` exige el token que devuelve ``entrar``. ``AlmacenPacientes`` es
+único por proceso y guarda un ``Paciente`` por usuario conectado: todas las
+sesiones de un mismo paciente comparten el mismo ``nucleo.Tracker`` en memoria,
+en lugar de leer los archivos cada una y pisarse los guardados.
+
+Los cambios se hacen dentro de ``Paciente.cambio()``, que toma el lock del
+paciente. Para editar lo que otra sesión pudo cambiar mientras tanto (un
+diálogo abierto), se pasa la revisión leída al abrirlo: si el medicamento
+cambió o se eliminó, ``cambio()`` lanza ``ConflictoVersion`` en lugar de
+pisarlo. Al terminar cada cambio se avisa a las sesiones suscritas para que
+redibujen.
+
+Lo que se deriva de los datos (días restantes, calendario, estadísticas) se
+calcula una sola vez por cambio con ``Paciente.vista()`` y lo comparten todas
+las sesiones del paciente: cada ``cambio()`` descarta esas vistas. Además cada
+una vence por su cuenta: a la medianoche, o (``vence=cambio_de_dias``) cuando
+cambia algún "N días" restante.
+
+Los guardados no se escriben dentro del cambio: el ``SaveCoalescer`` de cada
+núcleo los encola en un pool de hilos del almacén (los que llegan mientras uno
+espera se escriben juntos), así un handler nunca espera al disco. Cada
+escritura toma el lock de su paciente, de modo que lee un estado consistente.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from acceso import AccesoDenegado, Accesos
+from archivo_historial import ARCHIVO_FILE, ArchivoHistorial
+from journal import JOURNAL_FILE, SNAPSHOT_FILE, IntakeJournal
+from nucleo import Tracker, guardar_ya
+from storage import crear_storage
+
+PACIENTES_DIR = "pacientes"
+# Hilos que escriben los guardados de todos los pacientes
+ESCRITORES = 4
+
+
+class ConflictoVersion(Exception):
+    """El medicamento cambió (o se eliminó) en otra sesión"""
+
+
+def medianoche(nucleo, ahora):
+    """Vencimiento de las vistas que dependen del día (calendario, lo que toca hoy)"""
+    return datetime.combine(ahora.date() + timedelta(days=1), time())
+
+
+def cambio_de_dias(nucleo, ahora):
+    """Vencimiento de las vistas con días restantes: cuando cambia el de algún medicamento"""
+    vence = medianoche(nucleo, ahora)
+    segundos = nucleo.columnas.proximo_cambio(ahora)
+    if segundos is not None:
+        vence = min(vence, ahora + timedelta(seconds=segundos))
+    return vence
+
+
+def carpeta_paciente(usuario):
+    """Nombre de carpeta seguro y estable para un usuario (sin distinguir mayúsculas)"""
+    normalizado = " ".join(usuario.split()).lower()
+    ascii_ = unicodedata.normalize("NFKD", normalizado).encode("ascii", "ignore").decode("ascii")
+    legible = re.sub(r"[^a-z0-9]+", "-", ascii_).strip("-")[:32] or "paciente"
+    # El hash distingue nombres que se ven iguales una vez simplificados
+    return f"{legible}-{hashlib.sha1(normalizado.encode('utf-8')).hexdigest()[:8]}"
+
+
+class Paciente:
+    """Los datos de un usuario, compartidos por todas sus sesiones"""
+
+    def __init__(self, usuario, crear_nucleo, escritor=None):
+        """`crear_nucleo(programar)` arma el Tracker; sin `escritor` se guarda en el momento"""
+        self.usuario = usuario
+        self.lock = threading.RLock()
+        self.version = 0
+        self._revisiones = {}
+        self._oyentes = []
+        # Vistas derivadas de la versión actual: clave -> (valor, vence)
+        self._vistas = {}
+        self._escritor = escritor
+        self.nucleo = crear_nucleo(self.programar if escritor else guardar_ya)
+        # La compactación del diario guarda desde su hilo: que no se cruce con una sesión
+        self.nucleo.journal.on_compactado = self._guardar_compactado
+
+    def _guardar_compactado(self):
+        with self.lock:
+            self.nucleo.save_meds()
+
+    def programar(self, callback, segundos):
+        """`programar` del SaveCoalescer: el flush corre en el pool, con el lock del paciente"""
+        self._escritor.submit(self._escribir, callback)
+
+    def _escribir(self, callback):
+        with self.lock:
+            callback()
+
+    def flush(self):
+        """Escribe ya los guardados pendientes del paciente"""
+        with self.lock:
+            self.nucleo.flush()
+
+    # ---------------- lectura ----------------
+    def indice(self, med_id):
+        """Posición actual del medicamento `med_id` en la lista, o None"""
+        with self.lock:
+            for i, med in enumerate(self.nucleo.medicamentos):
+                if med.get("id") == med_id:
+                    return i
+        return None
+
+    def revision(self, med_id):
+        with self.lock:
+            return self._revisiones.get(med_id, 0)
+
+    def vista(self, clave, calcular, vence=medianoche):
+        """Resultado de `calcular(nucleo)` para la versión actual, compartido por las sesiones
+
+        Se calcula una vez hasta el próximo cambio o hasta `vence(nucleo, ahora)`
+        (por defecto, la medianoche); las sesiones no deben modificar lo que devuelve.
+        """
+        with self.lock:
+            ahora = datetime.now()
+            guardada = self._vistas.get(clave)
+            if guardada is not None and ahora < guardada[1]:
+                return guardada[0]
+            valor = calcular(self.nucleo)
+            # Las vencidas (p. ej. el calendario de ayer) no esperan al próximo cambio
+            self._vistas = {k: v for k, v in self._vistas.items() if ahora < v[1]}
+            self._vistas[clave] = (valor, vence(self.nucleo, ahora))
+            return valor
+
+    # ---------------- cambios ----------------
+    @contextmanager
+    def cambio(self, med_id=None, revision=None, origen=None):
+        """Bloquea al paciente mientras se modifica su núcleo
+
+        Con `med_id` verifica que el medicamento siga existiendo (y, con
+        `revision`, que nadie lo haya cambiado desde entonces) y le sube la
+        revisión al terminar. `origen` (la sesión que cambia) se pasa a los
+        oyentes, para que esa sesión no redibuje dos veces.
+        """
+        with self.lock:
+            if med_id is not None:
+                if self.indice(med_id) is None:
+                    raise ConflictoVersion("El medicamento fue eliminado en otra sesión")
+                if revision is not None and self.revision(med_id) != revision:
+                    raise ConflictoVersion("El medicamento fue modificado en otra sesión")
+            yield self.nucleo
+            self.version += 1
+            self._vistas.clear()
+            if med_id is not None:
+                self._revisiones[med_id] = self._revisiones.get(med_id, 0) + 1
+            version = self.version
+        self._avisar(version, origen)
+
+    def suscribir(self, oyente):
+        """`oyente(version, origen)` se llama (fuera del lock) después de cada cambio"""
+        with self.lock:
+            self._oyentes.append(oyente)
+
+    def desuscribir(self, oyente):
+        with self.lock:
+            if oyente in self._oyentes:
+                self._oyentes.remove(oyente)
+
+    def _avisar(self, version, origen):
+        with self.lock:
+            oyentes = list(self._oyentes)
+        for oyente in oyentes:
+            try:
+                oyente(version, origen)
+            except Exception as e:
+                print(f"Error avisando cambio de {self.usuario}: {e}")
+
+
+class AlmacenPacientes:
+    """Un `Paciente` por usuario conectado, cargado una sola vez por proceso"""
+
+    def __init__(self, directorio=PACIENTES_DIR, backend=None):
+        self.directorio = directorio
+        self.backend = backend
+        # carpeta -> Future del Paciente: la carga de uno no frena a los demás
+        self._pacientes = {}
+        self._sesiones = {}
+        # carpeta -> Future que se completa cuando terminó de cerrarse
+        self._cierres = {}
+        self._lock = threading.Lock()
+        self._escritor = ThreadPoolExecutor(max_workers=ESCRITORES, thread_name_prefix="guardado")
+        self.accesos = Accesos(directorio)
+
+    def _crear_nucleo(self, carpeta, programar):
+        ruta = os.path.join(self.directorio, carpeta)
+        os.makedirs(ruta, exist_ok=True)
+        nucleo = Tracker(
+            storage=crear_storage(self.backend, directorio=ruta),
+            journal=IntakeJournal(os.path.join(ruta, JOURNAL_FILE), os.path.join(ruta, SNAPSHOT_FILE)),
+            archivo=ArchivoHistorial(os.path.join(ruta, ARCHIVO_FILE)),
+            programar=programar,
+        )
+        nucleo.cargar()
+        nucleo.cargar_checklist()
+        nucleo.cargar_historial()
+        nucleo.iniciar()
+        return nucleo
+
+    def entrar(self, usuario, clave):
+        """Token para `abrir` los datos de `usuario` (la primera vez registra la contraseña)
+
+        Lanza `AccesoDenegado` si la contraseña no coincide.
+        """
+        return self.accesos.entrar(carpeta_paciente(usuario), clave)
+
+    def salir(self, usuario, token):
+        """Revoca el token de una sesión cerrada"""
+        self.accesos.revocar(carpeta_paciente(usuario), token)
+
+    def abrir(self, usuario, token):
+        """El paciente de `usuario` (lo carga si es la primera sesión); cerrar con `soltar`
+
+        Lanza `AccesoDenegado` si `token` no es uno vigente de ese paciente.
+        El lock del almacén solo registra la sesión: la primera carga los
+        archivos fuera de él y las demás sesiones del mismo paciente la esperan.
+        """
+        carpeta = carpeta_paciente(usuario)
+        if not self.accesos.token_valido(carpeta, token):
+            raise AccesoDenegado("La sesión no es válida; vuelve a entrar")
+        with self._lock:
+            futuro = self._pacientes.get(carpeta)
+            cargar = futuro is None
+            if cargar:
+                futuro = self._pacientes[carpeta] = Future()
+                cierre = self._cierres.get(carpeta)
+            self._sesiones[carpeta] = self._sesiones.get(carpeta, 0) + 1
+        if cargar:
+            try:
+                # Si la última sesión anterior lo está cerrando, no abrir sus archivos a la vez
+                if cierre is not None:
+                    cierre.result()
+                futuro.set_result(Paciente(usuario, lambda programar: self._crear_nucleo(carpeta, programar),
+                                           self._escritor))
+            except BaseException as e:
+                with self._lock:
+                    # Todas las sesiones que esperaban esta carga reciben el error
+                    self._pacientes.pop(carpeta, None)
+                    self._sesiones.pop(carpeta, None)
+                futuro.set_exception(e)
+                raise
+        return futuro.result()
+
+    def soltar(self, paciente):
+        """Fin de una sesión: escribe lo pendiente y libera al paciente si era la última"""
+        carpeta = carpeta_paciente(paciente.usuario)
+        with self._lock:
+            self._sesiones[carpeta] -= 1
+            ultima = self._sesiones[carpeta] <= 0
+            if ultima:
+                del self._sesiones[carpeta]
+                self._pacientes.pop(carpeta, None)
+                cierre = self._cierres[carpeta] = Future()
+        if not ultima:
+            paciente.flush()
+            return
+        try:
+            with paciente.lock:
+                paciente.nucleo.cerrar()
+        finally:
+            with self._lock:
+                if self._cierres.get(carpeta) is cierre:
+                    del self._cierres[carpeta]
+            cierre.set_result(None)
+
+    def cerrar(self):
+        with self._lock:
+            futuros = list(self._pacientes.values())
+            cierres = list(self._cierres.values())
+            self._pacientes.clear()
+            self._sesiones.clear()
+        for cierre in cierres:
+            cierre.result()
+        for futuro in futuros:
+            try:
+                paciente = futuro.result()
+            except Exception:
+                continue
+            with paciente.lock:
+                paciente.nucleo.cerrar()
+        self._escritor.shutdown(wait=True)
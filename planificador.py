@@ -0,0 +1,114 @@
+"""Planificador de avisos: un solo hilo que duerme hasta el próximo vencimiento.
+
+Cada aviso es una clave con un instante (``time.time()``) en un heap. El hilo
+espera en una ``Condition`` exactamente hasta el primero; programar o cancelar
+un aviso lo despierta para recalcular. Reprogramar una clave no busca la
+entrada vieja en el heap: se descarta al salir porque su versión no coincide.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+# El reloj de las esperas se detiene mientras el dispositivo duerme: nunca se
+# espera más que esto seguido, para volver a mirar la hora real
+ESPERA_MAXIMA = 15 * 60
+
+
+class Planificador:
+    """Ejecuta `disparar(clave)` en el hilo del planificador cuando vence cada clave"""
+
+    def __init__(self, disparar, reloj=time.time):
+        self._disparar = disparar
+        self._reloj = reloj
+        self._heap = []
+        self._versiones = {}
+        self._contador = itertools.count()
+        self._cond = threading.Condition()
+        self._detener = False
+        self._hilo = None
+
+    def programar(self, clave, instante):
+        """Programa (o reprograma) `clave` para `instante`; None la cancela"""
+        with self._cond:
+            if instante is None:
+                if self._versiones.pop(clave, None) is not None:
+                    self._cond.notify()
+                return
+            version = next(self._contador)
+            self._versiones[clave] = version
+            heapq.heappush(self._heap, (instante, version, clave))
+            # Solo hace falta despertar al hilo si el nuevo es el primero
+            if self._heap[0][1] == version:
+                self._cond.notify()
+
+    def cancelar(self, clave):
+        self.programar(clave, None)
+
+    def limpiar(self):
+        with self._cond:
+            self._heap = []
+            self._versiones = {}
+            self._cond.notify()
+
+    def vencimiento(self, clave):
+        """Instante programado de `clave` o None"""
+        with self._cond:
+            version = self._versiones.get(clave)
+            if version is None:
+                return None
+            for instante, v, c in self._heap:
+                if v == version:
+                    return instante
+        return None
+
+    def proximo(self):
+        """(instante, clave) del próximo aviso o None"""
+        with self._cond:
+            self._descartar_viejos()
+            if not self._heap:
+                return None
+            instante, _, clave = self._heap[0]
+            return instante, clave
+
+    def _descartar_viejos(self):
+        while self._heap and self._versiones.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    # ---------------- hilo ----------------
+    def iniciar(self):
+        with self._cond:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener = False
+            self._hilo = threading.Thread(target=self._worker, name="planificador", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        with self._cond:
+            self._detener = True
+            self._cond.notify()
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+            self._hilo = None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._detener:
+                        return
+                    self._descartar_viejos()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    espera = self._heap[0][0] - self._reloj()
+                    if espera <= 0:
+                        _, version, clave = heapq.heappop(self._heap)
+                        del self._versiones[clave]
+                        break
+                    self._cond.wait(min(espera, ESPERA_MAXIMA))
+            try:
+                self._disparar(clave)
+            except Exception as e:
+                print(f"Error en aviso programado {clave}: {e}")
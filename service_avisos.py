@@ -0,0 +1,71 @@
+"""Servicio de Android que muestra un aviso vencido y arma los siguientes.
+
+Lo arranca ``ReceptorAvisos`` cuando vence una alarma (con el aviso en JSON
+como argumento) o al reiniciar el teléfono (con "rearmar"). Hace su trabajo y
+termina: no queda ningún proceso esperando hasta la próxima toma.
+
+Después de mostrar un aviso de dosis anota ``ultima_notif_dosis`` en el
+medicamento, la misma marca que usa la app: así no lo vuelve a avisar al abrirse.
+"""
+import json
+import os
+from datetime import datetime
+
+# Los archivos de datos están junto a la app, igual que en main.py
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from alarmas import calcular_avisos, crear_alarmas  # noqa: E402
+from storage import crear_storage  # noqa: E402
+
+
+def notificar(aviso):
+    from plyer import notification
+    notification.notify(title=aviso["titulo"], message=aviso["texto"],
+                        app_name="Tracker de Medicamentos", timeout=10)
+
+
+def marcar_dosis(aviso, ahora=None):
+    """Anota en el medicamento que su toma ya se avisó (como `revisar_dosis` en la app)"""
+    tipo, med_id = aviso["clave"].split(":")[:2]
+    if tipo != "dosis":
+        return
+    storage = crear_storage()
+    try:
+        for posicion, med in enumerate(storage.load_meds()):
+            if med.get("id") == med_id:
+                med["ultima_notif_dosis"] = (ahora or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+                storage.save_med(posicion, med)
+                break
+    finally:
+        storage.close()
+
+
+def rearmar():
+    storage = crear_storage()
+    try:
+        medicamentos = storage.load_meds()
+    finally:
+        storage.close()
+    crear_alarmas().sincronizar(calcular_avisos(medicamentos))
+
+
+def main():
+    argumento = os.environ.get("PYTHON_SERVICE_ARGUMENT", "rearmar")
+    if argumento and argumento != "rearmar":
+        try:
+            aviso = json.loads(argumento)
+            notificar(aviso)
+            marcar_dosis(aviso)
+        except Exception as e:
+            print(f"Error mostrando aviso: {e}")
+    try:
+        rearmar()
+    except Exception as e:
+        print(f"Error rearmando alarmas: {e}")
+
+    from jnius import autoclass
+    autoclass("org.kivy.android.PythonService").mService.stopSelf()
+
+
+if __name__ == "__main__":
+    main()
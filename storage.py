@@ -0,0 +1,457 @@
+"""Backends de almacenamiento para medicamentos, checklist e historial.
+
+Hay dos implementaciones con la misma interfaz:
+
+- ``JSONStorage``: el formato original, un archivo JSON por colección (el
+  historial, un log append-only de una notificación por línea).
+- ``SQLiteStorage``: base SQLite en modo WAL con upserts por fila, de modo
+  que marcar una toma no reescribe toda la lista de medicamentos.
+
+``crear_storage()`` elige el backend (variable de entorno ``TRACKER_STORAGE``)
+y, la primera vez que se abre la base SQLite, importa los JSON existentes.
+
+Los archivos JSON se escriben siempre de forma atómica (archivo temporal,
+fsync y rename) y ``SaveCoalescer`` agrupa ráfagas de guardados en un único
+flush.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+
+USUARIO_FILE = "usuario.json"
+MEDICAMENTOS_FILE = "medicamentos.json"
+HISTORIAL_FILE = "historial_notificaciones.json"
+HISTORIAL_LOG = "historial_notificaciones.log"
+CHECKLIST_FILE = "checklist_diario.json"
+DB_FILE = "tracker.db"
+
+LIMITE_HISTORIAL = 50
+
+
+def asegurar_id(med):
+    """Asigna un identificador estable al medicamento si aún no tiene"""
+    if not med.get("id"):
+        med["id"] = uuid.uuid4().hex[:12]
+    return med["id"]
+
+
+def _leer_json(ruta, defecto):
+    """Lee un archivo JSON devolviendo `defecto` si no existe o está vacío"""
+    if not os.path.exists(ruta):
+        return defecto
+    with open(ruta, "r", encoding="utf-8") as f:
+        contenido = f.read().strip()
+    try:
+        return json.loads(contenido) if contenido else defecto
+    except ValueError:
+        # Conservar una copia antes de que un guardado posterior lo sobrescriba
+        shutil.copyfile(ruta, ruta + ".corrupto")
+        raise
+
+
+def _escribir_atomico(ruta, modo, escribir, encoding=None):
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, temporal = tempfile.mkstemp(prefix=os.path.basename(ruta) + ".", suffix=".tmp", dir=directorio)
+    try:
+        with os.fdopen(fd, modo, encoding=encoding) as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    # El rename solo es durable cuando se sincroniza el directorio (POSIX)
+    if hasattr(os, "O_DIRECTORY"):
+        fd_dir = os.open(directorio, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd_dir)
+        finally:
+            os.close(fd_dir)
+
+
+def escribir_json_atomico(ruta, datos, **opciones):
+    """Escribe un JSON en un temporal, hace fsync y lo renombra sobre `ruta`
+
+    Un cierre inesperado deja el archivo anterior o el nuevo, nunca uno truncado.
+    """
+    _escribir_atomico(ruta, "w", lambda f: json.dump(datos, f, ensure_ascii=False, **opciones),
+                      encoding="utf-8")
+
+
+def escribir_bytes_atomico(ruta, datos):
+    """Igual que `escribir_json_atomico` para contenido binario"""
+    _escribir_atomico(ruta, "wb", lambda f: f.write(datos))
+
+
+class SaveCoalescer:
+    """Agrupa guardados pedidos en ráfaga en un único flush
+
+    `programar(callback, segundos)` debe ejecutar `callback` más tarde (en la app
+    Kivy, en el siguiente frame con `Clock.schedule_once`). Los guardados con la
+    misma clave se reemplazan: solo se ejecuta el último.
+    """
+
+    def __init__(self, programar, intervalo=0):
+        self._programar = programar
+        self.intervalo = intervalo
+        self._pendientes = {}
+        self._programado = False
+        self._lock = threading.Lock()
+
+    def schedule(self, clave, funcion):
+        with self._lock:
+            self._pendientes.pop(clave, None)
+            self._pendientes[clave] = funcion
+            if self._programado:
+                return
+            self._programado = True
+        self._programar(self.flush, self.intervalo)
+
+    def flush(self):
+        """Ejecuta ya todos los guardados pendientes"""
+        with self._lock:
+            pendientes = self._pendientes
+            self._pendientes = {}
+            self._programado = False
+        for funcion in pendientes.values():
+            try:
+                funcion()
+            except Exception as e:
+                print(f"Error guardando datos: {e}")
+
+    def pendiente(self):
+        with self._lock:
+            return bool(self._pendientes)
+
+
+class JSONStorage:
+    """Almacenamiento original: cada colección se reescribe completa"""
+
+    escritura_por_fila = False
+
+    def __init__(self, medicamentos_file=MEDICAMENTOS_FILE, checklist_file=CHECKLIST_FILE,
+                 historial_file=HISTORIAL_FILE, historial_log=HISTORIAL_LOG,
+                 limite_historial=LIMITE_HISTORIAL):
+        self.medicamentos_file = medicamentos_file
+        self.checklist_file = checklist_file
+        self.historial_file = historial_file
+        self.historial_log = historial_log
+        self.limite_historial = limite_historial
+        self._lineas_historial = 0
+        self._medicamentos = []
+        self._checklist = {"fecha": None, "medicamentos": {}}
+
+    # ---------------- medicamentos ----------------
+    def load_meds(self):
+        medicamentos = _leer_json(self.medicamentos_file, [])
+        for med in medicamentos:
+            asegurar_id(med)
+        self._medicamentos = medicamentos
+        return medicamentos
+
+    def save_meds(self, medicamentos):
+        self._medicamentos = medicamentos
+        escribir_json_atomico(self.medicamentos_file, medicamentos, indent=2)
+
+    def save_med(self, posicion, med):
+        # JSON no permite escribir una sola fila: se reescribe la lista completa
+        if 0 <= posicion < len(self._medicamentos):
+            self._medicamentos[posicion] = med
+        self.save_meds(self._medicamentos)
+
+    def save_med_filas(self, filas):
+        """Guarda varios (posicion, med) con una sola reescritura"""
+        for posicion, med in filas:
+            if 0 <= posicion < len(self._medicamentos):
+                self._medicamentos[posicion] = med
+        self.save_meds(self._medicamentos)
+
+    def delete_med(self, med_id):
+        self._medicamentos = [m for m in self._medicamentos if m.get("id") != med_id]
+        self.save_meds(self._medicamentos)
+
+    # ---------------- checklist ----------------
+    def load_checklist(self, fecha):
+        data = _leer_json(self.checklist_file, {})
+        self._checklist = {"fecha": data.get("fecha"), "medicamentos": data.get("medicamentos", {})}
+        if data.get("fecha") == fecha:
+            return dict(self._checklist["medicamentos"])
+        return {}
+
+    def save_checklist(self, fecha, items):
+        self._checklist = {"fecha": fecha, "medicamentos": dict(items)}
+        escribir_json_atomico(self.checklist_file, self._checklist, indent=2)
+
+    def save_checklist_item(self, fecha, clave, valor):
+        items = self._checklist["medicamentos"] if self._checklist["fecha"] == fecha else {}
+        items[clave] = valor
+        self.save_checklist(fecha, items)
+
+    # ---------------- historial ----------------
+    def load_historial(self):
+        """Devuelve el historial con las notificaciones más recientes primero"""
+        if not os.path.exists(self.historial_log):
+            # Formato anterior: una lista JSON con las más recientes primero
+            historial = _leer_json(self.historial_file, [])
+            self.save_historial(historial)
+            return historial[:self.limite_historial]
+        notificaciones = []
+        with open(self.historial_log, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    notificaciones.append(json.loads(linea))
+                except ValueError:
+                    continue  # última línea a medio escribir por un cierre inesperado
+        self._lineas_historial = len(notificaciones)
+        return notificaciones[::-1][:self.limite_historial]
+
+    def save_historial(self, historial):
+        """Reemplaza el historial completo (la lista viene con los más recientes primero)"""
+        conservar = list(reversed(historial[:self.limite_historial]))
+        _escribir_atomico(self.historial_log, "w", lambda f: f.writelines(
+            json.dumps(n, ensure_ascii=False) + "\n" for n in conservar), encoding="utf-8")
+        self._lineas_historial = len(conservar)
+
+    def add_historial(self, notificacion, historial=None):
+        """Agrega una línea al log; cuando duplica el límite se reescribe recortado"""
+        with open(self.historial_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(notificacion, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._lineas_historial += 1
+        if self._lineas_historial > 2 * self.limite_historial:
+            self.save_historial(self.load_historial())
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Almacenamiento SQLite (WAL) con upserts por fila"""
+
+    escritura_por_fila = True
+
+    def __init__(self, ruta=DB_FILE, limite_historial=LIMITE_HISTORIAL):
+        self.ruta = ruta
+        self.limite_historial = limite_historial
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._crear_tablas()
+
+    def _crear_tablas(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS medicamentos (
+                    id TEXT PRIMARY KEY,
+                    posicion INTEGER NOT NULL,
+                    datos TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_medicamentos_posicion ON medicamentos(posicion);
+                CREATE TABLE IF NOT EXISTS checklist (
+                    fecha TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    valor INTEGER NOT NULL,
+                    PRIMARY KEY (fecha, clave)
+                );
+                CREATE TABLE IF NOT EXISTS historial (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fecha TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    medicamento TEXT,
+                    mensaje TEXT,
+                    leida INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT
+                );
+            """)
+
+    def get_meta(self, clave, defecto=None):
+        with self._lock:
+            fila = self._conn.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+
+    def set_meta(self, clave, valor):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (clave, valor) VALUES (?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+                (clave, valor),
+            )
+
+    # ---------------- medicamentos ----------------
+    def load_meds(self):
+        with self._lock:
+            filas = self._conn.execute("SELECT id, datos FROM medicamentos ORDER BY posicion").fetchall()
+        medicamentos = []
+        for med_id, datos in filas:
+            med = json.loads(datos)
+            med["id"] = med_id
+            medicamentos.append(med)
+        return medicamentos
+
+    def _upsert_med(self, posicion, med):
+        med_id = asegurar_id(med)
+        datos = json.dumps(med, ensure_ascii=False)
+        # Solo se escribe la fila si realmente cambió algo
+        self._conn.execute(
+            "INSERT INTO medicamentos (id, posicion, datos) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET posicion = excluded.posicion, datos = excluded.datos "
+            "WHERE medicamentos.posicion != excluded.posicion OR medicamentos.datos != excluded.datos",
+            (med_id, posicion, datos),
+        )
+        return med_id
+
+    def save_meds(self, medicamentos):
+        """Sincroniza la lista completa (upsert de filas cambiadas y borrado de sobrantes)"""
+        with self._lock, self._conn:
+            ids = {self._upsert_med(i, med) for i, med in enumerate(medicamentos)}
+            existentes = {fila[0] for fila in self._conn.execute("SELECT id FROM medicamentos")}
+            self._conn.executemany(
+                "DELETE FROM medicamentos WHERE id = ?",
+                [(med_id,) for med_id in existentes - ids],
+            )
+
+    def save_med(self, posicion, med):
+        """Guarda un único medicamento"""
+        with self._lock, self._conn:
+            self._upsert_med(posicion, med)
+
+    def save_med_filas(self, filas):
+        """Guarda varios (posicion, med) en una sola transacción"""
+        with self._lock, self._conn:
+            for posicion, med in filas:
+                self._upsert_med(posicion, med)
+
+    def delete_med(self, med_id):
+        with self._lock, self._conn:
+            fila = self._conn.execute("SELECT posicion FROM medicamentos WHERE id = ?", (med_id,)).fetchone()
+            if fila is None:
+                return
+            self._conn.execute("DELETE FROM medicamentos WHERE id = ?", (med_id,))
+            self._conn.execute("UPDATE medicamentos SET posicion = posicion - 1 WHERE posicion > ?", (fila[0],))
+
+    # ---------------- checklist ----------------
+    def load_checklist(self, fecha):
+        with self._lock:
+            filas = self._conn.execute("SELECT clave, valor FROM checklist WHERE fecha = ?", (fecha,)).fetchall()
+        return {clave: bool(valor) for clave, valor in filas}
+
+    def save_checklist(self, fecha, items):
+        with self._lock, self._conn:
+            # Solo interesa el checklist del día: los anteriores se descartan
+            self._conn.execute("DELETE FROM checklist")
+            self._conn.executemany(
+                "INSERT INTO checklist (fecha, clave, valor) VALUES (?, ?, ?)",
+                [(fecha, str(clave), int(bool(valor))) for clave, valor in items.items()],
+            )
+
+    def save_checklist_item(self, fecha, clave, valor):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO checklist (fecha, clave, valor) VALUES (?, ?, ?) "
+                "ON CONFLICT(fecha, clave) DO UPDATE SET valor = excluded.valor",
+                (fecha, str(clave), int(bool(valor))),
+            )
+
+    # ---------------- historial ----------------
+    def load_historial(self):
+        """Devuelve el historial con las notificaciones más recientes primero"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT fecha, tipo, medicamento, mensaje, leida FROM historial ORDER BY id DESC LIMIT ?",
+                (self.limite_historial,),
+            ).fetchall()
+        return [
+            {"fecha": fecha, "tipo": tipo, "medicamento": medicamento, "mensaje": mensaje, "leida": bool(leida)}
+            for fecha, tipo, medicamento, mensaje, leida in filas
+        ]
+
+    def _insertar_historial(self, notificacion):
+        self._conn.execute(
+            "INSERT INTO historial (fecha, tipo, medicamento, mensaje, leida) VALUES (?, ?, ?, ?, ?)",
+            (
+                notificacion.get("fecha"),
+                notificacion.get("tipo"),
+                notificacion.get("medicamento"),
+                notificacion.get("mensaje"),
+                int(bool(notificacion.get("leida", False))),
+            ),
+        )
+
+    def add_historial(self, notificacion, historial=None):
+        """Inserta una notificación y recorta la tabla al límite configurado"""
+        with self._lock, self._conn:
+            self._insertar_historial(notificacion)
+            self._conn.execute(
+                "DELETE FROM historial WHERE id <= (SELECT id FROM historial ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.limite_historial,),
+            )
+
+    def save_historial(self, historial):
+        """Reemplaza el historial completo (la lista viene con los más recientes primero)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM historial")
+            for notificacion in reversed(historial[:self.limite_historial]):
+                self._insertar_historial(notificacion)
+
+    # ---------------- importación ----------------
+    def importar_json(self, medicamentos_file=MEDICAMENTOS_FILE, checklist_file=CHECKLIST_FILE,
+                      historial_file=HISTORIAL_FILE):
+        """Importa una única vez los archivos JSON del formato anterior"""
+        if self.get_meta("importado_json"):
+            return False
+        try:
+            medicamentos = _leer_json(medicamentos_file, [])
+            checklist = _leer_json(checklist_file, {})
+            historial = _leer_json(historial_file, [])
+        except Exception as e:
+            print(f"Error importando datos JSON: {e}")
+            return False
+
+        with self._lock, self._conn:
+            for i, med in enumerate(medicamentos):
+                self._upsert_med(i, med)
+            if checklist.get("fecha"):
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO checklist (fecha, clave, valor) VALUES (?, ?, ?)",
+                    [(checklist["fecha"], str(clave), int(bool(valor)))
+                     for clave, valor in checklist.get("medicamentos", {}).items()],
+                )
+            for notificacion in reversed(historial[:self.limite_historial]):
+                self._insertar_historial(notificacion)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (clave, valor) VALUES ('importado_json', '1')"
+            )
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def crear_storage(backend=None, directorio=None):
+    """Crea el backend de almacenamiento configurado ('sqlite' por defecto)
+
+    Con `directorio`, todos los archivos van en esa carpeta (un paciente por
+    carpeta en el servidor Flet); si no, en la carpeta actual.
+    """
+    backend = (backend or os.environ.get("TRACKER_STORAGE", "sqlite")).lower()
+
+    def ruta(nombre):
+        return os.path.join(directorio, nombre) if directorio else nombre
+
+    if backend == "json":
+        return JSONStorage(ruta(MEDICAMENTOS_FILE), ruta(CHECKLIST_FILE), ruta(HISTORIAL_FILE), ruta(HISTORIAL_LOG))
+    storage = SQLiteStorage(ruta(DB_FILE))
+    storage.importar_json(ruta(MEDICAMENTOS_FILE), ruta(CHECKLIST_FILE), ruta(HISTORIAL_FILE))
+    return storage
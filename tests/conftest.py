@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos de la app están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archivo_historial import ARCHIVO_FILE, ArchivoHistorial  # noqa: E402
+from journal import JOURNAL_FILE, SNAPSHOT_FILE, IntakeJournal  # noqa: E402
+from nucleo import Tracker  # noqa: E402
+from storage import crear_storage  # noqa: E402
+
+
+@pytest.fixture
+def crear_tracker(tmp_path):
+    """Arma un Tracker con todos sus archivos en `tmp_path`; se cierran al terminar"""
+    abiertos = []
+
+    def crear(backend="sqlite"):
+        tracker = Tracker(
+            storage=crear_storage(backend, directorio=str(tmp_path)),
+            journal=IntakeJournal(str(tmp_path / JOURNAL_FILE), str(tmp_path / SNAPSHOT_FILE)),
+            archivo=ArchivoHistorial(str(tmp_path / ARCHIVO_FILE)),
+        )
+        tracker.cargar()
+        tracker.cargar_checklist()
+        tracker.cargar_historial()
+        abiertos.append(tracker)
+        return tracker
+
+    yield crear
+    for tracker in abiertos:
+        try:
+            tracker.cerrar()
+        except Exception:
+            pass
@@ -0,0 +1,36 @@
+from archivo_historial import ArchivoHistorial
+
+
+def notificacion(medicamento, tipo="stock_bajo", fecha="2026-08-10 09:00:00", mensaje="Se acabará pronto"):
+    return {"fecha": fecha, "tipo": tipo, "medicamento": medicamento, "mensaje": mensaje, "leida": False}
+
+
+def test_buscar_por_medicamento_tipo_y_mes(tmp_path):
+    archivo = ArchivoHistorial(str(tmp_path / "archivo.db"))
+    archivo.agregar_varias([
+        notificacion("Quetiapina"),
+        notificacion("Quetiapina", tipo="dosis"),
+        notificacion("Quetiapina", fecha="2026-09-01 08:00:00"),
+        notificacion("Sertralina"),
+    ])
+    resultado = archivo.buscar(medicamento="quetiapina", tipo="stock_bajo", mes="2026-08")
+    assert [n["fecha"] for n in resultado] == ["2026-08-10 09:00:00"]
+    assert archivo.contar(medicamento="Quetiapina") == 3
+    archivo.close()
+
+
+def test_resumen_de_stock_se_archiva_por_medicamento(crear_tracker):
+    tracker = crear_tracker()
+    tracker.agregar_notificacion(
+        "stock_bajo", "2 medicamentos", "Se acabarán pronto: Quetiapina (3 días), Sertralina (2 días)",
+        detalle=[("Quetiapina", "Tu medicamento 'Quetiapina' se acabará en 3 días"),
+                 ("Sertralina", "Tu medicamento 'Sertralina' se acabará en 2 días")],
+    )
+    tracker.flush()
+
+    # La pantalla muestra una sola línea
+    assert len(tracker.historial) == 1
+    # El archivo encuentra el aviso por el nombre de cada medicamento
+    encontrados = tracker.archivo.buscar(medicamento="Quetiapina", tipo="stock_bajo")
+    assert [n["mensaje"] for n in encontrados] == ["Tu medicamento 'Quetiapina' se acabará en 3 días"]
+    assert set(tracker.archivo.facetas()["medicamento"]) == {"Quetiapina", "Sertralina"}
@@ -0,0 +1,88 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import columnas
+from columnas import VistaColumnar, formatear_dias
+from nucleo import calcular_dias_restantes
+
+AHORA = datetime(2026, 8, 10, 13, 30)
+
+
+def medicamentos_al_azar(n, semilla=0):
+    rng = random.Random(semilla)
+    meds = []
+    for i in range(n):
+        tipo = rng.random()
+        med = {"id": str(i), "dosis": rng.choice((0.5, 1, 2)), "cantidad_actual": rng.randrange(0, 60),
+               "frecuencia_dias": rng.choice((1, 2, 7)), "inicio": "2026-08-01 08:00"}
+        if tipo < 0.1:
+            med["fecha_fin"] = None
+        elif tipo < 0.15:
+            med["fecha_fin"] = "no es fecha"
+        else:
+            fin = AHORA + timedelta(minutes=rng.randrange(-10 * 1440, 40 * 1440))
+            med["fecha_fin"] = fin.strftime("%Y-%m-%d %H:%M")
+        meds.append(med)
+    return meds
+
+
+def ambas_vistas(meds, monkeypatch):
+    """(vista con listas, vista con NumPy) de los mismos medicamentos"""
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(columnas, "UMBRAL_NUMPY", len(meds) + 1)
+    listas = VistaColumnar(meds)
+    monkeypatch.setattr(columnas, "UMBRAL_NUMPY", 0)
+    arreglos = VistaColumnar(meds)
+    monkeypatch.undo()
+    assert listas.np is None and arreglos.np is not None
+    return listas, arreglos
+
+
+def resultados(vista):
+    dias, urgencia = vista.calcular(AHORA)
+    debidos = [bool(x) for x in vista.debidos_en(AHORA)]
+    return ([int(d) for d, u in zip(dias, urgencia) if u not in (columnas.SIN_FECHA, columnas.ERROR)],
+            [int(u) for u in urgencia], vista.contar(urgencia), debidos, vista.proximo_cambio(AHORA))
+
+
+@pytest.mark.parametrize("n", [columnas.UMBRAL_NUMPY - 1, columnas.UMBRAL_NUMPY])
+def test_umbral_elige_la_implementacion(n):
+    vista = VistaColumnar(medicamentos_al_azar(n))
+    assert (vista.np is None) == (n < columnas.UMBRAL_NUMPY or columnas.cargar_numpy() is None)
+
+
+@pytest.mark.parametrize("n", [1, columnas.UMBRAL_NUMPY - 1, columnas.UMBRAL_NUMPY, 3 * columnas.UMBRAL_NUMPY])
+def test_listas_y_numpy_coinciden(n, monkeypatch):
+    meds = medicamentos_al_azar(n, semilla=n)
+    listas, arreglos = ambas_vistas(meds, monkeypatch)
+    assert resultados(listas) == resultados(arreglos)
+
+
+def test_cambios_por_fila_coinciden(monkeypatch):
+    meds = medicamentos_al_azar(50)
+    listas, arreglos = ambas_vistas(meds, monkeypatch)
+    nuevos = medicamentos_al_azar(10, semilla=9)
+    for vista in (listas, arreglos):
+        vista.actualizar(3, nuevos[0])
+        vista.eliminar(7)
+        vista.agregar(nuevos[1])
+    esperado = VistaColumnar([nuevos[0] if i == 3 else med for i, med in enumerate(meds) if i != 7] + [nuevos[1]])
+    assert resultados(listas) == resultados(arreglos) == resultados(esperado)
+
+
+def test_textos_iguales_a_calcular_dias_restantes():
+    meds = medicamentos_al_azar(300)
+    vista = VistaColumnar(meds)
+    dias, urgencia = vista.calcular(AHORA)
+    for i, med in enumerate(meds):
+        assert formatear_dias(dias[i], urgencia[i]) == calcular_dias_restantes(med, AHORA)
+        assert vista.fila(i, AHORA) == (int(dias[i]), int(urgencia[i]))
+
+
+def test_proximo_cambio():
+    vista = VistaColumnar([{"fecha_fin": "2026-08-20 15:00"}, {"fecha_fin": "2026-08-01 08:00"}, {}])
+    # Los días del primero bajan a las 15:00; el agotado y el sin fecha no cambian
+    assert vista.proximo_cambio(AHORA) == 90 * 60
+    assert VistaColumnar([{"fecha_fin": "2026-08-01 08:00"}]).proximo_cambio(AHORA) is None
@@ -0,0 +1,127 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from horario import PlanTomas, ScheduleIndex, formatear_horas, parsear_horas
+from nucleo import es_dia_de_toma
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("08:00, 20:00", (["08:00", "20:00"], None)),
+    ("20:00; 8:00, 08:00", (["08:00", "20:00"], None)),
+    ("08:00,", (["08:00"], None)),
+    ("", ([], None)),
+    ("   ", ([], None)),
+    ("8h", ([], 8)),
+    (" 48H ", ([], 48)),
+    ("24 h", ([], 24)),
+])
+def test_parsear_horas(texto, esperado):
+    assert parsear_horas(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", ["7h", "0h", "-8h", "h", "25:00", "8:60", "ocho", "08:00, mañana"])
+def test_parsear_horas_invalidas(texto):
+    with pytest.raises(ValueError):
+        parsear_horas(texto)
+
+
+def test_formatear_horas_es_inversa_de_parsear():
+    assert formatear_horas({"horas": ["08:00", "20:00"]}) == "08:00, 20:00"
+    assert formatear_horas({"intervalo_horas": 8}) == "8h"
+    assert parsear_horas(formatear_horas({"horas": ["08:00", "20:00"]})) == (["08:00", "20:00"], None)
+
+
+def test_plan_con_horas_fijas():
+    plan = PlanTomas.desde_medicamento({"inicio": "2026-01-01 10:00", "frecuencia_dias": 2,
+                                        "horas": ["20:00", "08:00"]})
+    # La toma de las 08:00 del primer día es anterior al inicio
+    assert plan.siguiente(datetime(2026, 1, 1)) == datetime(2026, 1, 1, 20, 0)
+    assert plan.siguiente(datetime(2026, 1, 2)) == datetime(2026, 1, 3, 8, 0)
+    assert plan.anterior(datetime(2026, 1, 1, 19, 59)) is None
+    assert plan.anterior(datetime(2026, 1, 3, 20, 0)) == datetime(2026, 1, 3, 20, 0)
+    assert plan.tomas(datetime(2026, 1, 3, 9, 0), 3) == [
+        datetime(2026, 1, 3, 20, 0), datetime(2026, 1, 5, 8, 0), datetime(2026, 1, 5, 20, 0)]
+    assert plan.entre(datetime(2026, 1, 3), datetime(2026, 1, 5)) == [
+        datetime(2026, 1, 3, 8, 0), datetime(2026, 1, 3, 20, 0)]
+    assert plan.toma(plan.cercano(datetime(2026, 1, 3, 13, 0))) == datetime(2026, 1, 3, 8, 0)
+
+
+def test_plan_cada_n_horas():
+    plan = PlanTomas.desde_medicamento({"inicio": "2026-01-01 22:00", "frecuencia_dias": 1, "intervalo_horas": 8})
+    assert plan.tomas(datetime(2026, 1, 1), 4) == [
+        datetime(2026, 1, 1, 22, 0), datetime(2026, 1, 2, 6, 0),
+        datetime(2026, 1, 2, 14, 0), datetime(2026, 1, 2, 22, 0)]
+
+
+@pytest.mark.parametrize("med", [
+    {},
+    {"inicio": None, "frecuencia_dias": 1},
+    {"inicio": "ayer", "frecuencia_dias": 1},
+    {"inicio": "2026-01-01 08:00", "frecuencia_dias": 0},
+    {"inicio": "2026-01-01 08:00", "frecuencia_dias": 1, "horas": ["25:00"]},
+])
+def test_plan_invalido(med):
+    assert PlanTomas.desde_medicamento(med) is None
+
+
+def medicamentos_al_azar(n, rng):
+    meds = []
+    for _ in range(n):
+        tipo = rng.random()
+        if tipo < 0.1:
+            med = {"inicio": None}
+        elif tipo < 0.15:
+            med = {"inicio": "fecha rota", "frecuencia_dias": 2}
+        else:
+            dia = datetime(2026, 1, 1) + timedelta(days=rng.randrange(-30, 30))
+            med = {"inicio": f"{dia:%Y-%m-%d} 08:00", "frecuencia_dias": rng.choice((0, 1, 2, 3, 7, -14, 30))}
+        meds.append(med)
+    return meds
+
+
+def comprobar_indice(indice, meds):
+    for d in range(-40, 60):
+        fecha = datetime(2026, 1, 1) + timedelta(days=d)
+        assert indice.debidos(fecha) == [i for i, med in enumerate(meds) if es_dia_de_toma(med, fecha)]
+
+
+def test_indice_coincide_con_es_dia_de_toma():
+    rng = random.Random(1)
+    meds = medicamentos_al_azar(200, rng)
+    comprobar_indice(ScheduleIndex(meds), meds)
+
+
+def test_frecuencia_cero_toca_todos_los_dias_desde_el_inicio():
+    # Como la versión anterior: antes del inicio no toca (el `and` cortaba antes
+    # de dividir por 0) y desde el inicio toca cada día (el error daba True)
+    med = {"inicio": "2026-01-10 08:00", "frecuencia_dias": 0}
+    indice = ScheduleIndex([med])
+    for dia, toca in ((9, False), (10, True), (11, True), (25, True)):
+        fecha = datetime(2026, 1, dia)
+        assert es_dia_de_toma(med, fecha) is toca
+        assert indice.es_dia_de_toma(0, fecha) is toca
+        assert indice.debidos(fecha) == ([0] if toca else [])
+
+
+def test_indice_incremental():
+    rng = random.Random(2)
+    meds = medicamentos_al_azar(100, rng)
+    indice = ScheduleIndex(meds)
+    indice.debidos(datetime(2026, 1, 1))  # agrupa antes de los cambios
+    for _ in range(150):
+        operacion = rng.random()
+        if operacion < 0.3 and meds:
+            i = rng.randrange(len(meds))
+            meds.pop(i)
+            indice.eliminar(i)
+        elif operacion < 0.6 and meds:
+            i = rng.randrange(len(meds))
+            meds[i] = medicamentos_al_azar(1, rng)[0]
+            indice.actualizar(i, meds[i])
+        else:
+            meds.append(medicamentos_al_azar(1, rng)[0])
+            indice.agregar(meds[-1])
+    assert len(indice) == len(meds)
+    comprobar_indice(indice, meds)
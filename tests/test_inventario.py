@@ -0,0 +1,103 @@
+from datetime import datetime
+
+import pytest
+
+from inventario import Inventario
+from journal import AJUSTE, COMPRA, DESHACER, TOMA, IntakeJournal
+
+
+@pytest.fixture
+def inventario(tmp_path):
+    journal = IntakeJournal(str(tmp_path / "tomas.log"), str(tmp_path / "snapshot.json"))
+    journal.cargar()
+    yield Inventario(journal)
+    journal.cerrar()
+
+
+def medicamento(**cambios):
+    med = {"id": "a", "dosis": 1.0, "frecuencia_dias": 1, "inicio": "2026-01-01 08:00",
+           "cantidad_total": 10.0, "cantidad_actual": 10.0}
+    med.update(cambios)
+    return med
+
+
+def cobertura(med):
+    return med["inventario"]["cobertura"]
+
+
+def test_ajuste_proyecta_desde_la_proxima_toma(inventario):
+    med = medicamento()
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    # La próxima toma es la del 11/01 (índice 10); alcanza para 10 tomas más
+    assert cobertura(med) == 20
+    assert med["fecha_fin"] == "2026-01-21 08:00"
+    assert inventario.agotamiento(med) == datetime(2026, 1, 21, 8, 0)
+
+
+def test_toma_del_plan_no_mueve_la_fecha(inventario):
+    med = medicamento()
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    inventario.registrar(med, TOMA, 1, ahora=datetime(2026, 1, 11, 8, 5))
+    assert med["cantidad_actual"] == 9
+    assert cobertura(med) == 20
+
+    # Deshacerla devuelve la cantidad; la toma vuelve a quedar cubierta
+    inventario.registrar(med, DESHACER, 1, ahora=datetime(2026, 1, 11, 8, 10))
+    assert med["cantidad_actual"] == 10
+    assert cobertura(med) == 20
+
+
+def test_dosis_de_mas_adelanta_el_agotamiento(inventario):
+    med = medicamento()
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    inventario.registrar(med, TOMA, 1, ahora=datetime(2026, 1, 11, 8, 5))
+    inventario.registrar(med, TOMA, 1, ahora=datetime(2026, 1, 11, 8, 10))
+    assert cobertura(med) == 19
+    assert med["fecha_fin"] == "2026-01-20 08:00"
+
+
+def test_compra_suma_cobertura(inventario):
+    med = medicamento()
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    inventario.registrar(med, COMPRA, 5, ahora=datetime(2026, 1, 10, 9, 0))
+    assert cobertura(med) == 25
+
+    # Agotado hace tiempo: la compra cuenta desde la próxima toma
+    inventario.registrar(med, COMPRA, 2, ahora=datetime(2026, 3, 1, 12, 0))
+    assert med["fecha_fin"] == "2026-03-04 08:00"
+
+
+def test_dosis_fraccionaria(inventario):
+    med = medicamento(dosis=3.0)
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    # 10 / 3 alcanza para 3 tomas enteras
+    assert med["fecha_fin"] == "2026-01-14 08:00"
+
+
+def test_sin_plan_usa_el_ancla(inventario):
+    med = medicamento(inicio=None, frecuencia_dias=2)
+    inventario.reanclar(med, ahora=datetime(2026, 1, 10, 9, 30))
+    assert med["inventario"]["ancla"] == "2026-01-10 09:30"
+    assert cobertura(med) == 10
+    assert med["fecha_fin"] == "2026-01-30 09:30"
+
+
+def test_sin_dosis_no_hay_proyeccion(inventario):
+    med = medicamento(dosis=0)
+    inventario.registrar(med, AJUSTE, 10, ahora=datetime(2026, 1, 10, 9, 0))
+    assert cobertura(med) is None
+    assert med["fecha_fin"] is None
+    assert inventario.agotamiento(med) is None
+
+
+def test_cargar_proyecta_solo_los_nuevos(inventario):
+    viejo = medicamento(id="viejo")
+    nuevo = medicamento(id="nuevo", cantidad_actual=4.0)
+    inventario.registrar(viejo, AJUSTE, 7, ahora=datetime(2026, 1, 10, 9, 0))
+    viejo["cantidad_actual"] = 99.0
+
+    cambiados = inventario.cargar([viejo, nuevo], ahora=datetime(2026, 1, 10, 9, 0))
+    assert cambiados == [1]
+    # La cantidad del diario manda sobre la guardada
+    assert viejo["cantidad_actual"] == 7
+    assert cobertura(nuevo) == 14
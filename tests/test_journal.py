@@ -0,0 +1,84 @@
+import json
+
+from journal import AJUSTE, BAJA, COMPRA, DESHACER, TOMA, IntakeJournal
+
+
+def abrir(tmp_path):
+    journal = IntakeJournal(str(tmp_path / "tomas.log"), str(tmp_path / "snapshot.json"))
+    journal.cargar()
+    return journal
+
+
+def test_fold_de_eventos(tmp_path):
+    journal = abrir(tmp_path)
+    assert journal.registrar(AJUSTE, "a", 10) == 10
+    assert journal.registrar(TOMA, "a", 3, ts="2026-08-10 08:00:00") == 7
+    assert journal.registrar(COMPRA, "a", 5) == 12
+    assert journal.registrar(DESHACER, "a", 1, ts="2026-08-10 09:00:00") == 13
+    assert journal.consumo_diario("a") == {"2026-08-10": 2}
+    # No se puede tomar más de lo que hay
+    assert journal.registrar(TOMA, "a", 100, ts="2026-08-11 08:00:00") == 0
+    assert journal.consumo_diario("a")["2026-08-11"] == 13
+
+    journal.registrar(AJUSTE, "b", 4)
+    assert journal.registrar(BAJA, "b") is None
+    assert not journal.conoce("b")
+    journal.cerrar()
+
+    recargado = abrir(tmp_path)
+    assert recargado.estado == {"a": 0}
+    assert recargado.consumo_diario("a") == {"2026-08-10": 2, "2026-08-11": 13}
+    recargado.cerrar()
+
+
+def test_linea_incompleta_se_descarta(tmp_path):
+    journal = abrir(tmp_path)
+    journal.registrar(AJUSTE, "a", 10)
+    journal.cerrar()
+    with open(tmp_path / "tomas.log", "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "tipo": "toma", "id": "a"')
+
+    recargado = abrir(tmp_path)
+    assert recargado.cantidad("a") == 10
+    # El log quedó sin la línea rota y se puede seguir escribiendo
+    assert recargado.registrar(TOMA, "a", 1) == 9
+    recargado.cerrar()
+    assert abrir(tmp_path).cantidad("a") == 9
+
+
+def test_compactacion(tmp_path):
+    journal = abrir(tmp_path)
+    avisos = []
+    journal.on_compactado = lambda: avisos.append(True)
+    journal.registrar(AJUSTE, "a", 10)
+    journal.registrar(TOMA, "a", 2, ts="2026-08-10 08:00:00")
+    journal.compactar()
+
+    assert avisos == [True]
+    assert (tmp_path / "tomas.log").read_text(encoding="utf-8") == ""
+    snapshot = json.loads((tmp_path / "snapshot.json").read_text(encoding="utf-8"))
+    assert snapshot["seq"] == 2 and snapshot["estado"] == {"a": 8}
+
+    journal.registrar(COMPRA, "a", 5)
+    journal.cerrar()
+    recargado = abrir(tmp_path)
+    assert recargado.cantidad("a") == 13
+    assert recargado.consumo_diario("a") == {"2026-08-10": 2}
+    recargado.cerrar()
+
+
+def test_compactacion_interrumpida_no_repite_eventos(tmp_path):
+    journal = abrir(tmp_path)
+    journal.registrar(AJUSTE, "a", 10)
+    journal.registrar(TOMA, "a", 2)
+    log = (tmp_path / "tomas.log").read_text(encoding="utf-8")
+    journal.compactar()
+    journal.cerrar()
+    # Instantánea escrita pero el log sin truncar (corte entre los dos pasos)
+    (tmp_path / "tomas.log").write_text(log, encoding="utf-8")
+
+    recargado = abrir(tmp_path)
+    assert recargado.cantidad("a") == 8
+    assert recargado.registrar(TOMA, "a", 1) == 7
+    recargado.cerrar()
+    assert abrir(tmp_path).cantidad("a") == 7
@@ -0,0 +1,104 @@
+from datetime import date
+
+import pytest
+
+from journal import TOMA
+
+BACKENDS = ["json", "sqlite"]
+
+
+def medicamento(nombre, cantidad=30.0, frecuencia=1):
+    return {
+        "nombre": nombre,
+        "descripcion": "",
+        "presentacion": "Tabletas",
+        "cantidad_total": cantidad,
+        "cantidad_actual": cantidad,
+        "dosis": 1.0,
+        "frecuencia_dias": frecuencia,
+        "inicio": "2026-01-01 08:00",
+        "fecha_fin": None,
+        "notificaciones_activas": False,
+    }
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_agregar_actualizar_eliminar_y_recargar(crear_tracker, backend):
+    tracker = crear_tracker(backend)
+    for nombre in ("Quetiapina", "Sertralina", "Melatonina"):
+        tracker.agregar(medicamento(nombre))
+    ids = [med["id"] for med in tracker.medicamentos]
+    assert len(set(ids)) == 3
+    assert tracker.medicamentos[0]["fecha_fin"]  # la proyecta el inventario
+
+    tracker.registrar_evento(1, TOMA, 1.0)
+    editado = tracker.actualizar(1, dict(medicamento("Sertralina 50mg", cantidad=99.0), frecuencia_dias=2))
+    # La edición conserva el id y la cantidad del diario, no la del formulario
+    assert editado["id"] == ids[1]
+    assert editado["cantidad_actual"] == 29.0
+
+    eliminado = tracker.eliminar(0)
+    assert eliminado["id"] == ids[0]
+    assert [med["id"] for med in tracker.medicamentos] == ids[1:]
+    assert tracker.horario.debidos(date(2026, 1, 3)) == [0, 1]
+    tracker.cerrar()
+
+    recargado = crear_tracker(backend)
+    assert [med["id"] for med in recargado.medicamentos] == ids[1:]
+    assert [med["nombre"] for med in recargado.medicamentos] == ["Sertralina 50mg", "Melatonina"]
+    assert [med["cantidad_actual"] for med in recargado.medicamentos] == [29.0, 30.0]
+    assert recargado.medicamentos[0]["frecuencia_dias"] == 2
+    # El diario olvidó al eliminado
+    assert not recargado.journal.conoce(ids[0])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_toma_y_deshacer(crear_tracker, backend):
+    tracker = crear_tracker(backend)
+    indice = tracker.agregar(medicamento("Quetiapina", cantidad=10.0))
+    assert tracker.registrar_evento(indice, TOMA, 1.0) == 9.0
+    assert tracker.registrar_evento(indice, TOMA, 1.0) == 8.0
+
+    tracker.deshacer_toma(indice)
+    assert tracker.medicamentos[indice]["cantidad_actual"] == 9.0
+    # No se deshace más de lo que se tomó hoy
+    tracker.deshacer_toma(indice, cantidad=5.0)
+    assert tracker.medicamentos[indice]["cantidad_actual"] == 10.0
+    tracker.deshacer_toma(indice)
+    assert tracker.medicamentos[indice]["cantidad_actual"] == 10.0
+
+    tracker.registrar_evento(indice, TOMA, 1.0)
+    tracker.cerrar()
+    assert crear_tracker(backend).medicamentos[0]["cantidad_actual"] == 9.0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_dias_restantes_usa_las_columnas(crear_tracker, backend):
+    from nucleo import calcular_dias_restantes
+
+    tracker = crear_tracker(backend)
+    tracker.agregar(medicamento("Quetiapina"))
+    tracker.agregar(dict(medicamento("Sin plan"), inicio=None, dosis=0))
+    for i, med in enumerate(tracker.medicamentos):
+        assert tracker.dias_restantes(i) == calcular_dias_restantes(med)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_eliminar_desplaza_el_checklist(crear_tracker, backend):
+    tracker = crear_tracker(backend)
+    for nombre in ("Quetiapina", "Sertralina", "Melatonina"):
+        tracker.agregar(medicamento(nombre))
+    tracker.checklist["0"] = True
+    tracker.save_checklist_item(0)
+    tracker.checklist["2"] = True
+    tracker.save_checklist_item(2)
+
+    tracker.eliminar(1)
+    # Melatonina pasa a la posición 1 y conserva su marca; Sertralina no hereda nada
+    assert tracker.checklist == {"0": True, "1": True}
+    tracker.eliminar(0)
+    assert tracker.checklist == {"0": True}
+    tracker.cerrar()
+
+    recargado = crear_tracker(backend)
+    assert recargado.checklist == {"0": True}
@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import acceso
+import pacientes
+from acceso import AccesoDenegado
+from pacientes import AlmacenPacientes, ConflictoVersion, cambio_de_dias, carpeta_paciente
+
+
+class Reloj(datetime):
+    actual = datetime(2026, 8, 10, 13, 30)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.actual
+
+
+CLAVE = "una clave larga"
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    # PBKDF2 completo no agrega nada a estas pruebas
+    monkeypatch.setattr(acceso, "ITERACIONES", 1000)
+    almacen = AlmacenPacientes(str(tmp_path), backend="sqlite")
+    yield almacen
+    almacen.cerrar()
+
+
+def abrir(almacen, usuario):
+    return almacen.abrir(usuario, almacen.entrar(usuario, CLAVE))
+
+
+def medicamento(nombre, fecha_fin):
+    return {"nombre": nombre, "dosis": 0, "cantidad_total": 10.0, "frecuencia_dias": 1,
+            "inicio": None, "fecha_fin": fecha_fin}
+
+
+def test_sesiones_comparten_al_paciente(almacen):
+    ana = abrir(almacen, "Ana")
+    assert abrir(almacen, " ana ") is ana
+    assert abrir(almacen, "Beto") is not ana
+
+    with ana.cambio() as nucleo:
+        nucleo.agregar(medicamento("Quetiapina", None))
+    med_id = ana.nucleo.medicamentos[0]["id"]
+    revision = ana.revision(med_id)
+    with ana.cambio(med_id, revision):
+        pass
+    with pytest.raises(ConflictoVersion):
+        with ana.cambio(med_id, revision):
+            pass
+
+
+def test_cada_vista_vence_por_su_cuenta(almacen, monkeypatch):
+    monkeypatch.setattr(pacientes, "datetime", Reloj)
+    monkeypatch.setattr(Reloj, "actual", datetime(2026, 8, 10, 13, 30))
+    paciente = abrir(almacen, "Ana")
+    with paciente.cambio() as nucleo:
+        nucleo.agregar(medicamento("Quetiapina", "2026-08-20 15:00"))
+        # El inventario no proyecta sin dosis: la fecha de fin queda fija para la prueba
+        nucleo.medicamentos[0]["fecha_fin"] = "2026-08-20 15:00"
+        nucleo.columnas.actualizar(0, nucleo.medicamentos[0])
+
+    calculos = []
+
+    def calcular(nombre):
+        def calcular(nucleo):
+            calculos.append(nombre)
+            return nombre
+        return calcular
+
+    def leer():
+        paciente.vista("dias", calcular("dias"), vence=cambio_de_dias)
+        paciente.vista("calendario", calcular("calendario"))
+
+    leer()
+    leer()
+    assert calculos == ["dias", "calendario"]
+
+    # A las 15:00 bajan los días restantes; el calendario sigue valiendo hasta la medianoche
+    monkeypatch.setattr(Reloj, "actual", datetime(2026, 8, 10, 15, 0))
+    leer()
+    assert calculos == ["dias", "calendario", "dias"]
+
+    monkeypatch.setattr(Reloj, "actual", datetime(2026, 8, 11, 0, 0))
+    leer()
+    assert calculos[-2:] == ["dias", "calendario"]
+
+    # Un cambio descarta todas
+    calculos.clear()
+    with paciente.cambio():
+        pass
+    leer()
+    assert calculos == ["dias", "calendario"]
+
+
+def test_la_carga_de_un_paciente_no_frena_a_los_demas(almacen, monkeypatch):
+    cargando = threading.Event()
+    seguir = threading.Event()
+    crear_nucleo = almacen._crear_nucleo
+
+    def lento(carpeta, programar):
+        if carpeta == carpeta_paciente("Ana"):
+            cargando.set()
+            assert seguir.wait(5)
+        return crear_nucleo(carpeta, programar)
+
+    monkeypatch.setattr(almacen, "_crear_nucleo", lento)
+    token = almacen.entrar("Ana", CLAVE)
+    with ThreadPoolExecutor(max_workers=2) as hilos:
+        primera = hilos.submit(almacen.abrir, "Ana", token)
+        assert cargando.wait(5)
+        segunda = hilos.submit(almacen.abrir, "Ana", token)
+        # Otro paciente entra mientras Ana sigue cargando
+        beto = abrir(almacen, "Beto")
+        almacen.soltar(beto)
+        assert not primera.done() and not segunda.done()
+        seguir.set()
+        ana = primera.result(5)
+        assert segunda.result(5) is ana
+
+    with ana.cambio() as nucleo:
+        nucleo.agregar(medicamento("Quetiapina", None))
+    almacen.soltar(ana)
+    almacen.soltar(ana)
+    # Cerrado con la última sesión: se vuelve a cargar de disco
+    otra = abrir(almacen, "Ana")
+    assert otra is not ana
+    assert [med["nombre"] for med in otra.nucleo.medicamentos] == ["Quetiapina"]
+
+
+def test_acceso_con_contrasena_y_token(almacen):
+    with pytest.raises(AccesoDenegado):
+        almacen.entrar("Ana", "corta")
+    token = almacen.entrar("Ana", CLAVE)
+    # El nombre ya no alcanza: hace falta la contraseña registrada o un token vigente
+    with pytest.raises(AccesoDenegado):
+        almacen.entrar("ana", "otra clave larga")
+    with pytest.raises(AccesoDenegado):
+        almacen.abrir("Ana", None)
+    with pytest.raises(AccesoDenegado):
+        almacen.abrir("Ana", "inventado")
+    with pytest.raises(AccesoDenegado):
+        almacen.abrir("Beto", token)
+
+    ana = almacen.abrir("Ana", token)
+    almacen.soltar(ana)
+    almacen.salir("Ana", token)
+    with pytest.raises(AccesoDenegado):
+        almacen.abrir("Ana", token)
+    # La contraseña no queda en claro
+    carpeta = carpeta_paciente("Ana")
+    with open(f"{almacen.directorio}/{carpeta}/{acceso.ACCESO_FILE}", encoding="utf-8") as f:
+        assert CLAVE not in f.read()
@@ -0,0 +1,197 @@
+"""Trazas de rendimiento con spans con nombre y niveles.
+
+Se activan con la variable de entorno ``TRACKER_TRACE`` (``info`` o ``debug``).
+Sin ella, ``span()`` devuelve un contexto vacío compartido y ``evento()`` sale
+en la primera comparación, así que dejar las llamadas en el código no cuesta
+casi nada. Activadas, cada span guarda su duración en un búfer circular que se
+puede exportar a JSON (``TRACKER_TRACE_FILE``, por defecto ``traza.json``).
+
+``TRACKER_STARTUP=1`` informa además los tiempos de arranque (importaciones,
+carga del kv y primer frame).
+"""
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from storage import escribir_json_atomico
+
+TRACE_FILE = "traza.json"
+
+DESACTIVADO = 0
+INFO = 1
+DEBUG = 2
+
+NIVELES = {"": DESACTIVADO, "0": DESACTIVADO, "off": DESACTIVADO,
+           "1": INFO, "info": INFO, "2": DEBUG, "debug": DEBUG}
+
+
+class _SpanVacio:
+    """Contexto que no hace nada (trazas desactivadas)"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def anotar(self, **datos):
+        pass
+
+
+_SPAN_VACIO = _SpanVacio()
+
+
+class _Span:
+    __slots__ = ("tracer", "nombre", "datos", "inicio")
+
+    def __init__(self, tracer, nombre, datos):
+        self.tracer = tracer
+        self.nombre = nombre
+        self.datos = datos
+        self.inicio = 0.0
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_exc, exc, tb):
+        duracion = time.perf_counter() - self.inicio
+        if tipo_exc is not None:
+            self.datos["error"] = repr(exc)
+        self.tracer._guardar(self.nombre, self.inicio, duracion, self.datos)
+        return False
+
+    def anotar(self, **datos):
+        """Agrega datos al span (cantidad de filas, tamaño, etc.)"""
+        self.datos.update(datos)
+
+
+class Tracer:
+    """Registra spans y eventos en un búfer circular de tamaño fijo"""
+
+    def __init__(self, nivel=DESACTIVADO, capacidad=2000):
+        self.nivel = nivel
+        self.registros = deque(maxlen=capacidad)
+        self._origen = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_entorno(cls):
+        nivel = NIVELES.get(os.environ.get("TRACKER_TRACE", "").strip().lower(), INFO)
+        return cls(nivel)
+
+    def activo(self, nivel=INFO):
+        return self.nivel >= nivel
+
+    def span(self, nombre, nivel=INFO, **datos):
+        """Mide el bloque ``with``; no hace nada si el nivel no está activo"""
+        if self.nivel < nivel:
+            return _SPAN_VACIO
+        return _Span(self, nombre, datos)
+
+    def medir(self, nombre=None, nivel=INFO):
+        """Decorador equivalente a envolver la función en ``span()``"""
+        def decorador(funcion):
+            etiqueta = nombre or funcion.__name__
+
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                if self.nivel < nivel:
+                    return funcion(*args, **kwargs)
+                with _Span(self, etiqueta, {}):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def evento(self, nombre, nivel=DEBUG, **datos):
+        """Registra un evento puntual (sin duración)"""
+        if self.nivel < nivel:
+            return
+        self._guardar(nombre, time.perf_counter(), None, datos)
+
+    def _guardar(self, nombre, inicio, duracion, datos):
+        registro = {
+            "nombre": nombre,
+            "t_ms": round((inicio - self._origen) * 1000, 3),
+            "hilo": threading.current_thread().name,
+        }
+        if duracion is not None:
+            registro["ms"] = round(duracion * 1000, 3)
+        if datos:
+            registro["datos"] = datos
+        with self._lock:
+            self.registros.append(registro)
+
+    # ---------------- exportar ----------------
+    def resumen(self):
+        """Cantidad, total, promedio y máximo (ms) de cada span"""
+        with self._lock:
+            registros = list(self.registros)
+        resumen = {}
+        for registro in registros:
+            if "ms" not in registro:
+                continue
+            r = resumen.setdefault(registro["nombre"], {"n": 0, "total_ms": 0.0, "max_ms": 0.0})
+            r["n"] += 1
+            r["total_ms"] += registro["ms"]
+            r["max_ms"] = max(r["max_ms"], registro["ms"])
+        for r in resumen.values():
+            r["total_ms"] = round(r["total_ms"], 3)
+            r["prom_ms"] = round(r["total_ms"] / r["n"], 3)
+        return resumen
+
+    def exportar(self, ruta=None):
+        """Escribe los registros y el resumen en un archivo JSON"""
+        if not self.activo():
+            return None
+        ruta = ruta or os.environ.get("TRACKER_TRACE_FILE", TRACE_FILE)
+        with self._lock:
+            registros = list(self.registros)
+        escribir_json_atomico(ruta, {"resumen": self.resumen(), "registros": registros})
+        return ruta
+
+    def limpiar(self):
+        with self._lock:
+            self.registros.clear()
+
+
+class Arranque:
+    """Marcas de tiempo del arranque, medidas desde `inicio` (perf_counter)"""
+
+    def __init__(self, inicio, activo=None):
+        if activo is None:
+            activo = os.environ.get("TRACKER_STARTUP", "").strip().lower() not in ("", "0", "off")
+        self.inicio = inicio
+        self.activo = activo
+        self.marcas = []
+
+    def marcar(self, nombre):
+        if self.activo:
+            self.marcas.append((nombre, time.perf_counter()))
+
+    def tiempos(self):
+        """[(nombre, ms de la etapa, ms acumulados)]"""
+        resultado = []
+        anterior = self.inicio
+        for nombre, instante in self.marcas:
+            resultado.append((nombre, round((instante - anterior) * 1000, 1),
+                              round((instante - self.inicio) * 1000, 1)))
+            anterior = instante
+        return resultado
+
+    def informar(self):
+        if not self.activo:
+            return
+        for nombre, etapa, acumulado in self.tiempos():
+            print(f"ARRANQUE {nombre}: {etapa} ms (total {acumulado} ms)")
+            tracer.evento("arranque_" + nombre, nivel=INFO, ms=etapa, total_ms=acumulado)
+
+
+# Instancia global usada por la app
+tracer = Tracer.desde_entorno()
+span = tracer.span
+evento = tracer.evento
+medir = tracer.medir